@@ -15,6 +15,85 @@ DEV_DEBUG = bool(os.getenv("DEV_DEBUG", False))
 
 MIRROR_ENABLED = bool(os.getenv("MIRROR_ENABLED", True))
 
+# Analyses running at once in a single web process, and how many more may wait for a free slot
+MIRROR_MAX_CONCURRENT_ANALYSES = int(os.getenv("MIRROR_MAX_CONCURRENT_ANALYSES", 2))
+MIRROR_MAX_PENDING_ANALYSES = int(os.getenv("MIRROR_MAX_PENDING_ANALYSES", 4))
+
+# "thread" runs analyses inside the web process, "db" hands them to `manage.py run_mirror_worker` via mirror_jobs
+MIRROR_JOB_BACKEND = os.getenv("MIRROR_JOB_BACKEND", "thread")
+MIRROR_MAX_QUEUED_JOBS = int(os.getenv("MIRROR_MAX_QUEUED_JOBS", 200))
+MIRROR_JOB_LEASE_SECONDS = int(os.getenv("MIRROR_JOB_LEASE_SECONDS", 120))
+MIRROR_JOB_MAX_ATTEMPTS = int(os.getenv("MIRROR_JOB_MAX_ATTEMPTS", 3))
+# Keys the encryption of queued chats, defaults to DJANGO_SECRET_KEY
+MIRROR_JOB_SECRET = os.getenv("MIRROR_JOB_SECRET") or None
+
+# Uploads are parsed as a stream, so this is not bound by DATA_UPLOAD_MAX_MEMORY_SIZE
+MIRROR_MAX_UPLOAD_BYTES = int(os.getenv("MIRROR_MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+
+# Resumable uploads: parts are kept in mirror_upload_parts until the session is finalized or expires
+MIRROR_UPLOAD_PART_BYTES = int(os.getenv("MIRROR_UPLOAD_PART_BYTES", 16 * 1024 * 1024))
+MIRROR_UPLOAD_SESSION_TTL = int(os.getenv("MIRROR_UPLOAD_SESSION_TTL", 24 * 60 * 60))
+# A session still finalizing after this many seconds lost its request with its process, a retry takes it over
+MIRROR_UPLOAD_FINALIZE_TIMEOUT = int(os.getenv("MIRROR_UPLOAD_FINALIZE_TIMEOUT", 10 * 60))
+
+# Chats holding more than this in memory keep their text in an encrypted temp file while the job runs
+MIRROR_SPILL_BYTES = int(os.getenv("MIRROR_SPILL_BYTES", 64 * 1024 * 1024))
+MIRROR_SPILL_DIR = os.getenv("MIRROR_SPILL_DIR") or None
+
+# LLM responses are cached per request, encrypted, in process memory and in the shared llm_cache table (0 disables a tier)
+MIRROR_LLM_CACHE_ENABLED = os.getenv("MIRROR_LLM_CACHE_ENABLED", "1") not in ("0", "false", "False", "")
+MIRROR_LLM_CACHE_TTL = int(os.getenv("MIRROR_LLM_CACHE_TTL", 7 * 24 * 60 * 60))
+MIRROR_LLM_CACHE_MEMORY_BYTES = int(os.getenv("MIRROR_LLM_CACHE_MEMORY_BYTES", 32 * 1024 * 1024))
+MIRROR_LLM_CACHE_DB_BYTES = int(os.getenv("MIRROR_LLM_CACHE_DB_BYTES", 512 * 1024 * 1024))
+# Keys cache ids and encryption keys, defaults to DJANGO_SECRET_KEY
+MIRROR_LLM_CACHE_SECRET = os.getenv("MIRROR_LLM_CACHE_SECRET") or None
+
+# Share of the model's context window a single prompt's chat text may fill
+PROMPT_CONTEXT_FRACTION = float(os.getenv("PROMPT_CONTEXT_FRACTION", 0.25))
+
+# Per-model request and token rate limits overriding llm.DEFAULT_LIMITS, JSON like '{"gpt-4.1": {"rpm": 5000}}'
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS") or "{}"
+
+# Per-stage deadlines and retries of LLM calls overriding resilience.DEFAULT_POLICIES, JSON like
+# '{"period": {"deadline": 900, "hedge": false}}'. The circuit breaker opens after LLM_BREAKER_THRESHOLD consecutive
+# upstream failures and lets a probe through after LLM_BREAKER_COOLDOWN seconds.
+LLM_STAGE_POLICIES = os.getenv("LLM_STAGE_POLICIES") or "{}"
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", 5))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", 30))
+
+# Timeline analyses: how many period analyses of one job may be in flight at once, the most sibling period analyses
+# one merge prompt combines (the timeline prompt takes at most as many), and the levels of merges after which the
+# timeline prompt gets whatever is left
+TIMELINE_PERIOD_CONCURRENCY = int(os.getenv("TIMELINE_PERIOD_CONCURRENCY", 4))
+TIMELINE_MERGE_FAN_IN = max(2, int(os.getenv("TIMELINE_MERGE_FAN_IN", 8)))
+TIMELINE_MAX_MERGE_DEPTH = int(os.getenv("TIMELINE_MAX_MERGE_DEPTH", 8))
+
+# A running job writes its stage and percent complete to the database at most this often, in seconds
+MIRROR_PROGRESS_INTERVAL = float(os.getenv("MIRROR_PROGRESS_INTERVAL", 1.0))
+
+# Threads that run the ORM calls of jobs' event loops (progress writes, LLM cache lookups), shared by all jobs
+MIRROR_DB_THREADS = int(os.getenv("MIRROR_DB_THREADS", 4))
+
+# Bearer token that opens /mirror/api/stats/ to monitoring, besides staff sessions. Unset, only staff see it.
+MIRROR_STATS_TOKEN = os.getenv("MIRROR_STATS_TOKEN") or None
+
+# Status event streams end after MIRROR_EVENTS_MAX_SECONDS, clients reconnect. Without Postgres LISTEN/NOTIFY
+# a stream rereads the analysis every MIRROR_EVENTS_POLL_SECONDS to see jobs run by other processes.
+MIRROR_EVENTS_MAX_SECONDS = int(os.getenv("MIRROR_EVENTS_MAX_SECONDS", 300))
+MIRROR_EVENTS_HEARTBEAT_SECONDS = int(os.getenv("MIRROR_EVENTS_HEARTBEAT_SECONDS", 15))
+MIRROR_EVENTS_POLL_SECONDS = int(os.getenv("MIRROR_EVENTS_POLL_SECONDS", 10))
+# Each open stream holds a request thread, past this many per process clients are told to poll instead
+MIRROR_EVENTS_MAX_STREAMS = int(os.getenv("MIRROR_EVENTS_MAX_STREAMS", 16))
+
+# Encrypted results are kept as raw bytes, in the analysis row ("db") or in the default file storage ("storage",
+# S3 when configured). S3 downloads go through presigned URLs valid for MIRROR_RESULT_URL_TTL seconds.
+MIRROR_RESULT_STORAGE = os.getenv("MIRROR_RESULT_STORAGE", "db")
+MIRROR_RESULT_URL_TTL = int(os.getenv("MIRROR_RESULT_URL_TTL", 10 * 60))
+# Results are compressed before encryption with this codec: "gzip", or "none" to write ver 1 bundles
+MIRROR_RESULT_CODEC = os.getenv("MIRROR_RESULT_CODEC", "gzip")
+# Plaintext bytes per encrypted frame of streamed (ver 3) results, the most a client holds before decrypting
+MIRROR_RESULT_FRAME_SIZE = int(os.getenv("MIRROR_RESULT_FRAME_SIZE", 64 * 1024))
+
 chat_id_var = contextvars.ContextVar("chat_id", default="-")
 
 
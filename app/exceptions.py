@@ -2,3 +2,15 @@ class UserMsgException(Exception):
     def __init__(self, msg: str):
         self.msg = msg
         super().__init__(msg)
+
+
+class QueueFullException(Exception):
+    def __init__(self, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(f"Queue is full, retry after {retry_after}s")
+
+
+class UploadError(UserMsgException):
+    def __init__(self, msg: str, status: int = 400):
+        self.status = status
+        super().__init__(msg)
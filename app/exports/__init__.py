@@ -0,0 +1,2 @@
+from .base import ParsedExport
+from .parser import parse_export
@@ -0,0 +1,83 @@
+import codecs
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List
+
+from app.exceptions import UploadError
+
+READ_SIZE = 64 * 1024
+
+# Receives every kept message as {'sender', 'text', 'date'}
+MessageCallback = Callable[[Dict[str, Any]], None]
+
+
+@dataclass
+class ParsedExport:
+    """What a pass over an export found, the messages themselves go to the callback"""
+
+    format: str = ''
+    chat_name: str = ''
+    messages: int = 0
+    senders: Dict[str, int] = field(default_factory=dict)
+    # Messages dropped, by reason: 'service', 'media' or 'empty'
+    skipped: Dict[str, int] = field(default_factory=dict)
+
+    def add(self, sender: str, text: str, date: str | None, on_message: MessageCallback | None):
+        self.messages += 1
+        self.senders[sender] = self.senders.get(sender, 0) + 1
+        if on_message is not None:
+            on_message({'sender': sender, 'text': text, 'date': date})
+
+    def skip(self, reason: str):
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def sender_list(self) -> List[Dict[str, Any]]:
+        """Senders with their message counts, most active first"""
+        ranked = sorted(self.senders.items(), key=lambda item: -item[1])
+        return [{'name': name, 'count': count} for name, count in ranked]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'format': self.format,
+            'chat_name': self.chat_name,
+            'messages': self.messages,
+            'senders': self.sender_list(),
+            'skipped': self.skipped,
+        }
+
+
+class PrefixedStream:
+    """Puts bytes already read for format detection back in front of a stream"""
+
+    def __init__(self, head: bytes, stream):
+        self.head = head
+        self.stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if self.head:
+            if size < 0:
+                data, self.head = self.head + self.stream.read(), b''
+                return data
+            data, self.head = self.head[:size], self.head[size:]
+            return data
+        return self.stream.read(size)
+
+
+def iter_lines(stream, limit: int) -> Iterator[str]:
+    """Decode a UTF-8 stream line by line, at most `limit` bytes of it"""
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    rest = ''
+    total = 0
+    while True:
+        chunk = stream.read(READ_SIZE)
+        total += len(chunk)
+        if total > limit:
+            raise UploadError('Upload is too large', status=413)
+        lines = (rest + decoder.decode(chunk, final=not chunk)).split('\n')
+        # The last piece may continue in the next chunk
+        rest = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+        if not chunk:
+            if rest:
+                yield rest.rstrip('\r')
+            return
@@ -0,0 +1,104 @@
+import codecs
+import json
+from typing import Any, Iterator
+
+from app.exceptions import UploadError
+
+READ_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+
+
+class JSONStreamReader:
+    """Pull JSON tokens and values from a binary stream while holding only a small window of it in memory"""
+
+    def __init__(self, stream, limit: int):
+        self.stream = stream
+        self.limit = limit
+        self.bytes_read = 0
+        self.eof = False
+        self.buf = ''
+        self.pos = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self._json = json.JSONDecoder()
+
+    def _fill(self, size: int = READ_SIZE) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(size)
+        if not chunk:
+            self.eof = True
+            self.buf = self.buf[self.pos :] + self._decoder.decode(b'', final=True)
+            self.pos = 0
+            return False
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self.limit:
+            raise UploadError('Upload is too large', status=413)
+        # Drop what was already consumed so the window doesn't grow with the upload
+        self.buf = self.buf[self.pos :] + self._decoder.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Next non-whitespace character, without consuming it, or '' at the end of input"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char: str):
+        found = self.peek()
+        if found != char:
+            raise UploadError(f"Invalid JSON data: expected '{char}', got '{found}'")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value"""
+        self.peek()
+        read_size = READ_SIZE
+        while True:
+            try:
+                value, end = self._json.raw_decode(self.buf, self.pos)
+                # A value touching the end of the window may be cut short, e.g. a number, so read on to be sure
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise UploadError('Invalid JSON data')
+            # Grow reads for values larger than the window so re-parsing them stays linear overall
+            self._fill(read_size)
+            read_size *= 2
+
+    def items(self) -> Iterator[str]:
+        """Iterate over the keys of an object, the caller must consume each value"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise UploadError('Invalid JSON data: object key is not a string')
+            self.expect(':')
+            yield key
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect('}')
+            return
+
+    def array(self) -> Iterator[Any]:
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ',':
+                self.pos += 1
+                continue
+            self.expect(']')
+            return
@@ -0,0 +1,67 @@
+import zipfile
+
+from app.exceptions import UploadError
+from . import telegram, whatsapp
+from .base import MessageCallback, ParsedExport, PrefixedStream
+
+ZIP_MAGIC = b'PK\x03\x04'
+BOM = b'\xef\xbb\xbf'
+
+
+def parse_export(stream, limit: int, on_message: MessageCallback | None = None) -> ParsedExport:
+    """Parse a raw Telegram result.json, WhatsApp .txt, or a .zip holding either, in one streaming pass.
+
+    Kept messages go to `on_message` as they are read; the returned ParsedExport has per-sender
+    counts and what was skipped. `limit` caps the decompressed bytes read.
+    """
+    result = ParsedExport()
+    head = stream.read(len(ZIP_MAGIC))
+
+    if head == ZIP_MAGIC:
+        if not (hasattr(stream, 'seekable') and stream.seekable()):
+            raise UploadError('Zip exports must be uploaded without transfer compression')
+        stream.seek(0)
+        try:
+            with zipfile.ZipFile(stream) as archive:
+                member = pick_member(archive)
+                # ZipFile.open decompresses on the fly, the member is never extracted
+                with archive.open(member) as f:
+                    parse_plain(f, limit, result, on_message)
+        except (zipfile.BadZipFile, NotImplementedError, RuntimeError) as e:
+            # RuntimeError is what ZipFile raises for password-protected archives
+            raise UploadError(f'Could not read the .zip: {e}')
+    else:
+        parse_plain(PrefixedStream(head, stream), limit, result, on_message)
+
+    if not result.messages and not result.skipped:
+        raise UploadError('No messages found, is this a Telegram or WhatsApp chat export?')
+    return result
+
+
+def parse_plain(stream, limit: int, result: ParsedExport, on_message: MessageCallback | None):
+    """Telegram JSON if the text starts with an object, a WhatsApp text export otherwise"""
+    head = stream.read(64)
+    first = head.removeprefix(BOM).lstrip()[:1]
+    stream = PrefixedStream(head, stream)
+    if first == b'{':
+        telegram.parse(stream, limit, result, on_message)
+    elif first == b'<':
+        raise UploadError('HTML exports are not supported, please export the chat as JSON')
+    else:
+        whatsapp.parse(stream, limit, result, on_message)
+
+
+def pick_member(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """Telegram's result.json or WhatsApp's chat .txt, ignoring the attached media"""
+    files = [info for info in archive.infolist() if not info.is_dir()]
+    ranked = sorted(
+        (info for info in files if info.filename.lower().endswith(('.json', '.txt'))),
+        key=lambda info: (
+            not info.filename.lower().endswith('result.json'),
+            'chat' not in info.filename.lower(),
+            -info.file_size,
+        ),
+    )
+    if not ranked:
+        raise UploadError('No .json or .txt chat found inside the .zip')
+    return ranked[0]
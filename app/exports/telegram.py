@@ -0,0 +1,60 @@
+from typing import Any
+
+from app.exceptions import UploadError
+from .base import MessageCallback, ParsedExport
+from .jsonstream import JSONStreamReader
+
+# Attachment fields of a Telegram export message, a message with one of these and no text is media-only
+MEDIA_FIELDS = (
+    'media_type',
+    'photo',
+    'file',
+    'sticker_emoji',
+    'poll',
+    'location_information',
+    'contact_information',
+    'game_title',
+    'invoice_information',
+)
+
+
+def flatten_text(text: Any) -> str:
+    """Telegram stores formatted text as a list of plain strings and {'type', 'text'} entities"""
+    if isinstance(text, list):
+        return ''.join(part if isinstance(part, str) else str(part.get('text', '')) for part in text)
+    return str(text or '')
+
+
+def parse(stream, limit: int, result: ParsedExport, on_message: MessageCallback | None):
+    """Stream a single-chat result.json, one message at a time"""
+    result.format = 'telegram'
+    reader = JSONStreamReader(stream, limit)
+    for key in reader.items():
+        if key == 'messages':
+            for msg in reader.array():
+                add_message(msg, result, on_message)
+        elif key == 'name':
+            name = reader.value()
+            result.chat_name = name if isinstance(name, str) else ''
+        elif key == 'chats':
+            raise UploadError('This is a full account export, please export a single chat')
+        else:
+            reader.value()
+
+
+def add_message(msg: Any, result: ParsedExport, on_message: MessageCallback | None):
+    if not isinstance(msg, dict) or msg.get('type', 'message') != 'message':
+        result.skip('service')
+        return
+
+    text = flatten_text(msg.get('text')).strip()
+    if not text:
+        result.skip('media' if any(msg.get(f) for f in MEDIA_FIELDS) else 'empty')
+        return
+
+    sender = msg.get('from')
+    if not sender:
+        # Deleted accounts have no name, there is nobody to attribute the message to
+        result.skip('empty')
+        return
+    result.add(str(sender), text, msg.get('date'), on_message)
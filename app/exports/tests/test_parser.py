@@ -0,0 +1,87 @@
+import io
+import json
+import zipfile
+
+from django.test import SimpleTestCase
+
+from app.exceptions import UploadError
+from app.exports.parser import parse_export
+
+LIMIT = 1024 * 1024
+
+
+def parse(data: bytes):
+    messages = []
+    result = parse_export(io.BytesIO(data), LIMIT, messages.append)
+    return result, messages
+
+
+class WhatsAppParserTests(SimpleTestCase):
+    def dates(self, text: str):
+        return [m['date'] for m in parse(text.encode())[1]]
+
+    def test_day_first_export_keeps_order_for_low_days(self):
+        # "05/03" comes before the line that proves the export is day-first
+        text = '05/03/2020, 10:00 - Anna: first\n13/03/2020, 11:00 - Anna: second\n01/04/2020, 12:00 - Bob: third\n'
+        self.assertEqual(self.dates(text), ['2020-03-05T10:00:00', '2020-03-13T11:00:00', '2020-04-01T12:00:00'])
+
+    def test_month_first_export(self):
+        text = '3/5/20, 9:41 AM - Anna: first\n3/14/20, 9:41 PM - Anna: second\n'
+        self.assertEqual(self.dates(text), ['2020-03-05T09:41:00', '2020-03-14T21:41:00'])
+
+    def test_us_ios_bracket_export(self):
+        text = '[3/5/20, 9:41:07 AM] Anna: first\n[3/6/20, 1:02:03 PM] Bob: second\n'
+        self.assertEqual(self.dates(text), ['2020-03-05T09:41:07', '2020-03-06T13:02:03'])
+
+    def test_ambiguous_bracket_export_is_day_first(self):
+        text = '[05.03.2020, 10:00:00] Anna: first\n[06.03.2020, 10:00:00] Bob: second\n'
+        self.assertEqual(self.dates(text), ['2020-03-05T10:00:00', '2020-03-06T10:00:00'])
+
+    def test_continuation_lines_and_skips(self):
+        text = (
+            '12/31/20, 23:59 - Messages and calls are end-to-end encrypted.\n'
+            '12/31/20, 23:59 - Anna: line one\nline two\n'
+            '12/31/20, 23:59 - Bob: <Media omitted>\n'
+        )
+        result, messages = parse(text.encode())
+        self.assertEqual(messages, [{'sender': 'Anna', 'text': 'line one\nline two', 'date': '2020-12-31T23:59:00'}])
+        self.assertEqual(result.skipped, {'service': 1, 'media': 1})
+        self.assertEqual(result.format, 'whatsapp')
+
+    def test_zipped_export(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as z:
+            z.writestr('WhatsApp Chat.txt', '[31/12/2020, 23:59:59] Anna: hi\n')
+            z.writestr('IMG-0001.jpg', b'\xff\xd8')
+        self.assertEqual(parse(archive.getvalue())[1][0]['text'], 'hi')
+
+
+class TelegramParserTests(SimpleTestCase):
+    def test_messages_and_skips(self):
+        export = {
+            'name': 'Chat',
+            'type': 'personal_chat',
+            'messages': [
+                {'type': 'service', 'action': 'phone_call'},
+                {
+                    'type': 'message',
+                    'from': 'Anna',
+                    'date': '2020-03-05T10:00:00',
+                    'text': ['Hi ', {'type': 'bold', 'text': 'there'}],
+                },
+                {'type': 'message', 'from': 'Bob', 'date': '2020-03-05T10:01:00', 'text': '', 'photo': 'a.jpg'},
+                {'type': 'message', 'from': None, 'date': '2020-03-05T10:02:00', 'text': 'ghost'},
+            ],
+        }
+        result, messages = parse(json.dumps(export).encode())
+        self.assertEqual(messages, [{'sender': 'Anna', 'text': 'Hi there', 'date': '2020-03-05T10:00:00'}])
+        self.assertEqual(result.chat_name, 'Chat')
+        self.assertEqual(result.skipped, {'service': 1, 'media': 1, 'empty': 1})
+
+    def test_full_account_export_is_rejected(self):
+        with self.assertRaises(UploadError):
+            parse(json.dumps({'chats': {'list': []}}).encode())
+
+    def test_limit(self):
+        with self.assertRaises(UploadError):
+            parse_export(io.BytesIO(json.dumps({'messages': [{'text': 'x' * 2000}]}).encode()), 1000)
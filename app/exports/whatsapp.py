@@ -0,0 +1,110 @@
+import re
+
+from .base import MessageCallback, ParsedExport, iter_lines
+
+_DATE = r'(\d{1,2})[/.](\d{1,2})[/.](\d{2,4}),? (\d{1,2}):(\d{2})(?::(\d{2}))?(?:\s?([AaPp])\.?[Mm]\.?)?'
+
+# iOS: "[31/12/2020, 23:59:59] Name: text"
+BRACKET_HEADER = re.compile(r'^\u200e?\[' + _DATE + r'\] (.*)$')
+# Android: "12/31/20, 23:59 - Name: text" or "31.12.20, 23:59 - Name: text"
+DASH_HEADER = re.compile(r'^\u200e?' + _DATE + r' [-–] (.*)$')
+
+# Placeholders left where an attachment was, per client language
+MEDIA_PLACEHOLDERS = {'<Media omitted>', '<Медиа отсутствуют>', '<Без медиафайлов>', 'null'}
+
+# Left-to-right mark iOS puts in front of attachment notes and system notices
+LRM = '\u200e'
+
+
+def _iso_date(groups: tuple, month_first: bool) -> str:
+    a, b, year, hour, minute, second, meridiem = groups
+    day, month = (int(b), int(a)) if month_first else (int(a), int(b))
+    year = int(year)
+    if year < 100:
+        year += 2000 if year < 50 else 1900
+    hour = int(hour)
+    if meridiem:
+        hour = hour % 12 + (12 if meridiem in 'Pp' else 0)
+    return f'{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{int(minute):02d}:{int(second or 0):02d}'
+
+
+def _month_first(groups: tuple) -> bool | None:
+    """True or False once a field over 12 tells which one is the day, None while either order fits"""
+    if int(groups[0]) > 12:
+        return False
+    if int(groups[1]) > 12:
+        return True
+    return None
+
+
+def _us_style(match: re.Match) -> bool:
+    """Slashed dates of Android exports and of 12-hour iOS ones ("[3/5/20, 9:41:07 AM]") are US month-first"""
+    slashed = '/' in match.string[: match.end(3)]
+    return slashed and (match.re is DASH_HEADER or match.group(7) is not None)
+
+
+def parse(stream, limit: int, result: ParsedExport, on_message: MessageCallback | None):
+    """Stream a WhatsApp .txt export, folding continuation lines into the message they belong to.
+
+    Day/month order is the export's locale, so it is decided once for the whole file: messages are held back
+    until a date with a field over 12 settles it, or until the end, where the first header's style decides.
+    """
+    result.format = 'whatsapp'
+    current = None  # [sender, date fields, lines]
+    month_first = None
+    default_month_first = None
+    held = []  # (sender, date fields, text) read before month_first was known
+
+    def emit(sender, groups, text):
+        add_message(sender, text, _iso_date(groups, month_first), result, on_message)
+
+    def flush():
+        if current is None:
+            return
+        message = (current[0], current[1], '\n'.join(current[2]).strip())
+        if month_first is None:
+            held.append(message)
+        else:
+            emit(*message)
+
+    for line in iter_lines(stream, limit):
+        match = BRACKET_HEADER.match(line) or DASH_HEADER.match(line)
+        if match is None:
+            if current is not None:
+                current[2].append(line)
+            continue
+
+        flush()
+        groups = match.groups()[:7]
+        if default_month_first is None:
+            default_month_first = _us_style(match)
+        if month_first is None and (month_first := _month_first(groups)) is not None:
+            for message in held:
+                emit(*message)
+            held.clear()
+
+        sender, sep, text = match.group(8).partition(': ')
+        if not sep:
+            # No author, e.g. "Messages and calls are end-to-end encrypted" or "X added Y"
+            result.skip('service')
+            current = None
+            continue
+        current = [sender.strip(' ~\u202f\u00a0'), groups, [text]]
+    flush()
+
+    if held:
+        month_first = default_month_first
+        for message in held:
+            emit(*message)
+
+
+def add_message(sender: str, text: str, date: str, result: ParsedExport, on_message: MessageCallback | None):
+    if not text:
+        result.skip('empty')
+    elif text in MEDIA_PLACEHOLDERS or text.startswith(LRM) and ('<attached:' in text or text.endswith('omitted')):
+        result.skip('media')
+    elif text.startswith(LRM):
+        # iOS marks system notices posted under the chat's name this way
+        result.skip('service')
+    else:
+        result.add(sender, text, date, on_message)
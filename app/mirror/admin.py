@@ -1,9 +1,10 @@
 from django.contrib import admin
+from django.db.models import F
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
 import json
-from .models import MirrorAnalysis
+from .models import LLMCacheEntry, MirrorAnalysis, MirrorJob, UploadSession
 
 
 @admin.register(MirrorAnalysis)
@@ -14,10 +15,21 @@ class MirrorAnalysisAdmin(admin.ModelAdmin):
 
     search_fields = ['id', 'error_message']
 
-    readonly_fields = ['id', 'created_at', 'updated_at', 'completed_at']
+    readonly_fields = [
+        'id',
+        'created_at',
+        'updated_at',
+        'completed_at',
+        'stage',
+        'progress',
+        'sections_done',
+        'sections_total',
+        'version',
+    ]
 
     fieldsets = (
         ('Basic Info', {'fields': ('id', 'status')}),
+        ('Progress', {'fields': ('stage', 'progress', 'sections_done', 'sections_total', 'version')}),
         ('Timestamps', {'fields': ('created_at', 'updated_at', 'completed_at')}),
         ('Error Info', {'fields': ('error_message',), 'classes': ('collapse',)}),
     )
@@ -77,8 +89,56 @@ class MirrorAnalysisAdmin(admin.ModelAdmin):
     def mark_as_error(self, request, queryset):
         """Mark selected analyses as error"""
         updated = queryset.filter(status='processing').update(
-            status='error', error_message='Manually marked as error by admin'
+            status='error', error_message='Manually marked as error by admin', version=F('version') + 1
         )
         self.message_user(request, f'{updated} analyses marked as error.')
 
     mark_as_error.short_description = "Mark selected as error"
+
+    def save_model(self, request, obj, form, change):
+        # Clients hold on to responses of the insights API until the version changes
+        if change:
+            obj.version = F('version') + 1
+        super().save_model(request, obj, form, change)
+
+
+@admin.register(MirrorJob)
+class MirrorJobAdmin(admin.ModelAdmin):
+    list_display = ['analysis_id', 'status', 'attempts', 'lease_owner', 'lease_expires_at', 'created_at']
+
+    list_filter = ['status', 'created_at']
+
+    # The payload is the user's raw chat, never show it
+    exclude = ['payload']
+
+    readonly_fields = ['analysis', 'attempts', 'lease_owner', 'lease_expires_at', 'created_at', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'encoding', 'offset', 'total_bytes', 'parts', 'created_at', 'expires_at']
+
+    list_filter = ['status', 'encoding', 'created_at']
+
+    readonly_fields = ['analysis', 'offset', 'parts', 'total_bytes', 'created_at', 'updated_at']
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(LLMCacheEntry)
+class LLMCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ['id', 'model', 'size', 'created_at', 'last_used_at', 'expires_at']
+
+    list_filter = ['model']
+
+    # Sealed, and unreadable here anyway
+    exclude = ['blob']
+
+    readonly_fields = ['id', 'model', 'size', 'created_at', 'last_used_at', 'expires_at']
+
+    def has_add_permission(self, request):
+        return False
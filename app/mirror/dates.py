@@ -0,0 +1,175 @@
+import logging
+from array import array
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Iterable, List
+
+log = logging.getLogger(__name__)
+
+# Marks a timestamp that is missing or could not be parsed, sorts after every real one
+INVALID = 2**63 - 1
+
+# Formats seen in Telegram, WhatsApp and hand-made exports that datetime.fromisoformat doesn't accept
+FALLBACK_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',
+    '%d.%m.%Y %H:%M:%S',
+    '%d.%m.%Y, %H:%M:%S',
+    '%d.%m.%Y %H:%M',
+    '%d/%m/%Y, %H:%M:%S',
+    '%d/%m/%Y, %H:%M',
+    '%m/%d/%y, %H:%M',
+]
+
+DETECTION_SAMPLE_SIZE = 200
+
+
+def to_epoch(dt: datetime) -> int:
+    # Naive timestamps are taken as UTC, exports don't carry a zone and only relative order matters
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
+
+
+def _parse_iso(value) -> int:
+    return to_epoch(datetime.fromisoformat(value))
+
+
+def _parse_unix(value) -> int:
+    seconds = int(value)
+    # Millisecond timestamps, as produced by JavaScript's Date.now()
+    return seconds // 1000 if seconds > 10**11 else seconds
+
+
+def _strptime_parser(fmt: str) -> Callable[[str], int]:
+    def parse(value) -> int:
+        return to_epoch(datetime.strptime(value, fmt))
+
+    parse.__name__ = f'strptime({fmt})'
+    return parse
+
+
+PARSERS: List[Callable[[str], int]] = [_parse_iso, _parse_unix] + [_strptime_parser(f) for f in FALLBACK_FORMATS]
+
+
+@dataclass
+class ParsedDates:
+    epochs: array  # array('q') of epoch seconds, INVALID where missing or unparseable
+    parser: str
+    missing: int
+    failed: int
+
+
+def detect_parser(values: Iterable) -> Callable[[str], int]:
+    """Pick the parser that handles most of a sample of the values, ISO first"""
+    sample = []
+    for value in values:
+        if value:
+            sample.append(value)
+            if len(sample) >= DETECTION_SAMPLE_SIZE:
+                break
+    if not sample:
+        return _parse_iso
+
+    best, best_ok = _parse_iso, -1
+    for parser in PARSERS:
+        ok = 0
+        for value in sample:
+            try:
+                parser(value)
+                ok += 1
+            except (ValueError, TypeError, OverflowError):
+                pass
+        if ok == len(sample):
+            return parser
+        if ok > best_ok:
+            best, best_ok = parser, ok
+    return best
+
+
+class ColumnParser:
+    """Parse a column of timestamps into epoch seconds as values arrive one at a time.
+
+    The format is detected once from the first sample of values, then every value goes through that
+    parser only. Values it rejects get a second chance against all known formats before being counted as failed.
+    """
+
+    def __init__(self):
+        self.epochs = array('q')
+        self.missing = 0
+        self._parser: Callable[[str], int] | None = None
+        self._pending: List = []
+        self._pending_present = 0
+
+    def append(self, value):
+        if self._parser is None:
+            self._pending.append(value)
+            if value:
+                self._pending_present += 1
+                if self._pending_present >= DETECTION_SAMPLE_SIZE:
+                    self._detect()
+            return
+        self.epochs.append(self._parse(value))
+
+    def extend(self, values: Iterable):
+        for value in values:
+            self.append(value)
+
+    def _detect(self):
+        self._parser = detect_parser(self._pending)
+        pending, self._pending = self._pending, []
+        self.epochs.extend(map(self._parse, pending))
+
+    def _parse(self, value) -> int:
+        if not value:
+            self.missing += 1
+            return INVALID
+        try:
+            return self._parser(value)
+        except (ValueError, TypeError, OverflowError):
+            return _parse_any(value)
+
+    def finish(self) -> ParsedDates:
+        if self._parser is None:
+            self._detect()
+        failed = self.epochs.count(INVALID) - self.missing
+        if failed:
+            log.warning(
+                f"{failed} of {len(self.epochs)} timestamps could not be parsed (detected {self._parser.__name__})"
+            )
+        return ParsedDates(epochs=self.epochs, parser=self._parser.__name__, missing=self.missing, failed=failed)
+
+
+def parse_column(values: Iterable) -> ParsedDates:
+    """Parse a whole column of timestamps into epoch seconds in one pass"""
+    parser = ColumnParser()
+    parser.extend(values)
+    return parser.finish()
+
+
+def _parse_any(value) -> int:
+    for parser in PARSERS:
+        try:
+            return parser(value)
+        except (ValueError, TypeError, OverflowError):
+            continue
+    return INVALID
+
+
+_last_parser = [_parse_iso]
+
+
+def parse_datetime(value) -> datetime:
+    """Parse a single timestamp, trying the format that worked last time first. Raises ValueError."""
+    for parser in [_last_parser[0]] + PARSERS:
+        try:
+            epoch = parser(value)
+        except (ValueError, TypeError, OverflowError):
+            continue
+        _last_parser[0] = parser
+        return from_epoch(epoch)
+    raise ValueError(f"Unknown date format: {value!r}")
+
+
+def from_epoch(seconds: int) -> datetime:
+    """Naive UTC datetime, matching what the exports' naive timestamps parse to"""
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,33 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import typing
+
+from django.db import close_old_connections
+
+from app import constants
+
+T = typing.TypeVar('T')
+
+# One pool for the ORM calls of every job's event loop, so a process holds at most this many connections
+# for them instead of one per default executor thread of each loop
+_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=constants.MIRROR_DB_THREADS, thread_name_prefix='mirror-db'
+)
+
+
+def _call(fn: typing.Callable[..., T], args: tuple, kwargs: dict) -> T:
+    # These threads live as long as the process, drop connections that broke or aged out on both sides of a call
+    close_old_connections()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run(fn: typing.Callable[..., T], *args: typing.Any, **kwargs: typing.Any) -> T:
+    """Like asyncio.to_thread for functions that use the ORM"""
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, _call, fn, args, kwargs)
+    return await asyncio.get_running_loop().run_in_executor(_executor, call)
@@ -8,41 +8,143 @@ from cryptography.fernet import Fernet
 
 # pip install pynacl
 import os, base64
-from typing import Optional, Dict
+import struct
+import zlib
+from typing import Optional, Dict, Iterable, Iterator
 from nacl.bindings import (
     crypto_box_seal,
     crypto_aead_xchacha20poly1305_ietf_encrypt,
+    crypto_secretstream_xchacha20poly1305_TAG_FINAL,
+    crypto_secretstream_xchacha20poly1305_TAG_MESSAGE,
+    crypto_secretstream_xchacha20poly1305_init_push,
+    crypto_secretstream_xchacha20poly1305_push,
+    crypto_secretstream_xchacha20poly1305_state,
 )
 
+from app import constants
+
 
 def _b64e(b: bytes) -> str:
     return base64.b64encode(b).decode("ascii")
 
 
-def encrypt_for_user(data: bytes, user_pk_b64: str, aad: Optional[bytes] = None) -> Dict[str, str]:
-    """
-    Envelope-шифрование:
-      - генерируем DEK (32 байта) и nonce (24 байта)
-      - data -> AEAD XChaCha20-Poly1305 (DEK, nonce, AAD)
-      - DEK -> sealed box на публичный ключ пользователя (X25519)
-    Возвращает base64-поля: ek (запечатанный DEK), nonce, ct, (aad — если задана).
-    """
+# Plaintext compressors of ver 2 and 3 bundles, all of them must be decodable by the browser's DecompressionStream.
+# wbits=31 writes the gzip container.
+CODECS = {"gzip": lambda: zlib.compressobj(6, zlib.DEFLATED, 31)}
+
+
+def _codec(codec: Optional[str]) -> str:
+    return constants.MIRROR_RESULT_CODEC if codec is None else codec
+
+
+def _seal(data: bytes, user_pk_b64: str, aad: bytes, codec: Optional[str]) -> tuple[Dict[str, str], bytes]:
+    """Bundle fields without the ciphertext, and the raw ciphertext"""
+    codec = _codec(codec)
+    if codec != "none":
+        # Ciphertext doesn't compress, it has to happen before encryption
+        compressor = CODECS[codec]()
+        data = compressor.compress(data) + compressor.flush()
     user_pk = base64.b64decode(user_pk_b64)
     dek = os.urandom(32)
     nonce = os.urandom(24)
-    if aad is None:
-        aad = b""
 
     ct = crypto_aead_xchacha20poly1305_ietf_encrypt(data, aad, nonce, dek)
     ek = crypto_box_seal(dek, user_pk)
 
-    bundle = {
+    header = {
         "alg": "sealedbox(X25519)+XChaCha20-Poly1305",
         "ek": _b64e(ek),
         "nonce": _b64e(nonce),
-        "ct": _b64e(ct),
         "ver": "1",
     }
+    if codec != "none":
+        header.update(ver="2", codec=codec)
+    if aad:
+        header["aad"] = _b64e(aad)
+    return header, ct
+
+
+def encrypt_for_user(
+    data: bytes, user_pk_b64: str, aad: Optional[bytes] = None, codec: Optional[str] = None
+) -> Dict[str, str]:
+    """
+    Envelope-шифрование:
+      - генерируем DEK (32 байта) и nonce (24 байта)
+      - data -> AEAD XChaCha20-Poly1305 (DEK, nonce, AAD)
+      - DEK -> sealed box на публичный ключ пользователя (X25519)
+    Возвращает base64-поля: ek (запечатанный DEK), nonce, ct, (aad — если задана).
+    ver "2": data перед шифрованием сжата кодеком codec (по умолчанию MIRROR_RESULT_CODEC),
+    codec="none" даёт прежний ver "1" без сжатия.
+    """
+    header, ct = _seal(data, user_pk_b64, aad or b"", codec)
+    return {**header, "ct": _b64e(ct)}
+
+
+# Binary form of a bundle: magic, 4-byte big-endian header length, JSON header, raw ciphertext
+BLOB_MAGIC = b"MRB1"
+
+
+def encrypt_blob_for_user(
+    data: bytes, user_pk_b64: str, aad: Optional[bytes] = None, codec: Optional[str] = None
+) -> bytes:
+    """
+    То же, что encrypt_for_user, но одним бинарным блобом: поля bundle без ct в JSON-заголовке,
+    а ciphertext — сырыми байтами, без base64 (+33%) и без JSON-сериализации на каждом чтении.
+    """
+    header, ct = _seal(data, user_pk_b64, aad or b"", codec)
+    head = json.dumps(header, separators=(",", ":")).encode("ascii")
+    return BLOB_MAGIC + struct.pack(">I", len(head)) + head + ct
+
+
+def encrypt_stream_for_user(
+    chunks: Iterable[bytes],
+    user_pk_b64: str,
+    aad: Optional[bytes] = None,
+    codec: Optional[str] = None,
+    frame_size: Optional[int] = None,
+) -> Iterator[bytes]:
+    """
+    Блоб ver "3" по частям, по мере того как приходят chunks: тот же заголовок MRB1, но вместо одного
+    AEAD — secretstream (XChaCha20-Poly1305) под тем же запечатанным DEK. Сжатый поток режется на кадры
+    по frame_size байт (последний, с TAG_FINAL, — от 0 до frame_size), каждый кадр шифруется отдельно,
+    так что ни сервер, ни клиент не держат весь ciphertext и клиент расшифровывает по мере загрузки.
+    """
+    codec = _codec(codec)
+    frame_size = frame_size or constants.MIRROR_RESULT_FRAME_SIZE
+    dek = os.urandom(32)
+    state = crypto_secretstream_xchacha20poly1305_state()
+    stream_header = crypto_secretstream_xchacha20poly1305_init_push(state, dek)
+
+    header = {
+        "alg": "sealedbox(X25519)+secretstream(XChaCha20-Poly1305)",
+        "ek": _b64e(crypto_box_seal(dek, base64.b64decode(user_pk_b64))),
+        "header": _b64e(stream_header),
+        "frame": frame_size,
+        "ver": "3",
+    }
+    if codec != "none":
+        header["codec"] = codec
     if aad:
-        bundle["aad"] = _b64e(aad)
-    return bundle
+        header["aad"] = _b64e(aad)
+    head = json.dumps(header, separators=(",", ":")).encode("ascii")
+    yield BLOB_MAGIC + struct.pack(">I", len(head)) + head
+
+    compressor = CODECS[codec]() if codec != "none" else None
+    pending = bytearray()
+
+    def frames(data: bytes, final: bool) -> Iterator[bytes]:
+        pending.extend(data)
+        # A full frame is only sent once more data follows it, the last frame is the one tagged final
+        while len(pending) > frame_size:
+            yield crypto_secretstream_xchacha20poly1305_push(
+                state, bytes(pending[:frame_size]), aad, crypto_secretstream_xchacha20poly1305_TAG_MESSAGE
+            )
+            del pending[:frame_size]
+        if final:
+            yield crypto_secretstream_xchacha20poly1305_push(
+                state, bytes(pending), aad, crypto_secretstream_xchacha20poly1305_TAG_FINAL
+            )
+
+    for chunk in chunks:
+        yield from frames(compressor.compress(chunk) if compressor else chunk, False)
+    yield from frames(compressor.flush() if compressor else b"", True)
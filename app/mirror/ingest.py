@@ -0,0 +1,131 @@
+import base64
+import binascii
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict
+
+from app.constants import Lang
+from app.exceptions import UploadError
+from app.exports import parse_export
+from app.exports.jsonstream import JSONStreamReader
+from app.exports.telegram import flatten_text
+from .messages import MessageStore, MessageStoreBuilder
+
+log = logging.getLogger(__name__)
+
+# Upload fields read before `chat`, anything else is skipped
+METADATA_FIELDS = ('person_name', 'keypair', 'language', 'interview')
+
+
+@dataclass
+class Upload:
+    person_name: str = 'Anonymous'
+    keypair: Dict[str, Any] | None = None
+    language: str = Lang.RU.value
+    messages: MessageStore = field(default_factory=lambda: MessageStore.from_dicts([]))
+
+
+def validate_metadata(metadata: Dict[str, Any], complete: bool) -> Upload:
+    """Check the fields seen so far, `complete` once the whole object has been read"""
+    upload = Upload()
+
+    person_name = metadata.get('person_name', upload.person_name)
+    if not isinstance(person_name, str) or len(person_name) > 255:
+        raise UploadError('person_name must be a string of at most 255 characters')
+    upload.person_name = person_name or upload.person_name
+
+    language = metadata.get('language', upload.language)
+    if language not in Lang.values:
+        raise UploadError(f"language must be one of {', '.join(Lang.values)}")
+    upload.language = language
+
+    keypair = metadata.get('keypair')
+    if keypair is not None:
+        if not isinstance(keypair, dict) or not isinstance(keypair.get('pk'), str):
+            raise UploadError('Keypair is invalid')
+        try:
+            pk = base64.b64decode(keypair['pk'], validate=True)
+        except (binascii.Error, ValueError):
+            raise UploadError('Keypair is invalid')
+        if len(pk) != 32:
+            raise UploadError('Keypair is invalid')
+    elif complete:
+        log.error('no keypair provided')
+        raise UploadError('Keypair is required')
+    upload.keypair = keypair
+    return upload
+
+
+def normalize_message(msg: Any) -> Dict[str, Any] | None:
+    """Keep only the fields the processor reads, flattening Telegram's rich-text entity lists"""
+    if not isinstance(msg, dict):
+        return None
+    text = flatten_text(msg.get('text', ''))
+    return {'sender': msg.get('sender') or msg.get('from') or 'User', 'text': text, 'date': msg.get('date')}
+
+
+def read_upload(
+    stream,
+    limit: int,
+    on_message: Callable[[Dict[str, Any]], None] | None = None,
+) -> Upload:
+    """Read a process request body as a stream.
+
+    Metadata fields are validated as soon as the `chat` array starts, so a client that sends them
+    first is rejected before any messages are decoded. Messages are decoded one at a time and
+    go to `on_message`, or are collected into the `Upload.messages` store.
+    """
+    reader = JSONStreamReader(stream, limit)
+    metadata: Dict[str, Any] = {}
+    builder = MessageStoreBuilder()
+    add = on_message or builder.add
+    seen_chat = False
+
+    for key in reader.items():
+        if key == 'chat' and not seen_chat:
+            seen_chat = True
+            validate_metadata(metadata, complete=False)
+            for msg in reader.array():
+                normalized = normalize_message(msg)
+                if normalized is not None:
+                    add(normalized)
+        elif key in METADATA_FIELDS:
+            metadata[key] = reader.value()
+        else:
+            reader.value()
+
+    if reader.peek():
+        raise UploadError('Invalid JSON data: trailing characters')
+
+    upload = validate_metadata(metadata, complete=True)
+    upload.messages = builder.build()
+    return upload
+
+
+def validate_export_request(metadata: Any) -> Upload:
+    """Metadata and sender selection sent to finalize a raw export upload"""
+    if not isinstance(metadata, dict):
+        raise UploadError('Invalid JSON data')
+    senders = metadata.get('senders')
+    if not isinstance(senders, list) or not senders or not all(isinstance(s, str) for s in senders):
+        raise UploadError('senders must be a non-empty list of names')
+    if not metadata.get('person_name'):
+        metadata = {**metadata, 'person_name': ', '.join(senders)[:255]}
+    return validate_metadata(metadata, complete=True)
+
+
+def read_export(stream, limit: int, metadata: Dict[str, Any]) -> Upload:
+    """Parse a raw chat export into an Upload, keeping only the messages of the selected senders"""
+    upload = validate_export_request(metadata)
+    selected = set(metadata['senders'])
+    builder = MessageStoreBuilder()
+
+    def keep(msg):
+        if msg['sender'] in selected:
+            builder.add(msg)
+
+    parse_export(stream, limit, on_message=keep)
+    if not len(builder):
+        raise UploadError('None of the selected senders have messages in this export')
+    upload.messages = builder.build()
+    return upload
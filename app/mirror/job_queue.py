@@ -0,0 +1,215 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from app import constants
+from .jobs import AnalysisExecutor, prepare_messages, run_async_processing
+from .models import MirrorAnalysis, MirrorJob
+from .resilience import resilient
+
+log = logging.getLogger(__name__)
+
+
+def get_worker_id() -> str:
+    return f"{os.getenv('DYNO') or socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue(analysis: MirrorAnalysis, chat_data) -> MirrorJob:
+    return MirrorJob.objects.create(analysis=analysis, payload=MirrorJob.encode_payload(chat_data, analysis.id))
+
+
+def queued_count() -> int:
+    return MirrorJob.objects.filter(status='queued').count()
+
+
+def queue_stats() -> dict:
+    counts = dict(
+        MirrorJob.objects.filter(status__in=['queued', 'running']).values_list('status').annotate(n=Count('id'))
+    )
+    stale = MirrorJob.objects.filter(status='running', lease_expires_at__lt=timezone.now()).count()
+    return {'queued': counts.get('queued', 0), 'running': counts.get('running', 0), 'stale_leases': stale}
+
+
+def claim_next(worker_id: str) -> MirrorJob | None:
+    """Lock the oldest available job, skipping rows other workers hold, and lease it to `worker_id`.
+
+    Jobs whose lease ran out are available again: the worker that held them is gone or stuck.
+    """
+    while True:
+        with transaction.atomic():
+            now = timezone.now()
+            job = (
+                MirrorJob.objects.select_for_update(skip_locked=True)
+                .filter(Q(status='queued') | Q(status='running', lease_expires_at__lt=now))
+                .order_by('created_at')
+                .first()
+            )
+            if job is None:
+                return None
+
+            if job.attempts >= constants.MIRROR_JOB_MAX_ATTEMPTS:
+                log.error(f"Job {job.analysis_id} was interrupted {job.attempts} times, giving up")
+                job.status = 'failed'
+                job.payload = None
+                job.lease_owner = ''
+                job.lease_expires_at = None
+                job.save(update_fields=['status', 'payload', 'lease_owner', 'lease_expires_at', 'updated_at'])
+                MirrorAnalysis.objects.get(id=job.analysis_id).mark_error('Processing was interrupted, please retry')
+                continue
+
+            if job.status == 'running':
+                log.warning(f"Reclaiming job {job.analysis_id} from expired lease of {job.lease_owner}")
+            job.status = 'running'
+            job.attempts += 1
+            job.lease_owner = worker_id
+            job.lease_expires_at = now + timedelta(seconds=constants.MIRROR_JOB_LEASE_SECONDS)
+            job.save(update_fields=['status', 'attempts', 'lease_owner', 'lease_expires_at', 'updated_at'])
+            return job
+
+
+def renew_leases(job_ids, worker_id: str) -> int:
+    expires_at = timezone.now() + timedelta(seconds=constants.MIRROR_JOB_LEASE_SECONDS)
+    return MirrorJob.objects.filter(id__in=job_ids, status='running', lease_owner=worker_id).update(
+        lease_expires_at=expires_at, updated_at=timezone.now()
+    )
+
+
+def finish(job_id, worker_id: str, failed: bool = False) -> bool:
+    """Mark the job finished and drop its payload, unless the lease was lost to another worker meanwhile"""
+    updated = MirrorJob.objects.filter(id=job_id, lease_owner=worker_id).update(
+        status='failed' if failed else 'done',
+        payload=None,
+        lease_owner='',
+        lease_expires_at=None,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        log.warning(f"Lease of job {job_id} was lost before it finished")
+    return bool(updated)
+
+
+def release(job_ids, worker_id: str) -> int:
+    """Put jobs back in the queue right away instead of waiting for their leases to expire.
+
+    A release is an orderly shutdown, not a failure, so the attempt it cut short isn't counted.
+    """
+    return MirrorJob.objects.filter(id__in=job_ids, status='running', lease_owner=worker_id).update(
+        status='queued',
+        attempts=F('attempts') - 1,
+        lease_owner='',
+        lease_expires_at=None,
+        updated_at=timezone.now(),
+    )
+
+
+class LeaseKeeper:
+    """Background thread renewing the leases of the jobs this worker is running"""
+
+    def __init__(self, worker_id: str):
+        self.worker_id = worker_id
+        self.interval = max(1, constants.MIRROR_JOB_LEASE_SECONDS // 3)
+        self._job_ids: set[int] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='mirror-lease-keeper', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def track(self, job_id: int):
+        with self._lock:
+            self._job_ids.add(job_id)
+
+    def untrack(self, job_id: int):
+        with self._lock:
+            self._job_ids.discard(job_id)
+
+    def tracked(self) -> list[int]:
+        with self._lock:
+            return list(self._job_ids)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            job_ids = self.tracked()
+            if not job_ids:
+                continue
+            try:
+                renewed = renew_leases(job_ids, self.worker_id)
+                if renewed < len(job_ids):
+                    log.warning(f"Renewed {renewed} of {len(job_ids)} leases, the rest were reclaimed")
+            except Exception:
+                log.exception("Error renewing job leases")
+            finally:
+                close_old_connections()
+
+
+def run_claimed_job(job_id: int, worker_id: str, keeper: LeaseKeeper):
+    try:
+        job = MirrorJob.objects.select_related('analysis').get(id=job_id)
+        chat_data = prepare_messages(job.load_payload())
+        # The compressed payload isn't needed once it is loaded
+        job.payload = None
+        run_async_processing(str(job.analysis_id), chat_data, job.analysis.language)
+        finish(job_id, worker_id)
+    except Exception:
+        log.exception(f"Error running job {job_id}")
+        if finish(job_id, worker_id, failed=True):
+            # Its payload is gone with it, don't leave the analysis processing forever
+            analysis = MirrorAnalysis.objects.filter(job__id=job_id, status='processing').first()
+            if analysis is not None:
+                analysis.mark_error('Processing failed, please retry')
+    finally:
+        keeper.untrack(job_id)
+
+
+def run_worker(concurrency: int, poll_interval: float = 2.0):
+    """Claim jobs from mirror_jobs whenever a slot is free, until SIGTERM/SIGINT"""
+    worker_id = get_worker_id()
+    pool = AnalysisExecutor(concurrency, concurrency, name='mirror-db-worker')
+    keeper = LeaseKeeper(worker_id)
+    keeper.start()
+
+    stopping = threading.Event()
+
+    def on_signal(signum, frame):
+        log.info(f"Worker {worker_id} got signal {signum}, stopping")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    log.info(f"Mirror worker {worker_id} started with concurrency {concurrency}")
+    while not stopping.is_set():
+        job = None
+        try:
+            # Jobs stay queued while the LLM API is down instead of failing one after another
+            if pool.idle_workers() > 0 and resilient.breaker.retry_after() is None:
+                job = claim_next(worker_id)
+        except Exception:
+            log.exception("Error claiming job")
+        finally:
+            close_old_connections()
+
+        if job is None:
+            stopping.wait(poll_interval)
+            continue
+
+        log.info(f"Worker {worker_id} claimed job {job.analysis_id} (attempt {job.attempts})")
+        keeper.track(job.id)
+        pool.submit(run_claimed_job, job.id, worker_id, keeper)
+
+    keeper.stop()
+    # Jobs still running would be killed with the process, let other workers pick them up immediately
+    released = release(keeper.tracked(), worker_id)
+    log.info(f"Worker {worker_id} stopped, released {released} running jobs")
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import math
+import queue
+import threading
+import time
+import typing
+
+from django.db import close_old_connections
+
+from app import constants
+from app.exceptions import QueueFullException
+from . import progress
+from .messages import MessageStore
+from .models import MirrorAnalysis
+from .processor import process_patient_data
+from .results import encrypt_sections, result_sections
+
+log = logging.getLogger(__name__)
+
+# Used for the retry-after hint until the first job finishes
+DEFAULT_JOB_SECONDS = 180
+MAX_RETRY_AFTER = 900
+
+_worker_state = threading.local()
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    """Event loop owned by the current thread, created once and reused for every job"""
+    loop = getattr(_worker_state, 'loop', None)
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        _worker_state.loop = loop
+    return loop
+
+
+class AnalysisExecutor:
+    """Fixed pool of worker threads fed from a bounded queue.
+
+    `submit` never blocks: when all workers are busy and the queue is full it raises
+    QueueFullException with a retry-after hint derived from the average job duration.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, name: str = 'mirror-worker'):
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(1, max_pending)
+        self.name = name
+
+        # Idle workers take jobs off the queue immediately, so it only holds the jobs that are actually waiting
+        self._queue: queue.Queue = queue.Queue(maxsize=self.max_pending)
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._active = 0
+        # Submitted and not finished, counting jobs a worker took off the queue but hasn't started yet
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._avg_duration: float | None = None
+        self._avg_wait: float | None = None
+
+    def _ensure_started(self):
+        # Threads are started lazily so that they are created in the worker process, not in a preloading master
+        with self._lock:
+            self._threads = [t for t in self._threads if t.is_alive()]
+            for i in range(len(self._threads), self.max_workers):
+                thread = threading.Thread(target=self._worker, name=f'{self.name}-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def is_saturated(self) -> bool:
+        return self._queue.full()
+
+    def idle_workers(self) -> int:
+        with self._lock:
+            return max(0, self.max_workers - self._in_flight)
+
+    def submit(self, fn: typing.Callable[..., typing.Any], *args: typing.Any):
+        self._ensure_started()
+        # Counted before the put, a worker may pick the job up and finish it before this returns
+        with self._lock:
+            self._in_flight += 1
+        try:
+            self._queue.put_nowait((fn, args, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._in_flight -= 1
+            self._reject()
+        with self._lock:
+            self._submitted += 1
+
+    def _reject(self) -> typing.NoReturn:
+        with self._lock:
+            self._rejected += 1
+        retry_after = self.retry_after()
+        log.warning(f"Analysis queue is full ({self._queue.qsize()} pending), rejecting for {retry_after}s")
+        raise QueueFullException(retry_after)
+
+    def retry_after(self) -> int:
+        """Rough number of seconds until a slot frees up for a new job"""
+        with self._lock:
+            avg = self._avg_duration or DEFAULT_JOB_SECONDS
+            waves = self._in_flight / self.max_workers
+        return min(MAX_RETRY_AFTER, max(1, math.ceil(waves * avg)))
+
+    def stats(self) -> dict[str, typing.Any]:
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'active': self._active,
+                'pending': self._queue.qsize(),
+                'submitted': self._submitted,
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected,
+                'avg_duration_seconds': round(self._avg_duration, 1) if self._avg_duration else None,
+                'avg_wait_seconds': round(self._avg_wait, 1) if self._avg_wait else None,
+            }
+
+    def _worker(self):
+        while True:
+            fn, args, enqueued_at = self._queue.get()
+            started_at = time.monotonic()
+            with self._lock:
+                self._active += 1
+                self._avg_wait = _ewma(self._avg_wait, started_at - enqueued_at)
+
+            failed = False
+            try:
+                fn(*args)
+            except Exception:
+                failed = True
+                log.exception(f"Unhandled exception in {self.name} job {getattr(fn, '__name__', fn)}")
+            finally:
+                # Jobs use the ORM from this long-lived thread, don't keep stale connections around
+                close_old_connections()
+                with self._lock:
+                    self._active -= 1
+                    self._in_flight -= 1
+                    self._failed += failed
+                    self._completed += not failed
+                    self._avg_duration = _ewma(self._avg_duration, time.monotonic() - started_at)
+                self._queue.task_done()
+
+
+def prepare_messages(chat_data: MessageStore) -> MessageStore:
+    """Move the text of a large chat out of RAM for the length of its job.
+
+    Call before handing the chat to a job, so that only the spilled store stays referenced.
+    """
+    if chat_data.spilled or chat_data.nbytes < constants.MIRROR_SPILL_BYTES:
+        return chat_data
+    started_at = time.monotonic()
+    # Sorting first means the timeline cuts periods out of the spilled store without copying it back
+    spilled = chat_data.sorted_by_time().spill(constants.MIRROR_SPILL_DIR)
+    log.info(
+        f"Spilled {len(chat_data)} messages ({chat_data.nbytes - spilled.nbytes} bytes of text) to disk "
+        f"in {time.monotonic() - started_at:.1f}s"
+    )
+    return spilled
+
+
+def run_async_processing(analysis_id, chat_data, language='ru'):
+    """Run async processing on the executor worker thread's event loop"""
+    try:
+        log.info(f"Starting async processing for {analysis_id} in language {language}")
+        loop = get_worker_loop()
+
+        # Get analysis from database
+        analysis = MirrorAnalysis.objects.get(id=analysis_id)
+
+        # Process the chat data
+        if constants.DEV_DEBUG and False:
+            result = {'result': 'ok', 'text': 'smth'}
+        else:
+            result = loop.run_until_complete(
+                progress.reporting(analysis_id, process_patient_data(chat_data, analysis.person_name, language))
+            )
+
+        log.info(f"Got response from openai for {analysis_id}")
+
+        if 'error' in result:
+            analysis.mark_error(result['error'])
+        else:
+            # Sections are encrypted one by one while being stored, the frontend loads them as it needs them
+            index = {}
+            sections = result_sections(result)
+            analysis.mark_completed(encrypt_sections(sections, analysis.keypair['pk'], index), sections=index)
+
+    except Exception as e:
+        log.error(f"Error in async processing for {analysis_id}: {e}")
+        try:
+            analysis = MirrorAnalysis.objects.get(id=analysis_id)
+            analysis.mark_error(str(e))
+        except:
+            pass  # Analysis might not exist anymore
+    finally:
+        # Deletes a spilled chat's temp file
+        if isinstance(chat_data, MessageStore):
+            chat_data.close()
+
+
+def _ewma(prev: float | None, value: float, alpha: float = 0.2) -> float:
+    return value if prev is None else prev + alpha * (value - prev)
+
+
+executor = AnalysisExecutor(constants.MIRROR_MAX_CONCURRENT_ANALYSES, constants.MIRROR_MAX_PENDING_ANALYSES)
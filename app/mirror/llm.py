@@ -0,0 +1,361 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+
+import openai
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+
+from app import constants
+from . import db
+from .llm_cache import LLMCache, build_cache, cacheable
+from .tokens import calibration, estimate_messages_tokens
+
+# Set up OpenAI API key from environment
+api_key = os.getenv('OPENAI_API_KEY')
+if not api_key:
+    raise ValueError("OPENAI_API_KEY environment variable not set")
+
+# httpx connection pools are bound to the event loop they were first used on, and every job thread runs its own
+_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]' = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def get_client() -> AsyncOpenAI:
+    """OpenAI client of the running event loop. Honours OPENAI_BASE_URL, e.g. for benchmarks.mock_openai."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        client = _clients.get(loop)
+        if client is None:
+            # Retries are done by resilience.py, where the governor and the breaker can see them
+            client = _clients[loop] = AsyncOpenAI(api_key=api_key, max_retries=0)
+    return client
+
+
+log = logging.getLogger(__name__)
+
+# Output budget assumed for calls without max_tokens, structured analyses are a few thousand tokens long
+DEFAULT_COMPLETION_TOKENS = 4096
+
+
+@dataclass
+class ModelLimits:
+    rpm: int
+    tpm: int
+    max_concurrency: int = 16
+    initial_concurrency: int = 4
+
+
+DEFAULT_LIMITS = {
+    'gpt-4.1': ModelLimits(rpm=500, tpm=800_000),
+    'gpt-4.1-mini': ModelLimits(rpm=500, tpm=2_000_000),
+    'gpt-4o-mini': ModelLimits(rpm=500, tpm=2_000_000),
+}
+FALLBACK_LIMITS = ModelLimits(rpm=500, tpm=200_000)
+
+
+def load_limits() -> Dict[str, ModelLimits]:
+    """Defaults overridden by LLM_RATE_LIMITS, e.g. '{"gpt-4.1": {"rpm": 5000, "tpm": 2000000}}'"""
+    limits = dict(DEFAULT_LIMITS)
+    overrides = json.loads(constants.LLM_RATE_LIMITS)
+    for model, values in overrides.items():
+        base = limits.get(model, FALLBACK_LIMITS)
+        limits[model] = ModelLimits(**{**base.__dict__, **values})
+    return limits
+
+
+class TokenBucket:
+    """Refills continuously up to `capacity` per minute. Not thread-safe, guarded by the governor lock."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.available = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float):
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, cost: float) -> float:
+        # A request bigger than the whole bucket is let through once the bucket is full, otherwise it would starve
+        need = min(cost, self.capacity)
+        if self.available >= need:
+            return 0.0
+        return (need - self.available) / self.rate
+
+
+class ModelState:
+    def __init__(self, limits: ModelLimits):
+        self.limits = limits
+        self.requests = TokenBucket(limits.rpm)
+        self.tokens = TokenBucket(limits.tpm)
+        self.concurrency = float(limits.initial_concurrency)
+        self.inflight = 0
+        self.paused_until = 0.0
+        self.latency_ewma: float | None = None
+        self.latency_floor: float | None = None
+        self.requests_total = 0
+        self.rate_limited_total = 0
+        self.throttled_total = 0
+        self.throttled_seconds = 0.0
+
+
+@dataclass
+class Ticket:
+    model: str
+    estimated_tokens: int
+    started_at: float = 0.0
+    actual_tokens: int | None = None
+
+    def record_usage(self, usage):
+        if usage is not None:
+            self.actual_tokens = getattr(usage, 'total_tokens', None)
+
+
+class RateGovernor:
+    """Process-wide request and token budgets per model, with AIMD concurrency.
+
+    Every job thread has its own event loop, so state is guarded by a thread lock and
+    waiters poll with asyncio.sleep instead of sharing asyncio primitives.
+    """
+
+    # Additive increase per successful call is 1/concurrency, i.e. about +1 per round of calls
+    DECREASE_FACTOR = 0.5
+    LATENCY_BACKOFF_FACTOR = 0.9
+    # Calls this much slower than the best observed latency count as congestion
+    LATENCY_TOLERANCE = 2.5
+    MAX_POLL_SECONDS = 0.5
+
+    def __init__(self, limits: Dict[str, ModelLimits] | None = None):
+        self.limits = limits if limits is not None else load_limits()
+        self._models: Dict[str, ModelState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, model: str) -> ModelState:
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = ModelState(self.limits.get(model, FALLBACK_LIMITS))
+        return state
+
+    def _try_acquire(self, model: str, cost: int) -> float:
+        """Take a slot and the budget if available, otherwise return how long to wait"""
+        with self._lock:
+            state = self._state(model)
+            now = time.monotonic()
+            if now < state.paused_until:
+                return state.paused_until - now
+            if state.inflight >= max(1, int(state.concurrency)):
+                return self.MAX_POLL_SECONDS
+
+            state.requests.refill(now)
+            state.tokens.refill(now)
+            wait = max(state.requests.wait_time(1), state.tokens.wait_time(cost))
+            if wait > 0:
+                return wait
+
+            state.requests.available -= 1
+            state.tokens.available -= cost
+            state.inflight += 1
+            state.requests_total += 1
+            return 0.0
+
+    async def acquire(self, model: str, estimated_tokens: int) -> Ticket:
+        waited_from = time.monotonic()
+        throttled = False
+        while (wait := self._try_acquire(model, estimated_tokens)) > 0:
+            throttled = True
+            await asyncio.sleep(min(wait, self.MAX_POLL_SECONDS))
+
+        if throttled:
+            with self._lock:
+                state = self._state(model)
+                state.throttled_total += 1
+                state.throttled_seconds += time.monotonic() - waited_from
+        return Ticket(model=model, estimated_tokens=estimated_tokens, started_at=time.monotonic())
+
+    def release(self, ticket: Ticket, rate_limited: bool = False, retry_after: float | None = None):
+        with self._lock:
+            state = self._state(ticket.model)
+            state.inflight -= 1
+
+            # Give back the part of the estimate the request didn't use, or charge the excess
+            if ticket.actual_tokens is not None:
+                state.tokens.available = min(
+                    state.tokens.capacity, state.tokens.available + ticket.estimated_tokens - ticket.actual_tokens
+                )
+
+            if rate_limited:
+                state.rate_limited_total += 1
+                state.concurrency = max(1.0, state.concurrency * self.DECREASE_FACTOR)
+                pause = retry_after if retry_after is not None else 60.0 / max(state.limits.rpm, 1)
+                state.paused_until = max(state.paused_until, time.monotonic() + pause)
+                log.warning(
+                    f"Rate limited on {ticket.model}, concurrency cut to {state.concurrency:.1f}, pausing {pause:.1f}s"
+                )
+                return
+
+            latency = time.monotonic() - ticket.started_at
+            state.latency_ewma = latency if state.latency_ewma is None else 0.8 * state.latency_ewma + 0.2 * latency
+            state.latency_floor = latency if state.latency_floor is None else min(state.latency_floor, latency)
+            if latency > state.latency_floor * self.LATENCY_TOLERANCE and latency > state.latency_ewma:
+                state.concurrency = max(1.0, state.concurrency * self.LATENCY_BACKOFF_FACTOR)
+            else:
+                state.concurrency = min(float(state.limits.max_concurrency), state.concurrency + 1 / state.concurrency)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, model: str, estimated_tokens: int):
+        ticket = await self.acquire(model, estimated_tokens)
+        try:
+            yield ticket
+        except openai.RateLimitError as e:
+            self.release(ticket, rate_limited=True, retry_after=_retry_after_seconds(e))
+            raise
+        except BaseException:
+            # Failed calls still count against the budgets but say nothing about congestion
+            with self._lock:
+                self._state(model).inflight -= 1
+            raise
+        else:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            result = {}
+            for model, state in self._models.items():
+                state.requests.refill(now)
+                state.tokens.refill(now)
+                result[model] = {
+                    'concurrency_limit': round(state.concurrency, 2),
+                    'inflight': state.inflight,
+                    'rpm_limit': state.limits.rpm,
+                    'tpm_limit': state.limits.tpm,
+                    'requests_available': int(state.requests.available),
+                    'tokens_available': int(state.tokens.available),
+                    'paused_for_seconds': round(max(0.0, state.paused_until - now), 1),
+                    'latency_ewma_seconds': round(state.latency_ewma, 2) if state.latency_ewma else None,
+                    'requests_total': state.requests_total,
+                    'rate_limited_total': state.rate_limited_total,
+                    'throttled_total': state.throttled_total,
+                    'throttled_seconds': round(state.throttled_seconds, 1),
+                }
+            return result
+
+
+def _retry_after_seconds(error: openai.RateLimitError) -> float | None:
+    try:
+        return float(error.response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+governor = RateGovernor()
+
+
+def estimate_request_tokens(kwargs: Dict[str, Any], prompt_tokens: int) -> int:
+    """Prompt estimate plus the output budget, which is what the API counts against TPM"""
+    completion = kwargs.get('max_tokens') or kwargs.get('max_completion_tokens') or DEFAULT_COMPLETION_TOKENS
+    return calibration.apply(prompt_tokens) + completion
+
+
+_cache: LLMCache | None = None
+_cache_built = False
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache | None:
+    """Response cache of this process, built on first use since it needs Django settings"""
+    global _cache, _cache_built
+    with _cache_lock:
+        if not _cache_built:
+            _cache = build_cache()
+            _cache_built = True
+    return _cache
+
+
+async def stream_completion(client: AsyncOpenAI, on_delta: Callable[[str], None], **kwargs) -> ChatCompletion:
+    """chat.completions.create in streaming mode, calling on_delta with each piece of content.
+
+    The chunks are put back together into the ChatCompletion a non-streaming call would have returned.
+    """
+    stream = await client.chat.completions.create(**kwargs, stream=True, stream_options={'include_usage': True})
+    head = None
+    usage = None
+    choices: Dict[int, Dict[str, Any]] = {}
+    async for chunk in stream:
+        head = head or chunk
+        usage = chunk.usage or usage
+        for choice in chunk.choices:
+            state = choices.setdefault(choice.index, {'content': [], 'refusal': [], 'finish_reason': None})
+            if choice.delta.content:
+                state['content'].append(choice.delta.content)
+                on_delta(choice.delta.content)
+            if choice.delta.refusal:
+                state['refusal'].append(choice.delta.refusal)
+            state['finish_reason'] = choice.finish_reason or state['finish_reason']
+
+    if head is None:
+        raise openai.APIConnectionError(message='Stream ended without a chunk', request=stream.response.request)
+    return ChatCompletion.model_validate(
+        {
+            'id': head.id,
+            'object': 'chat.completion',
+            'created': head.created,
+            'model': head.model,
+            'system_fingerprint': head.system_fingerprint,
+            'service_tier': head.service_tier,
+            'usage': usage.model_dump() if usage else None,
+            'choices': [
+                {
+                    'index': index,
+                    # A stream cut short without a finish reason is as good as truncated
+                    'finish_reason': state['finish_reason'] or 'length',
+                    'message': {
+                        'role': 'assistant',
+                        'content': ''.join(state['content']) or None,
+                        'refusal': ''.join(state['refusal']) or None,
+                    },
+                }
+                for index, state in sorted(choices.items())
+            ],
+        }
+    )
+
+
+async def chat_completion(*, cache: bool = True, on_delta: Callable[[str], None] | None = None, **kwargs):
+    """chat.completions.create behind the response cache and the process-wide rate governor.
+
+    Pass cache=False for calls whose answer must not be reused. With on_delta the answer is streamed
+    and on_delta is called with each piece of its content as it arrives, not for cached answers.
+    """
+    model = kwargs['model']
+    llm_cache = get_cache() if cache and cacheable(kwargs) else None
+    keys = None
+    if llm_cache is not None:
+        keys = llm_cache.keys(kwargs)
+        cached = await db.run(llm_cache.get, keys)
+        if cached is not None:
+            return cached
+
+    prompt_tokens = estimate_messages_tokens(kwargs['messages'])
+    async with governor.slot(model, estimate_request_tokens(kwargs, prompt_tokens)) as ticket:
+        if on_delta is not None:
+            response = await stream_completion(get_client(), on_delta, **kwargs)
+        else:
+            response = await get_client().chat.completions.create(**kwargs)
+        ticket.record_usage(response.usage)
+    if response.usage is not None:
+        calibration.observe(prompt_tokens, response.usage.prompt_tokens)
+
+    # Truncated or refused answers are worth retrying rather than replaying
+    if keys is not None and all(choice.finish_reason == 'stop' for choice in response.choices):
+        await db.run(llm_cache.put, keys, model, response)
+    return response
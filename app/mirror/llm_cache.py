@@ -0,0 +1,299 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+from openai.types.chat import ChatCompletion
+
+from app import constants
+
+log = logging.getLogger(__name__)
+
+# Request fields that change what the model answers, everything else (timeouts, headers) stays out of the key
+KEY_FIELDS = (
+    'model',
+    'messages',
+    'response_format',
+    'temperature',
+    'top_p',
+    'max_tokens',
+    'max_completion_tokens',
+    'seed',
+    'stop',
+    'n',
+    'presence_penalty',
+    'frequency_penalty',
+    'logit_bias',
+    'tools',
+    'tool_choice',
+)
+
+# Bumped whenever the stored format changes, so old entries simply stop matching
+FORMAT_VERSION = b'llm-cache-1'
+NONCE_SIZE = 12
+
+
+def canonical_request(kwargs: Dict[str, Any]) -> bytes:
+    request = {field: kwargs[field] for field in KEY_FIELDS if kwargs.get(field) is not None}
+    return json.dumps(
+        request, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=_json_default
+    ).encode()
+
+
+def _json_default(value):
+    if hasattr(value, 'model_dump'):
+        return value.model_dump()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class EntryKeys:
+    """Lookup id and encryption key of one request, both derived from its canonical form.
+
+    The key is convergent: it comes from the request itself, so an entry can only be decrypted by
+    someone presenting the same request, i.e. holding the same chat. The id is a separate hash and
+    reveals nothing about the key. Both are keyed with the server secret, so a copy of the table alone
+    doesn't allow checking guesses of a prompt.
+    """
+
+    __slots__ = ('id', 'key')
+
+    def __init__(self, canonical: bytes, secret: bytes):
+        self.id = hmac.new(secret, FORMAT_VERSION + b'\0id\0' + canonical, hashlib.sha256).hexdigest()
+        self.key = hmac.new(secret, FORMAT_VERSION + b'\0key\0' + canonical, hashlib.sha256).digest()
+
+    def seal(self, response: ChatCompletion) -> bytes:
+        nonce = os.urandom(NONCE_SIZE)
+        plain = zlib.compress(response.model_dump_json().encode(), 6)
+        return nonce + AESGCM(self.key).encrypt(nonce, plain, self.id.encode())
+
+    def open(self, blob: bytes) -> ChatCompletion:
+        plain = AESGCM(self.key).decrypt(blob[:NONCE_SIZE], blob[NONCE_SIZE:], self.id.encode())
+        return ChatCompletion.model_validate_json(zlib.decompress(plain))
+
+
+class MemoryTier:
+    """LRU of sealed entries bounded by their total size. Thread-safe, shared by every job thread."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, entry_id: str) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return None
+            expires_at, blob = entry
+            if expires_at <= time.time():
+                self._drop(entry_id)
+                return None
+            self._entries.move_to_end(entry_id)
+            return blob
+
+    def put(self, entry_id: str, blob: bytes, expires_at: float):
+        if len(blob) > self.max_bytes:
+            return
+        with self._lock:
+            if entry_id in self._entries:
+                self._drop(entry_id)
+            self._entries[entry_id] = (expires_at, blob)
+            self.bytes += len(blob)
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, entry_id: str):
+        _, blob = self._entries.pop(entry_id)
+        self.bytes -= len(blob)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+class DatabaseTier:
+    """Entries shared by all web and worker processes through the llm_cache table.
+
+    Expired rows and the least recently used ones beyond `max_bytes` are trimmed every `trim_every` writes.
+    """
+
+    def __init__(self, max_bytes: int, trim_every: int = 50):
+        self.max_bytes = max_bytes
+        self.trim_every = trim_every
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, entry_id: str) -> bytes | None:
+        from .models import LLMCacheEntry
+
+        now = timezone.now()
+        entry = LLMCacheEntry.objects.filter(id=entry_id, expires_at__gt=now).values_list('blob', flat=True).first()
+        if entry is None:
+            return None
+        LLMCacheEntry.objects.filter(id=entry_id).update(last_used_at=now)
+        return bytes(entry)
+
+    def put(self, entry_id: str, model: str, blob: bytes, ttl: int):
+        from .models import LLMCacheEntry
+
+        now = timezone.now()
+        LLMCacheEntry.objects.update_or_create(
+            id=entry_id,
+            defaults={
+                'model': model,
+                'blob': blob,
+                'size': len(blob),
+                'last_used_at': now,
+                'expires_at': now + timedelta(seconds=ttl),
+            },
+        )
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self.trim_every == 1
+        if due:
+            self.trim()
+
+    def trim(self):
+        from .models import LLMCacheEntry
+
+        expired, _ = LLMCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+        evicted = 0
+        total = LLMCacheEntry.objects.aggregate(total=Sum('size'))['total'] or 0
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            victims = []
+            for entry_id, size in LLMCacheEntry.objects.order_by('last_used_at').values_list('id', 'size').iterator():
+                victims.append(entry_id)
+                excess -= size
+                if excess <= 0:
+                    break
+            evicted, _ = LLMCacheEntry.objects.filter(id__in=victims).delete()
+        with self._lock:
+            self.evictions += expired + evicted
+        if expired or evicted:
+            log.info(f"LLM cache trimmed {expired} expired and {evicted} least recently used entries")
+
+    def stats(self) -> Dict[str, Any]:
+        from .models import LLMCacheEntry
+
+        totals = LLMCacheEntry.objects.aggregate(total=Sum('size'))
+        return {'entries': LLMCacheEntry.objects.count(), 'bytes': totals['total'] or 0, 'max_bytes': self.max_bytes}
+
+
+class LLMCache:
+    """Two-tier cache of chat completions keyed by the request.
+
+    Lookups try this process's memory first, then the shared table, and promote table hits into memory.
+    Both tiers hold only sealed entries. Any failure of the cache is logged and treated as a miss, it
+    never fails the call it sits under.
+    """
+
+    def __init__(self, memory: MemoryTier, database: DatabaseTier | None, ttl: int, secret: bytes):
+        self.memory = memory
+        self.database = database
+        self.ttl = ttl
+        self._secret = secret
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'stores': 0, 'errors': 0}
+
+    def keys(self, kwargs: Dict[str, Any]) -> EntryKeys:
+        return EntryKeys(canonical_request(kwargs), self._secret)
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def get(self, keys: EntryKeys) -> ChatCompletion | None:
+        """Blocking lookup, may hit the database"""
+        tier = 'memory_hits'
+        blob = self.memory.get(keys.id)
+        try:
+            if blob is None and self.database is not None:
+                tier = 'db_hits'
+                blob = self.database.get(keys.id)
+                if blob is not None:
+                    self.memory.put(keys.id, blob, time.time() + self.ttl)
+            if blob is None:
+                self._count('misses')
+                return None
+            response = keys.open(blob)
+        except InvalidTag:
+            # Written under another secret or format, replace it on the next store
+            self._count('misses')
+            return None
+        except Exception as e:
+            log.warning(f"LLM cache lookup failed: {e}")
+            self._count('errors')
+            return None
+        self._count(tier)
+        return response
+
+    def put(self, keys: EntryKeys, model: str, response: ChatCompletion):
+        """Blocking store, may write to the database"""
+        try:
+            blob = keys.seal(response)
+            self.memory.put(keys.id, blob, time.time() + self.ttl)
+            if self.database is not None:
+                self.database.put(keys.id, model, blob, self.ttl)
+        except Exception as e:
+            log.warning(f"LLM cache store failed: {e}")
+            self._count('errors')
+            return
+        self._count('stores')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters['memory_hits'] + counters['db_hits'] + counters['misses']
+        result = {
+            **counters,
+            'hit_ratio': round((counters['memory_hits'] + counters['db_hits']) / lookups, 3) if lookups else None,
+            'ttl_seconds': self.ttl,
+            'memory': {
+                'entries': len(self.memory),
+                'bytes': self.memory.bytes,
+                'max_bytes': self.memory.max_bytes,
+                'evictions': self.memory.evictions,
+            },
+        }
+        if self.database is not None:
+            try:
+                result['db'] = {**self.database.stats(), 'evictions': self.database.evictions}
+            except Exception as e:
+                result['db'] = {'error': str(e)}
+        return result
+
+
+def cacheable(kwargs: Dict[str, Any]) -> bool:
+    # Streams and multi-choice calls are rare and don't round-trip through a single ChatCompletion
+    return not kwargs.get('stream') and (kwargs.get('n') or 1) == 1
+
+
+def build_cache() -> LLMCache | None:
+    if not constants.MIRROR_LLM_CACHE_ENABLED:
+        return None
+    secret = (constants.MIRROR_LLM_CACHE_SECRET or settings.SECRET_KEY).encode()
+    database = DatabaseTier(constants.MIRROR_LLM_CACHE_DB_BYTES) if constants.MIRROR_LLM_CACHE_DB_BYTES > 0 else None
+    return LLMCache(
+        MemoryTier(constants.MIRROR_LLM_CACHE_MEMORY_BYTES), database, constants.MIRROR_LLM_CACHE_TTL, secret
+    )
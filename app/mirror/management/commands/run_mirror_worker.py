@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from app import constants
+from app.mirror import job_queue
+
+
+class Command(BaseCommand):
+    help = "Claim queued mirror analyses from the database and process them"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=constants.MIRROR_MAX_CONCURRENT_ANALYSES,
+            help='Number of analyses processed at once',
+        )
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        job_queue.run_worker(options['concurrency'], options['poll_interval'])
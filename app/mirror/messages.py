@@ -0,0 +1,258 @@
+import json
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+
+from .dates import INVALID, ColumnParser, from_epoch
+from .spill import EncryptedSpill
+from .tokens import estimate_text_tokens, estimate_tokens_from_sizes
+
+# Leads the binary form written by MessageStore.to_bytes
+MAGIC = b'MST1'
+
+
+class MessageStore:
+    """Chat messages kept as columns instead of one dict per message.
+
+    Senders are interned into a list and referenced by code, dates are parsed once into epoch seconds
+    and all texts share one UTF-8 buffer addressed by offsets. Slicing returns a view over the same
+    columns, so periods of a timeline cost nothing to cut. The text buffer is either bytes or, for
+    chats moved out of RAM with spill(), an EncryptedSpill that decrypts the slices it is asked for.
+    """
+
+    __slots__ = ('senders', 'codes', 'epochs', 'tokens', 'offsets', 'text', 'start', 'stop')
+
+    def __init__(
+        self,
+        senders: List[str],
+        codes: array,
+        epochs: array,
+        tokens: array,
+        offsets: array,
+        text: bytes | EncryptedSpill,
+        start: int = 0,
+        stop: int | None = None,
+    ):
+        self.senders = senders  # code -> name
+        self.codes = codes  # array('I') of sender codes
+        self.epochs = epochs  # array('q') of epoch seconds, dates.INVALID where missing or unparseable
+        self.tokens = tokens  # array('I') of estimated tokens of each text
+        self.offsets = offsets  # array('q'), text of message i is text[offsets[i]:offsets[i + 1]]
+        self.text = text
+        self.start = start
+        self.stop = len(codes) if stop is None else stop
+
+    @classmethod
+    def from_dicts(cls, messages: Iterable[Dict[str, Any]]) -> 'MessageStore':
+        builder = MessageStoreBuilder()
+        for msg in messages:
+            builder.add(msg)
+        return builder.build()
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError('MessageStore slices must be contiguous')
+            return MessageStore(
+                self.senders,
+                self.codes,
+                self.epochs,
+                self.tokens,
+                self.offsets,
+                self.text,
+                self.start + start,
+                self.start + max(start, stop),
+            )
+        i = self._index(key)
+        return {'sender': self.sender(i), 'text': self.text_at(i), 'date': self.date(i)}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return f"<MessageStore {len(self)} messages, {len(self.senders)} senders, {self.nbytes} bytes>"
+
+    def _index(self, i: int) -> int:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('MessageStore index out of range')
+        return self.start + i
+
+    # Accessors below take absolute positions in the columns, i.e. already offset by `start`
+
+    def sender(self, i: int) -> str:
+        return self.senders[self.codes[i]]
+
+    def text_at(self, i: int) -> str:
+        return str(self._text_view(self.offsets[i], self.offsets[i + 1]), 'utf-8')
+
+    def date(self, i: int) -> str:
+        """ISO date of the message, or '' if it had none that parsed"""
+        epoch = self.epochs[i]
+        return '' if epoch == INVALID else from_epoch(epoch).isoformat()
+
+    def _text_view(self, start: int, stop: int) -> memoryview:
+        """Bytes start:stop of the text buffer, without copying them when it is in memory"""
+        if isinstance(self.text, EncryptedSpill):
+            return memoryview(self.text[start:stop])
+        return memoryview(self.text)[start:stop]
+
+    @property
+    def spilled(self) -> bool:
+        return isinstance(self.text, EncryptedSpill)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the columns, shared with other views of the same store. Spilled text isn't counted."""
+        columns = (self.codes, self.epochs, self.tokens, self.offsets)
+        text = 0 if self.spilled else len(self.text)
+        return sum(c.itemsize * len(c) for c in columns) + text + sum(len(s) for s in self.senders)
+
+    def lines(self) -> Iterator[str]:
+        """`sender: text` per message, as they go into a prompt"""
+        senders, codes, offsets = self.senders, self.codes, self.offsets
+        # One read for the whole view, which for a spilled store is one decryption
+        base = offsets[self.start]
+        text = self._text_view(base, offsets[self.stop])
+        for i in range(self.start, self.stop):
+            yield f"{senders[codes[i]]}: {str(text[offsets[i] - base : offsets[i + 1] - base], 'utf-8')}"
+
+    def transcript(self) -> str:
+        return '\n'.join(self.lines())
+
+    def token_counts(self) -> List[int]:
+        """Estimated tokens of each message's prompt line"""
+        sender_tokens = [estimate_text_tokens(s) + 1 for s in self.senders]
+        codes, tokens = self.codes, self.tokens
+        return [sender_tokens[codes[i]] + tokens[i] for i in range(self.start, self.stop)]
+
+    def sorted_by_time(self) -> 'MessageStore':
+        """Messages in date order, those without a date last. Returns self if they already are."""
+        epochs = self.epochs
+        if all(epochs[i] <= epochs[i + 1] for i in range(self.start, self.stop - 1)):
+            return self
+        return self.take(sorted(range(self.start, self.stop), key=epochs.__getitem__))
+
+    def take(self, positions: Sequence[int]) -> 'MessageStore':
+        """New store with the messages at the given absolute positions, in that order"""
+        offsets = self.offsets
+        text = self._text_view(0, len(self.text))
+        new_offsets = array('q', [0])
+        parts = []
+        size = 0
+        for i in positions:
+            part = text[offsets[i] : offsets[i + 1]]
+            parts.append(part)
+            size += len(part)
+            new_offsets.append(size)
+        return MessageStore(
+            self.senders,
+            array('I', map(self.codes.__getitem__, positions)),
+            array('q', map(self.epochs.__getitem__, positions)),
+            array('I', map(self.tokens.__getitem__, positions)),
+            new_offsets,
+            b''.join(parts),
+        )
+
+    def compact(self) -> 'MessageStore':
+        """A store owning just the columns of this view"""
+        if self.start == 0 and self.stop == len(self.codes):
+            return self
+        base = self.offsets[self.start]
+        return MessageStore(
+            self.senders,
+            self.codes[self.start : self.stop],
+            self.epochs[self.start : self.stop],
+            self.tokens[self.start : self.stop],
+            array('q', (o - base for o in self.offsets[self.start : self.stop + 1])),
+            bytes(self._text_view(base, self.offsets[self.stop])),
+        )
+
+    def spill(self, directory: str | None = None) -> 'MessageStore':
+        """A store with the same columns whose text lives in an encrypted temporary file instead of RAM.
+
+        close() deletes the file, views of the returned store share it.
+        """
+        if self.spilled:
+            return self
+        store = self.compact()
+        return MessageStore(
+            store.senders, store.codes, store.epochs, store.tokens, store.offsets, EncryptedSpill(store.text, directory)
+        )
+
+    def close(self):
+        """Release spilled text, a no-op for stores held in memory"""
+        if self.spilled:
+            self.text.close()
+
+    def to_bytes(self) -> bytes:
+        store = self.compact()
+        header = json.dumps({'senders': store.senders, 'count': len(store), 'byteorder': sys.byteorder}).encode()
+        columns = (store.codes, store.epochs, store.tokens, store.offsets)
+        text = store._text_view(0, len(store.text))
+        return b''.join([MAGIC, struct.pack('<I', len(header)), header, *(c.tobytes() for c in columns), text])
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'MessageStore':
+        if data[: len(MAGIC)] != MAGIC:
+            raise ValueError('Not a serialized MessageStore')
+        pos = len(MAGIC) + 4
+        (header_size,) = struct.unpack('<I', data[len(MAGIC) : pos])
+        header = json.loads(data[pos : pos + header_size])
+        pos += header_size
+
+        count = header['count']
+        columns = []
+        for typecode, size in (('I', count), ('q', count), ('I', count), ('q', count + 1)):
+            column = array(typecode)
+            end = pos + column.itemsize * size
+            column.frombytes(data[pos:end])
+            if header['byteorder'] != sys.byteorder:
+                column.byteswap()
+            columns.append(column)
+            pos = end
+        codes, epochs, tokens, offsets = columns
+        return cls(header['senders'], codes, epochs, tokens, offsets, bytes(data[pos:]))
+
+
+class MessageStoreBuilder:
+    """Appends messages one at a time, e.g. straight from an upload stream"""
+
+    def __init__(self):
+        self.senders: List[str] = []
+        self._sender_codes: Dict[str, int] = {}
+        self.codes = array('I')
+        self.tokens = array('I')
+        self.offsets = array('q', [0])
+        self.text = bytearray()
+        self.dates = ColumnParser()
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def append(self, sender: str, text: str, date: Any):
+        code = self._sender_codes.get(sender)
+        if code is None:
+            code = self._sender_codes[sender] = len(self.senders)
+            self.senders.append(sender)
+        self.codes.append(code)
+        encoded = text.encode('utf-8')
+        self.tokens.append(estimate_tokens_from_sizes(len(text), len(encoded)))
+        self.text += encoded
+        self.offsets.append(len(self.text))
+        self.dates.append(date)
+
+    def add(self, msg: Dict[str, Any]):
+        self.append(msg.get('sender') or 'User', str(msg.get('text') or ''), msg.get('date'))
+
+    def build(self) -> MessageStore:
+        return MessageStore(
+            self.senders, self.codes, self.dates.finish().epochs, self.tokens, self.offsets, bytes(self.text)
+        )
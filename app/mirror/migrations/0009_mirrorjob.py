@@ -0,0 +1,49 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mirror', '0008_mirroranalysis_language'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MirrorJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                (
+                    'status',
+                    models.CharField(
+                        choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')],
+                        default='queued',
+                        max_length=20,
+                    ),
+                ),
+                ('payload', models.BinaryField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('lease_owner', models.CharField(blank=True, default='', max_length=128)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                (
+                    'analysis',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE, related_name='job', to='mirror.mirroranalysis'
+                    ),
+                ),
+            ],
+            options={
+                'db_table': 'mirror_jobs',
+                'ordering': ['created_at'],
+                'indexes': [
+                    models.Index(fields=['status', 'created_at'], name='mirror_jobs_status_created'),
+                    models.Index(fields=['status', 'lease_expires_at'], name='mirror_jobs_status_lease'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:43
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mirror', '0009_mirrorjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                (
+                    'status',
+                    models.CharField(
+                        choices=[('open', 'Open'), ('finalizing', 'Finalizing'), ('finalized', 'Finalized')],
+                        default='open',
+                        max_length=20,
+                    ),
+                ),
+                ('encoding', models.CharField(default='gzip', max_length=20)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('parts', models.PositiveIntegerField(default=0)),
+                ('total_bytes', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('expires_at', models.DateTimeField()),
+                (
+                    'analysis',
+                    models.OneToOneField(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name='upload_session',
+                        to='mirror.mirroranalysis',
+                    ),
+                ),
+            ],
+            options={
+                'db_table': 'mirror_upload_sessions',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['expires_at'], name='mirror_upload_expires')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mirror', '0010_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='content',
+            field=models.CharField(
+                choices=[('request', 'Process request body'), ('export', 'Raw chat export')],
+                default='request',
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='summary',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
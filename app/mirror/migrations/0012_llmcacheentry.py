@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-18 02:01
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mirror', '0011_uploadsession_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCacheEntry',
+            fields=[
+                ('id', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=64)),
+                ('blob', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'mirror_llm_cache',
+                'indexes': [
+                    models.Index(fields=['expires_at'], name='mirror_llm_cache_expires'),
+                    models.Index(fields=['last_used_at'], name='mirror_llm_cache_used'),
+                ],
+            },
+        ),
+    ]
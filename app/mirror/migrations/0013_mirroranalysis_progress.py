@@ -0,0 +1,33 @@
+# Generated by Django 5.0.2 on 2026-10-18 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mirror', '0012_llmcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mirroranalysis',
+            name='progress',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Percent complete'),
+        ),
+        migrations.AddField(
+            model_name='mirroranalysis',
+            name='sections_done',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mirroranalysis',
+            name='sections_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='mirroranalysis',
+            name='stage',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
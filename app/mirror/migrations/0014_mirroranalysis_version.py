@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 02:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mirror', '0013_mirroranalysis_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mirroranalysis',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.2 on 2026-10-18 02:18
+
+import app.mirror.results
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mirror', '0014_mirroranalysis_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mirroranalysis',
+            name='result',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='mirroranalysis',
+            name='result_file',
+            field=models.FileField(blank=True, storage=app.mirror.results.result_storage, upload_to='mirror-results/'),
+        ),
+        migrations.AddField(
+            model_name='mirroranalysis',
+            name='result_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mirror', '0015_mirroranalysis_result'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mirroranalysis',
+            name='result_sections',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
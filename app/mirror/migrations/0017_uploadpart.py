@@ -0,0 +1,38 @@
+# Generated by Django 5.0.2 on 2026-10-18 02:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mirror', '0016_mirroranalysis_result_sections'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadPart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset', models.BigIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                (
+                    'session',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='upload_parts',
+                        to='mirror.uploadsession',
+                    ),
+                ),
+            ],
+            options={
+                'db_table': 'mirror_upload_parts',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='uploadpart',
+            constraint=models.UniqueConstraint(fields=('session', 'offset'), name='mirror_upload_part_offset'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 02:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mirror', '0017_uploadpart'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='finalizing_since',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
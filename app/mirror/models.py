@@ -1,9 +1,23 @@
+import gzip
+import hashlib
+import hmac
+import json
 import logging
+import os
+from typing import Dict, Iterable, List
 
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from django.conf import settings
 from django.db import models
+from django.db.models import F
 from django.utils import timezone
 import uuid
 
+from app import constants
+from .messages import MAGIC as MESSAGE_STORE_MAGIC, MessageStore
+from .notify import notifier
+from .results import result_storage, store_result
+
 log = logging.getLogger(__name__)
 
 
@@ -19,7 +33,14 @@ class MirrorAnalysis(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='processing')
 
+    # Encrypted bundle of results stored before they were kept as bytes, see results.py
     insights = models.JSONField(null=True, blank=True)
+    # Encrypted result blob, either in the row or in the file storage depending on MIRROR_RESULT_STORAGE
+    result = models.BinaryField(null=True, blank=True)
+    result_file = models.FileField(upload_to='mirror-results/', storage=result_storage, blank=True)
+    result_size = models.PositiveBigIntegerField(null=True, blank=True)
+    # Sectioned results: name -> [offset, length] of each separately encrypted section within the blob
+    result_sections = models.JSONField(null=True, blank=True)
     error_message = models.TextField(blank=True)
 
     person_name = models.CharField(max_length=255, blank=True, default='')
@@ -27,6 +48,14 @@ class MirrorAnalysis(models.Model):
 
     keypair = models.JSONField(null=True, blank=True)
 
+    # Written by the job while it runs, see progress.py
+    stage = models.CharField(max_length=32, blank=True, default='')
+    progress = models.PositiveSmallIntegerField(default=0, help_text='Percent complete')
+    sections_done = models.PositiveIntegerField(default=0)
+    sections_total = models.PositiveIntegerField(default=0)
+    # Bumped on every change of the above, the insights API's ETag
+    version = models.PositiveIntegerField(default=0)
+
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
     completed_at = models.DateTimeField(null=True, blank=True)
@@ -38,11 +67,38 @@ class MirrorAnalysis(models.Model):
     def __str__(self):
         return f"MirrorAnalysis {self.id} - {self.status}"
 
-    def mark_completed(self, insights):
+    def state(self) -> dict:
+        """Status and progress as the insights API and its event stream report them"""
+        return {
+            'uuid': str(self.id),
+            'status': self.status,
+            'progress': {
+                'stage': self.stage,
+                'percent': self.progress,
+                'sections_done': self.sections_done,
+                'sections_total': self.sections_total,
+            },
+            'error_message': self.error_message if self.status == 'error' else None,
+        }
+
+    def publish_state(self):
+        notifier.publish(str(self.id), self.state())
+
+    def mark_completed(self, result: Iterable[bytes], sections: Dict[str, List[int]] | None = None):
         self.status = 'completed'
-        self.insights = insights
+        stored = store_result(self, result)
+        if sections is not None:
+            # Filled in while the result was being stored
+            self.result_sections = sections
+            stored.append('result_sections')
+        self.stage = 'done'
+        self.progress = 100
         self.completed_at = timezone.now()
-        self.save()
+        self.version = F('version') + 1
+        # The job's other progress fields were written behind this instance's back
+        self.save(update_fields=['status', *stored, 'stage', 'progress', 'completed_at', 'version', 'updated_at'])
+        self.refresh_from_db(fields=['version'])
+        self.publish_state()
         log.info(f"MirrorAnalysis {self.id} marked as saved")
 
     def mark_error(self, error_message):
@@ -50,4 +106,164 @@ class MirrorAnalysis(models.Model):
         self.status = 'error'
         self.error_message = error_message
         self.completed_at = timezone.now()
-        self.save()
+        self.version = F('version') + 1
+        # Keeps the stage the job failed in
+        self.save(update_fields=['status', 'error_message', 'completed_at', 'version', 'updated_at'])
+        self.refresh_from_db(fields=['version'])
+        self.publish_state()
+
+
+# Encrypted job payload: magic, nonce, then the AES-GCM ciphertext and tag
+PAYLOAD_MAGIC = b'MJP1'
+PAYLOAD_NONCE_SIZE = 12
+
+
+def payload_key() -> bytes:
+    secret = (constants.MIRROR_JOB_SECRET or settings.SECRET_KEY).encode()
+    return hmac.new(secret, b'mirror-job-payload', hashlib.sha256).digest()
+
+
+class MirrorJob(models.Model):
+    """Durable queue entry holding the input of a MirrorAnalysis until a worker has processed it"""
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    analysis = models.OneToOneField(MirrorAnalysis, on_delete=models.CASCADE, related_name='job')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+
+    # Encrypted, compressed chat, dropped as soon as the job finishes or fails
+    payload = models.BinaryField(null=True, blank=True)
+
+    attempts = models.PositiveIntegerField(default=0)
+    lease_owner = models.CharField(max_length=128, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'mirror_jobs'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='mirror_jobs_status_created'),
+            models.Index(fields=['status', 'lease_expires_at'], name='mirror_jobs_status_lease'),
+        ]
+
+    def __str__(self):
+        return f"MirrorJob {self.analysis_id} - {self.status}"
+
+    @staticmethod
+    def encode_payload(chat_data: MessageStore, analysis_id) -> bytes:
+        """gzip-compressed MessageStore sealed with AES-GCM under the server key, bound to its analysis"""
+        nonce = os.urandom(PAYLOAD_NONCE_SIZE)
+        plain = gzip.compress(chat_data.to_bytes(), compresslevel=6)
+        return PAYLOAD_MAGIC + nonce + AESGCM(payload_key()).encrypt(nonce, plain, str(analysis_id).encode())
+
+    def load_payload(self) -> MessageStore:
+        if self.payload is None:
+            return MessageStore.from_dicts([])
+        payload = bytes(self.payload)
+        if payload.startswith(PAYLOAD_MAGIC):
+            head = len(PAYLOAD_MAGIC) + PAYLOAD_NONCE_SIZE
+            nonce, ct = payload[len(PAYLOAD_MAGIC) : head], payload[head:]
+            payload = AESGCM(payload_key()).decrypt(nonce, ct, str(self.analysis_id).encode())
+        # Jobs queued before payloads were encrypted hold the bare gzip
+        data = gzip.decompress(payload)
+        if data.startswith(MESSAGE_STORE_MAGIC):
+            return MessageStore.from_bytes(data)
+        # Jobs queued before payloads were MessageStores hold a JSON list of messages
+        return MessageStore.from_dicts(json.loads(data))
+
+
+class UploadSession(models.Model):
+    """Resumable upload of a compressed process request body, kept part by part in UploadPart rows"""
+
+    STATUS_CHOICES = [
+        ('open', 'Open'),
+        ('finalizing', 'Finalizing'),
+        ('finalized', 'Finalized'),
+    ]
+
+    CONTENT_CHOICES = [
+        ('request', 'Process request body'),
+        ('export', 'Raw chat export'),
+    ]
+
+    ENCODINGS = ('gzip', 'zstd', 'identity')
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='open')
+    encoding = models.CharField(max_length=20, default='gzip')
+    content = models.CharField(max_length=20, choices=CONTENT_CHOICES, default='request')
+
+    # Bytes of the encoded stream acknowledged so far, the next part must start here
+    offset = models.BigIntegerField(default=0)
+    parts = models.PositiveIntegerField(default=0)
+    # Declared encoded size, if the client knows it up front
+    total_bytes = models.BigIntegerField(null=True, blank=True)
+    # Senders and message counts of a raw export, filled in on the first summary request
+    summary = models.JSONField(null=True, blank=True)
+
+    analysis = models.OneToOneField(
+        MirrorAnalysis, null=True, blank=True, on_delete=models.SET_NULL, related_name='upload_session'
+    )
+    # When the request parsing a 'finalizing' session claimed it, older claims are taken over
+    finalizing_since = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'mirror_upload_sessions'
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['expires_at'], name='mirror_upload_expires')]
+
+    def __str__(self):
+        return f"UploadSession {self.id} - {self.status} at {self.offset}"
+
+
+class UploadPart(models.Model):
+    """One acknowledged part of an upload session, in the database so any web process can take the next one"""
+
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='upload_parts')
+    # Where the part starts in the encoded stream
+    offset = models.BigIntegerField()
+    size = models.PositiveIntegerField()
+    data = models.BinaryField()
+
+    class Meta:
+        db_table = 'mirror_upload_parts'
+        constraints = [models.UniqueConstraint(fields=['session', 'offset'], name='mirror_upload_part_offset')]
+
+    def __str__(self):
+        return f"UploadPart {self.session_id} at {self.offset}"
+
+
+class LLMCacheEntry(models.Model):
+    """Sealed chat completion shared between processes, see llm_cache.py. Holds nothing readable without the request."""
+
+    # Keyed hash of the canonical request, unrelated to the key the blob is encrypted with
+    id = models.CharField(primary_key=True, max_length=64)
+    model = models.CharField(max_length=64)
+    blob = models.BinaryField()
+    size = models.PositiveIntegerField()
+
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'mirror_llm_cache'
+        indexes = [
+            models.Index(fields=['expires_at'], name='mirror_llm_cache_expires'),
+            models.Index(fields=['last_used_at'], name='mirror_llm_cache_used'),
+        ]
+
+    def __str__(self):
+        return f"LLMCacheEntry {self.id[:12]} - {self.model}"
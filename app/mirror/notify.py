@@ -0,0 +1,148 @@
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict
+
+from django.db import connection, connections
+
+log = logging.getLogger(__name__)
+
+CHANNEL = 'mirror_analysis'
+# NOTIFY payloads must stay under 8000 bytes
+MAX_ERROR_CHARS = 1000
+
+
+class Subscription:
+    """Latest published state of one analysis, for a single waiting client. Older states are dropped."""
+
+    def __init__(self, notifier: 'Notifier', analysis_id: str):
+        self.notifier = notifier
+        self.analysis_id = analysis_id
+        self._state: Dict[str, Any] | None = None
+        self._condition = threading.Condition()
+
+    def deliver(self, state: Dict[str, Any]):
+        with self._condition:
+            self._state = state
+            self._condition.notify_all()
+
+    def wait(self, timeout: float) -> Dict[str, Any] | None:
+        """The next published state, or None if nothing was published within `timeout` seconds"""
+        with self._condition:
+            if self._state is None:
+                self._condition.wait(timeout)
+            state, self._state = self._state, None
+        return state
+
+    def close(self):
+        self.notifier.unsubscribe(self)
+
+
+class Notifier:
+    """Fans analysis status changes out to the clients waiting on them.
+
+    Within a process states are handed to subscribers directly. With Postgres they go through
+    NOTIFY instead, and one LISTEN connection per process delivers them, so a change made by a job
+    in any worker or node reaches every process without clients querying the database.
+    """
+
+    RECONNECT_SECONDS = 5.0
+
+    def __init__(self):
+        self._subscriptions: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._listener: threading.Thread | None = None
+        self._listening = False
+        self._published = 0
+        self._delivered = 0
+
+    @property
+    def cross_process(self) -> bool:
+        """Whether states published by other processes arrive here"""
+        return connection.vendor == 'postgresql'
+
+    def subscribe(self, analysis_id: str) -> Subscription:
+        if self.cross_process:
+            self._ensure_listening()
+        subscription = Subscription(self, analysis_id)
+        with self._lock:
+            self._subscriptions.setdefault(analysis_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.analysis_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.analysis_id]
+
+    def publish(self, analysis_id: str, state: Dict[str, Any]):
+        """Announce the new state of an analysis. Never raises, a lost update only delays clients."""
+        if state.get('error_message'):
+            state = {**state, 'error_message': state['error_message'][:MAX_ERROR_CHARS]}
+        with self._lock:
+            self._published += 1
+        if not self.cross_process:
+            self.dispatch(analysis_id, state)
+            return
+        try:
+            payload = json.dumps({'id': analysis_id, 'state': state}, ensure_ascii=False)
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, payload])
+        except Exception as e:
+            log.warning(f"Could not publish the state of {analysis_id}: {e}")
+
+    def dispatch(self, analysis_id: str, state: Dict[str, Any]):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(analysis_id, ()))
+            self._delivered += len(subscribers)
+        for subscription in subscribers:
+            subscription.deliver(state)
+
+    def _ensure_listening(self):
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name='mirror-notify', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        while True:
+            wrapper = connections.create_connection('default')
+            try:
+                wrapper.ensure_connection()
+                wrapper.set_autocommit(True)
+                wrapper.connection.execute(f'LISTEN {CHANNEL}')
+                self._listening = True
+                log.info(f"Listening for analysis updates on {CHANNEL}")
+                for note in wrapper.connection.notifies():
+                    try:
+                        message = json.loads(note.payload)
+                        self.dispatch(message['id'], message['state'])
+                    except (ValueError, KeyError) as e:
+                        log.warning(f"Ignoring malformed {CHANNEL} notification: {e}")
+            except Exception as e:
+                log.warning(f"Lost the {CHANNEL} listener connection, reconnecting: {e}")
+            finally:
+                self._listening = False
+                try:
+                    wrapper.close()
+                except Exception:
+                    pass
+            time.sleep(self.RECONNECT_SECONDS)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'cross_process': self.cross_process,
+                'listening': self._listening,
+                'watched_analyses': len(self._subscriptions),
+                'subscribers': sum(len(s) for s in self._subscriptions.values()),
+                'published_total': self._published,
+                'delivered_total': self._delivered,
+            }
+
+
+notifier = Notifier()
@@ -0,0 +1,69 @@
+import math
+from dataclasses import dataclass
+from typing import List
+
+from app import constants
+from .messages import MessageStore
+from .tokens import DEFAULT_CONTEXT_WINDOW, MODEL_CONTEXT_WINDOWS, calibration, estimate_text_tokens
+
+# System prompt, instructions and the structured output that share the window with the chat
+PROMPT_RESERVED_TOKENS = 12000
+
+
+@dataclass
+class AnalysisPlan:
+    mode: str  # 'single' or 'timeline'
+    total_tokens: int
+    budget: int
+
+    @property
+    def min_periods(self) -> int:
+        """Fewest prompts the chat must be spread over to keep each one within budget"""
+        return max(1, math.ceil(self.total_tokens / self.budget))
+
+
+def prompt_token_budget(model: str) -> int:
+    window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    return max(1000, int(window * constants.PROMPT_CONTEXT_FRACTION) - PROMPT_RESERVED_TOKENS)
+
+
+def chat_tokens(messages: MessageStore) -> int:
+    return calibration.apply(sum(messages.token_counts()))
+
+
+def plan_analysis(messages: MessageStore, model: str) -> AnalysisPlan:
+    """Single pass if the whole chat fits one prompt, otherwise a timeline over several periods"""
+    budget = prompt_token_budget(model)
+    total = chat_tokens(messages)
+    return AnalysisPlan(mode='single' if total <= budget else 'timeline', total_tokens=total, budget=budget)
+
+
+def text_tokens(text: str) -> int:
+    return calibration.apply(estimate_text_tokens(text))
+
+
+def split_by_budget(tokens: List[int], budget: int, max_items: int | None = None) -> List[int]:
+    """Start indices of the fewest consecutive runs of items that keep each run within `budget` tokens
+    and `max_items` items, sized evenly. An item over budget gets a run of its own."""
+    total = sum(tokens)
+    runs = max(1, math.ceil(total / budget), math.ceil(len(tokens) / max_items) if max_items else 1)
+    target = total / runs
+    starts = [0]
+    used = 0
+    for i, n in enumerate(tokens):
+        start = starts[-1]
+        if i > start and (used + n > budget or used + n / 2 > target or (max_items and i - start >= max_items)):
+            starts.append(i)
+            used = 0
+        used += n
+    return starts
+
+
+def split_messages_by_tokens(messages: MessageStore, budget: int) -> List[MessageStore]:
+    """Cut consecutive messages into the fewest runs that keep each prompt within `budget`, sized evenly"""
+    tokens = [calibration.apply(n) for n in messages.token_counts()]
+    if sum(tokens) <= budget:
+        return [messages] if len(messages) else []
+
+    starts = split_by_budget(tokens, budget)
+    return [messages[start:end] for start, end in zip(starts, starts[1:] + [len(messages)])]
@@ -1,47 +1,40 @@
+import asyncio
+import bisect
 import json
 import logging
-import os
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List
 
-from openai import AsyncOpenAI
 from openai.types.chat import ChatCompletionSystemMessageParam
 from openai.types.shared_params import ResponseFormatJSONSchema
 
+from app import constants
+from app.constants import ChatModel
+from . import progress
+from .dates import INVALID, from_epoch, parse_datetime, to_epoch
+from .messages import MessageStore
+from .planner import (
+    AnalysisPlan,
+    plan_analysis,
+    prompt_token_budget,
+    split_by_budget,
+    split_messages_by_tokens,
+    text_tokens,
+)
+from .resilience import complete
 from .schemas import MirrorAnalysisSchema, TimelineAnalysisSchema, TimelinePeriodSchema
 
-# Set up OpenAI API key from environment
-api_key = os.getenv('OPENAI_API_KEY')
-if not api_key:
-    raise ValueError("OPENAI_API_KEY environment variable not set")
-
-# Initialize OpenAI client
-client = AsyncOpenAI(api_key=api_key)
-
-# Constants for chunk processing
-LARGE_FILE_THRESHOLD = 25000  # 50k messages
-CHUNK_SIZE = 20000  # Process 20k messages per chunk
+ANALYSIS_MODEL = ChatModel.GPT4_1.value
 
 log = logging.getLogger(__name__)
 
 
-async def call_gpt_api(chat_data: List[Dict[str, Any]], person_name: str, language: str = 'ru') -> Dict[str, Any]:
-    """Call GPT API to analyze patient data using structured output"""
-    try:
-        # Prepare the data for analysis
-        chat_text = "\n".join([f"{msg.get('sender', 'User')}: {msg.get('text', '')}" for msg in chat_data])
-
-        # Extract conversation examples (up to 20)
-        conversation_examples = []
-        for msg in chat_data[:20]:
-            if msg.get('text', '').strip():
-                conversation_examples.append(
-                    {'sender': msg.get('sender', 'User'), 'text': msg.get('text', ''), 'date': msg.get('date', '')}
-                )
-
-        # Create the system prompt based on language
-        if language == 'en':
-            system_prompt = """You are a brilliant, insightful, and slightly provocative psychologist who sees through people's facades. 
+def analysis_prompts(chat_text: str, person_name: str, language: str = 'ru') -> tuple[str, str]:
+    """System and user prompt of the single-call analysis"""
+    # Create the system prompt based on language
+    if language == 'en':
+        system_prompt = """You are a brilliant, insightful, and slightly provocative psychologist who sees through people's facades. 
 
 Your job is to provide a DEEP, BOLD, and HONEST psychological analysis that cuts through the surface and reveals what's really going on. Be insightful, be direct, be compassionate but don't sugarcoat.
 
@@ -68,8 +61,8 @@ Be thorough, insightful, and provide deep psychological insights with abundant e
 IMPORTANT FORMATTING: When providing lists, use ONLY clean text without numbers, bullets, or other formatting symbols. Just provide clean, descriptive text for each item.
 
 Don't be afraid to be bold and direct - this is about real psychological insight, not surface-level observations. But always back up your insights with concrete evidence from their communication."""
-        else:  # Russian (default)
-            system_prompt = """Вы - блестящий, проницательный и слегка провокационный психолог, который видит сквозь людские фасады.
+    else:  # Russian (default)
+        system_prompt = """Вы - блестящий, проницательный и слегка провокационный психолог, который видит сквозь людские фасады.
 
 Ваша задача - предоставить ГЛУБОКИЙ, СМЕЛЫЙ и ЧЕСТНЫЙ психологический анализ, который проникает сквозь поверхность и раскрывает, что на самом деле происходит. Будьте проницательными, прямыми, сострадательными, но не приукрашивайте.
 
@@ -97,9 +90,9 @@ Don't be afraid to be bold and direct - this is about real psychological insight
 
 Не бойтесь быть смелыми и прямыми - это о реальном психологическом понимании, а не о поверхностных наблюдениях. Но всегда подкрепляйте ваши инсайты конкретными доказательствами из их общения."""
 
-        # Create the user prompt based on language
-        if language == 'en':
-            user_prompt = f"""Based on this data, provide a detailed analysis in the following JSON format:
+    # Create the user prompt based on language
+    if language == 'en':
+        user_prompt = f"""Based on this data, provide a detailed analysis in the following JSON format:
 
 Person Name: {person_name}
 
@@ -119,8 +112,8 @@ CRITICAL REQUIREMENTS:
 Don't just describe what you see - dig deeper and tell me what's driving their behavior, what patterns they're stuck in, and what they need to work on. But ALWAYS back up your insights with concrete evidence from their actual communication.
 
 Be honest, be direct, be compassionate but real. This is about genuine psychological insight with solid evidence, not surface-level observations."""
-        else:  # Russian (default)
-            user_prompt = f"""На основе этих данных предоставьте подробный анализ в следующем JSON формате:
+    else:  # Russian (default)
+        user_prompt = f"""На основе этих данных предоставьте подробный анализ в следующем JSON формате:
 
 Имя человека: {person_name}
 
@@ -141,9 +134,26 @@ Be honest, be direct, be compassionate but real. This is about genuine psycholog
 
 Будьте честными, прямыми, сострадательными, но реальными. Это о подлинном психологическом понимании с твердыми доказательствами, а не о поверхностных наблюдениях."""
 
-        # Make the API call with structured output
-        response = await client.chat.completions.create(
-            model="gpt-4.1",
+    return system_prompt, user_prompt
+
+
+async def call_gpt_api(chat_data: MessageStore, person_name: str, language: str = 'ru') -> Dict[str, Any]:
+    """Call GPT API to analyze patient data using structured output"""
+    try:
+        # Prepare the data for analysis
+        chat_text = chat_data.transcript()
+
+        # Extract conversation examples (up to 20)
+        conversation_examples = [msg for msg in chat_data[:20] if msg['text'].strip()]
+
+        system_prompt, user_prompt = analysis_prompts(chat_text, person_name, language)
+
+        # Make the API call with structured output, streamed so the job can report each section
+        call = progress.track(MirrorAnalysisSchema.model_fields, per_field=True)
+        response = await complete(
+            'analysis',
+            progress=call,
+            model=ANALYSIS_MODEL,
             messages=[
                 ChatCompletionSystemMessageParam(role="system", content=system_prompt),
                 {"role": "user", "content": user_prompt},
@@ -164,6 +174,8 @@ Be honest, be direct, be compassionate but real. This is about genuine psycholog
         # Validate with Pydantic
         analysis = MirrorAnalysisSchema.model_validate(result_data)
 
+        progress.finish(call)
+
         # Convert back to dict and add conversation examples
         result = analysis.model_dump()
         result['actual_chat_examples'] = conversation_examples
@@ -181,7 +193,7 @@ Be honest, be direct, be compassionate but real. This is about genuine psycholog
 
 
 async def call_gpt_api_timeline_period(
-    chat_data: List[Dict[str, Any]],
+    chat_data: MessageStore,
     person_name: str,
     period_name: str,
     start_date: str,
@@ -191,7 +203,7 @@ async def call_gpt_api_timeline_period(
     """Call GPT API to analyze a specific timeline period"""
     try:
         # Prepare the data for analysis
-        chat_text = "\n".join([f"{msg.get('sender', 'User')}: {msg.get('text', '')}" for msg in chat_data])
+        chat_text = chat_data.transcript()
 
         # Create the system prompt for timeline period analysis
         system_prompt = """You are a brilliant, insightful psychologist analyzing a specific time period in someone's life through their communication patterns.
@@ -245,9 +257,12 @@ Don't just describe what you see - dig deeper and tell me what was driving their
 
 Be honest, be direct, be compassionate but real. This is about genuine psychological insight with solid evidence, not surface-level observations."""
 
-        # Make the API call with structured output
-        response = await client.chat.completions.create(
-            model="gpt-4.1",
+        # Make the API call with structured output, the period counts as partly done as its fields arrive
+        call = progress.track(TimelinePeriodSchema.model_fields)
+        response = await complete(
+            'period',
+            progress=call,
+            model=ANALYSIS_MODEL,
             messages=[
                 ChatCompletionSystemMessageParam(role="system", content=system_prompt),
                 {"role": "user", "content": user_prompt},
@@ -267,6 +282,7 @@ Be honest, be direct, be compassionate but real. This is about genuine psycholog
 
         # Validate with Pydantic
         analysis = TimelinePeriodSchema.model_validate(result_data)
+        progress.finish(call)
 
         # Convert back to dict
         result = analysis.model_dump()
@@ -282,25 +298,84 @@ Be honest, be direct, be compassionate but real. This is about genuine psycholog
         return {"error": f"GPT API Error: {str(e)}"}
 
 
+def period_summary_text(period: Dict[str, Any]) -> str:
+    """A period analysis as it is quoted in the merge and timeline prompts"""
+    return (
+        f"Period: {period['period_name']} ({format_date_russian(period['start_date'])} - {format_date_russian(period['end_date'])})\n"
+        f"Personality: {period['personality_during_period']}\n"
+        f"Key Events: {', '.join(period['key_events'])}\n"
+        f"Emotional State: {period['emotional_state']}\n"
+        f"Communication Patterns: {', '.join(period['communication_patterns'])}\n"
+        f"Emotional Triggers: {', '.join(period.get('emotional_triggers', []))}\n"
+        f"Coping Mechanisms: {', '.join(period.get('coping_mechanisms', []))}\n"
+        f"Therapy Goals: {', '.join(period.get('therapy_goals', []))}\n"
+        f"Growth Areas: {', '.join(period.get('growth_areas', []))}\n"
+        f"Growth/Regression: {period['growth_or_regression']}"
+    )
+
+
+async def call_gpt_api_merge_periods(periods: List[Dict[str, Any]], person_name: str) -> Dict[str, Any]:
+    """Call GPT API to combine the analyses of consecutive periods into one analysis of the span they cover"""
+    try:
+        periods_text = "\n\n".join(period_summary_text(period) for period in periods)
+        start_date, end_date = periods[0]['start_date'], periods[-1]['end_date']
+
+        system_prompt = """You are a brilliant, insightful psychologist condensing the analyses of several consecutive time periods in someone's life into one analysis of the whole span they cover.
+
+Your analysis will be combined with others like it into an analysis of the person's entire timeline, so keep what matters for that: how they changed from the first of these periods to the last, the events and turning points that drove the change, and the specific examples, quotes and evidence behind every observation. Drop repetition, not evidence.
+
+Write everything in Russian and refer to the person in THIRD PERSON (using their name or pronouns он/она/они, never "you" or "I").
+
+IMPORTANT FORMATTING: When providing lists, use ONLY clean text without numbers, bullets, or other formatting symbols. Just provide clean, descriptive text for each item."""
+
+        user_prompt = f"""Combine these analyses of consecutive periods into one analysis of the whole span in the following JSON format:
+
+Person Name: {person_name}
+Start Date: {start_date}
+End Date: {end_date}
+
+Period Analyses:
+{periods_text}
+
+Name the span after what characterized it. Keep the most telling examples and quotes from each period, and make clear how the person changed across them."""
+
+        # One merge is one section of its level
+        call = progress.track(TimelinePeriodSchema.model_fields)
+        response = await complete(
+            'merge',
+            progress=call,
+            model=ANALYSIS_MODEL,
+            messages=[
+                ChatCompletionSystemMessageParam(role="system", content=system_prompt),
+                {"role": "user", "content": user_prompt},
+            ],
+            response_format=ResponseFormatJSONSchema(
+                json_schema=TimelinePeriodSchema.json_schema(), type='json_schema'
+            ),
+            temperature=0.7,
+        )
+
+        content = response.choices[0].message.content
+        if not content:
+            return {"error": "Empty response from GPT"}
+
+        analysis = TimelinePeriodSchema.model_validate(json.loads(content))
+        progress.finish(call)
+
+        # The span is exactly the one of its periods, whatever dates the model wrote
+        return {**analysis.model_dump(), 'start_date': start_date, 'end_date': end_date}
+
+    except Exception as e:
+        log.info(f"Error calling GPT API for period merge: {e}")
+        log.exception("Exception in call_gpt_api_merge_periods")
+        return {"error": f"GPT API Error: {str(e)}"}
+
+
 async def call_gpt_api_timeline_analysis(period_analyses: List[Dict[str, Any]], person_name: str) -> Dict[str, Any]:
     """Call GPT API to create a comprehensive timeline analysis from multiple period analyses"""
     try:
         # Prepare the period analyses data
-        periods_text = "\n\n".join(
-            [
-                f"Period: {period['period_name']} ({format_date_russian(period['start_date'])} - {format_date_russian(period['end_date'])})\n"
-                f"Personality: {period['personality_during_period']}\n"
-                f"Key Events: {', '.join(period['key_events'])}\n"
-                f"Emotional State: {period['emotional_state']}\n"
-                f"Communication Patterns: {', '.join(period['communication_patterns'])}\n"
-                f"Emotional Triggers: {', '.join(period.get('emotional_triggers', []))}\n"
-                f"Coping Mechanisms: {', '.join(period.get('coping_mechanisms', []))}\n"
-                f"Therapy Goals: {', '.join(period.get('therapy_goals', []))}\n"
-                f"Growth Areas: {', '.join(period.get('growth_areas', []))}\n"
-                f"Growth/Regression: {period['growth_or_regression']}"
-                for period in period_analyses
-            ]
-        )
+        periods_text = "\n\n".join(period_summary_text(period) for period in period_analyses)
 
         # Create the system prompt for timeline analysis
         system_prompt = """You are a brilliant, insightful psychologist analyzing someone's personality evolution over time through multiple time periods.
@@ -353,9 +428,12 @@ Don't just describe what you see - dig deeper and tell me what has driven their
 
 Be honest, be direct, be compassionate but real. This is about genuine psychological insight with solid evidence, not surface-level observations."""
 
-        # Make the API call with structured output
-        response = await client.chat.completions.create(
-            model="gpt-4.1",
+        # Make the API call with structured output, streamed so the job can report each section
+        call = progress.track(TimelineAnalysisSchema.model_fields, per_field=True)
+        response = await complete(
+            'timeline',
+            progress=call,
+            model=ANALYSIS_MODEL,
             messages=[
                 ChatCompletionSystemMessageParam(role="system", content=system_prompt),
                 {"role": "user", "content": user_prompt},
@@ -375,6 +453,7 @@ Be honest, be direct, be compassionate but real. This is about genuine psycholog
 
         # Validate with Pydantic
         analysis = TimelineAnalysisSchema.model_validate(result_data)
+        progress.finish(call)
 
         # Convert back to dict
         result = analysis.model_dump()
@@ -392,18 +471,8 @@ Be honest, be direct, be compassionate but real. This is about genuine psycholog
 
 
 def parse_date(date_str: str) -> datetime:
-    """Parse date string to datetime object"""
-    try:
-        # Try different date formats
-        for fmt in ['%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%SZ']:
-            try:
-                return datetime.strptime(date_str, fmt)
-            except ValueError:
-                continue
-        # If none work, return current date
-        return datetime.now()
-    except:
-        return datetime.now()
+    """Parse date string to datetime object, raises ValueError for unknown formats"""
+    return parse_datetime(date_str)
 
 
 def format_date_russian(date_str: str) -> str:
@@ -468,7 +537,8 @@ async def get_gpt_period_names(chunks, person_name, language: str = 'ru'):
         """
 
         # Call GPT API
-        response = await client.chat.completions.create(
+        response = await complete(
+            'period_names',
             model="gpt-4o-mini",
             messages=[
                 {
@@ -477,7 +547,8 @@ async def get_gpt_period_names(chunks, person_name, language: str = 'ru'):
                 },
                 {"role": "user", "content": prompt},
             ],
-            max_tokens=200,
+            # A few words per period, timelines of large chats have dozens of them
+            max_tokens=max(200, 16 * len(chunks)),
             temperature=0.7,
         )
 
@@ -498,17 +569,37 @@ async def get_gpt_period_names(chunks, person_name, language: str = 'ru'):
         return [chunk['period_name'] for chunk in chunks]
 
 
-def create_time_chunks(chat_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Create time-based chunks from chat data"""
-    if not chat_data:
+def period_name_for(i: int, num_chunks: int) -> str:
+    """Default Russian name of the i-th of `num_chunks` periods"""
+    if i == 0:
+        return "Начальный период"
+    if i == num_chunks - 1:
+        return "Последний период"
+    if num_chunks == 4:
+        if i == 1:
+            return "Второй период"
+        if i == 2:
+            return "Третий период"
+        return f"Период {i + 1}"
+    return "Средний период"
+
+
+def create_time_chunks(chat_data: MessageStore) -> List[Dict[str, Any]]:
+    """Create time-based chunks from chat data.
+
+    Dates were parsed into epochs when the store was built, messages are ordered by an index sort over them
+    and period boundaries are found by binary search, so the cost is O(n log n) whatever the chunk count.
+    Every period is a view over the sorted store.
+    """
+    if not len(chat_data):
         return []
 
-    # Sort messages by date
-    sorted_messages = sorted(chat_data, key=lambda x: parse_date(x.get('date', '')))
+    # Messages without a valid date sort last and stay out of the periods
+    sorted_messages = chat_data.sorted_by_time().compact()
+    sorted_timestamps = sorted_messages.epochs
+    dated_count = bisect.bisect_left(sorted_timestamps, INVALID)
 
-    # Get date range
-    dates = [parse_date(msg.get('date', '')) for msg in sorted_messages if msg.get('date')]
-    if not dates:
+    if not dated_count:
         return [
             {
                 'messages': sorted_messages,
@@ -518,8 +609,8 @@ def create_time_chunks(chat_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             }
         ]
 
-    min_date = min(dates)
-    max_date = max(dates)
+    min_date = from_epoch(sorted_timestamps[0])
+    max_date = from_epoch(sorted_timestamps[dated_count - 1])
     total_days = (max_date - min_date).days
 
     # If less than 30 days, don't chunk
@@ -533,9 +624,6 @@ def create_time_chunks(chat_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             }
         ]
 
-    # Create time-based chunks instead of message-count-based chunks
-    chunks = []
-
     # Calculate optimal number of periods based on time span
     if total_days > 365:  # More than a year
         num_chunks = 4
@@ -545,64 +633,74 @@ def create_time_chunks(chat_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     # Calculate time-based chunk size
     chunk_days = total_days // num_chunks
 
+    # Each period owns [its start, next period's start), so every dated message lands in exactly one
+    starts = [min_date + timedelta(days=i * chunk_days) for i in range(num_chunks)]
+    cuts = [0]
+    cuts += [bisect.bisect_left(sorted_timestamps, to_epoch(start), 0, dated_count) for start in starts[1:]]
+    cuts.append(dated_count)
+
+    chunks = []
     for i in range(num_chunks):
-        # Calculate start and end dates for this chunk
-        chunk_start = min_date + timedelta(days=i * chunk_days)
         if i == num_chunks - 1:  # Last chunk
             chunk_end = max_date
         else:
-            chunk_end = min_date + timedelta(days=(i + 1) * chunk_days) - timedelta(days=1)
-
-        # Find messages that fall within this time period
-        chunk_messages = [
-            msg
-            for msg in sorted_messages
-            if msg.get('date') and chunk_start <= parse_date(msg.get('date', '')) <= chunk_end
-        ]
-
-        # Create meaningful period names in Russian
-        if i == 0:
-            period_name = "Начальный период"
-        elif i == num_chunks - 1:
-            period_name = "Последний период"
-        else:
-            if num_chunks == 4:
-                if i == 1:
-                    period_name = "Второй период"
-                elif i == 2:
-                    period_name = "Третий период"
-                else:
-                    period_name = f"Период {i + 1}"
-            else:
-                period_name = "Средний период"
+            chunk_end = starts[i + 1] - timedelta(days=1)
 
         chunks.append(
             {
-                'messages': chunk_messages,
-                'start_date': format_date_russian(chunk_start.strftime('%Y-%m-%d')),
+                'messages': sorted_messages[cuts[i] : cuts[i + 1]],
+                'start_date': format_date_russian(starts[i].strftime('%Y-%m-%d')),
                 'end_date': format_date_russian(chunk_end.strftime('%Y-%m-%d')),
-                'period_name': period_name,
+                'period_name': period_name_for(i, num_chunks),
             }
         )
 
     return chunks
 
 
+def split_oversized_chunks(chunks: List[Dict[str, Any]], token_budget: int) -> List[Dict[str, Any]]:
+    """Split every chunk whose messages exceed the prompt token budget into consecutive sub-periods"""
+    result = []
+    for chunk in chunks:
+        parts = split_messages_by_tokens(chunk['messages'], token_budget)
+        if len(parts) <= 1:
+            result.append(chunk)
+            continue
+
+        log.info(f"Splitting period {chunk['period_name']} into {len(parts)} parts to fit the token budget")
+        for i, messages in enumerate(parts):
+            result.append(
+                {
+                    'messages': messages,
+                    'start_date': format_date_russian(messages[0]['date']),
+                    'end_date': format_date_russian(messages[-1]['date']),
+                    'period_name': f"{chunk['period_name']} ({i + 1}/{len(parts)})",
+                }
+            )
+    return result
+
+
 async def process_patient_data(
-    chat_data: List[Dict[str, Any]], person_name: str, language: str = 'ru'
+    chat_data: MessageStore | List[Dict[str, Any]], person_name: str, language: str = 'ru'
 ) -> Dict[str, Any]:
     """Main function to process patient data and return insights"""
     try:
         log.info(f"Processing data for: {person_name}")
         # Removed logging of chat message count for privacy
-
-        # Check if this is a large file that needs timeline processing
-        if len(chat_data) > LARGE_FILE_THRESHOLD:
+        if not isinstance(chat_data, MessageStore):
+            chat_data = MessageStore.from_dicts(chat_data)
+        progress.begin('preparing', 0, 0)
+
+        # Check if the chat is too large for a single prompt and needs timeline processing
+        plan = plan_analysis(chat_data, ANALYSIS_MODEL)
+        log.info(f"Chat is ~{plan.total_tokens} tokens against a budget of {plan.budget} per prompt")
+        if plan.mode == 'timeline':
             log.info("Large file detected, using timeline processing")
-            return await process_large_file_timeline(chat_data, person_name, language)
+            return await process_large_file_timeline(chat_data, person_name, language, plan)
         else:
             # Use original processing for smaller files
             log.info("Using standard processing for smaller file")
+            progress.begin('analyzing', 0, 99)
             result = await call_gpt_api(chat_data, person_name, language)
 
             if 'error' in result:
@@ -618,19 +716,126 @@ async def process_patient_data(
         return {"error": f"Processing Error: {str(e)}"}
 
 
+class PeriodAnalysisError(Exception):
+    def __init__(self, result: Dict[str, Any]):
+        self.result = result
+        super().__init__(result.get('error'))
+
+
+async def run_all(
+    calls: List[Callable[[], Awaitable[Dict[str, Any]]]], concurrency: int | None = None
+) -> List[Dict[str, Any]] | Dict[str, Any]:
+    """Run the calls concurrently, at most `concurrency` at a time.
+
+    Returns their results in order, or the error dict of the first call that failed,
+    in which case the calls still in flight are cancelled.
+    """
+    semaphore = asyncio.Semaphore(concurrency or constants.TIMELINE_PERIOD_CONCURRENCY)
+
+    async def run(call: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        async with semaphore:
+            result = await call()
+        if 'error' in result:
+            raise PeriodAnalysisError(result)
+        return result
+
+    error = None
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(run(call)) for call in calls]
+    except* PeriodAnalysisError as eg:
+        error = eg.exceptions[0].result
+
+    if error is not None:
+        return error
+    return [task.result() for task in tasks]
+
+
+async def analyze_periods(
+    chunks: List[Dict[str, Any]], person_name: str, language: str = 'ru', concurrency: int | None = None
+) -> List[Dict[str, Any]] | Dict[str, Any]:
+    """Analyze all periods concurrently, see run_all"""
+
+    async def analyze(i: int, chunk: Dict[str, Any]) -> Dict[str, Any]:
+        log.info(f"Processing chunk {i+1}/{len(chunks)}: {chunk['period_name']}")
+        period_result = await call_gpt_api_timeline_period(
+            chunk['messages'], person_name, chunk['period_name'], chunk['start_date'], chunk['end_date'], language
+        )
+        if 'error' in period_result:
+            log.info(f"Error processing period {chunk['period_name']}: {period_result['error']}")
+        return period_result
+
+    return await run_all([partial(analyze, i, chunk) for i, chunk in enumerate(chunks)], concurrency)
+
+
+def merge_groups(
+    periods: List[Dict[str, Any]], budget: int, fan_in: int | None = None
+) -> List[List[Dict[str, Any]]] | None:
+    """Consecutive groups of sibling analyses for the next level of merges, None once they fit one timeline prompt"""
+    fan_in = fan_in or constants.TIMELINE_MERGE_FAN_IN
+    tokens = [text_tokens(period_summary_text(period)) for period in periods]
+    if len(periods) < 2 or len(periods) <= fan_in and sum(tokens) <= budget:
+        return None
+
+    starts = split_by_budget(tokens, budget, fan_in)
+    if len(starts) == len(periods):
+        # Every analysis is over budget on its own, merge them by fan-in alone rather than never shrink
+        log.warning(f"Period analyses average {sum(tokens) // len(tokens)} tokens against a budget of {budget}")
+        starts = list(range(0, len(periods), fan_in))
+    groups = [periods[start:end] for start, end in zip(starts, starts[1:] + [len(periods)])]
+    if all(len(group) < 2 for group in groups):
+        # Nothing left to combine, another level would only repeat this one
+        return None
+    return groups
+
+
+async def reduce_periods(
+    period_analyses: List[Dict[str, Any]],
+    person_name: str,
+    budget: int,
+    span: tuple[float, float],
+    fan_in: int | None = None,
+) -> List[Dict[str, Any]] | Dict[str, Any]:
+    """Merge sibling period analyses level by level until they fit one timeline prompt.
+
+    The merges of a level run concurrently, so a chat of any size takes about log(leaves) / log(fan_in)
+    rounds. Each level takes half of what is left of the `span` of progress. A group of one analysis moves up
+    a level as it is, and after TIMELINE_MAX_MERGE_DEPTH levels the timeline prompt gets whatever is left.
+    """
+    level = period_analyses
+    depth = 0
+    while (groups := merge_groups(level, budget, fan_in)) is not None:
+        if depth == constants.TIMELINE_MAX_MERGE_DEPTH:
+            log.warning(f"{len(level)} period analyses still over budget after {depth} levels of merges")
+            break
+        depth += 1
+        merges = [group for group in groups if len(group) > 1]
+        start, end = span
+        progress.begin('merging', end - (end - start) / 2 ** (depth - 1), end - (end - start) / 2**depth, len(merges))
+        log.info(f"Merging {len(level)} period analyses into {len(groups)} at level {depth}")
+        merged = await run_all([partial(call_gpt_api_merge_periods, group, person_name) for group in merges])
+        if isinstance(merged, dict):
+            return merged
+        merged = iter(merged)
+        level = [next(merged) if len(group) > 1 else group[0] for group in groups]
+    return level
+
+
 async def process_large_file_timeline(
-    chat_data: List[Dict[str, Any]], person_name: str, language: str = 'ru'
+    chat_data: MessageStore, person_name: str, language: str = 'ru', plan: AnalysisPlan | None = None
 ) -> Dict[str, Any]:
     """Process large files using timeline analysis"""
     try:
         log.info("Starting timeline processing for large file")
 
-        # Create time chunks
-        chunks = create_time_chunks(chat_data)
+        # Create time chunks, then split periods that still don't fit into one prompt
+        budget = plan.budget if plan else prompt_token_budget(ANALYSIS_MODEL)
+        chunks = split_oversized_chunks(create_time_chunks(chat_data), budget)
         log.info(f"Created {len(chunks)} time chunks")
 
         # Get GPT-generated period names
         log.info("Getting GPT-generated period names")
+        progress.begin('naming_periods', 0, 5)
         gpt_period_names = await get_gpt_period_names(chunks, person_name, language)
 
         # Update chunks with GPT-generated names
@@ -638,25 +843,19 @@ async def process_large_file_timeline(
             if i < len(gpt_period_names):
                 chunk['period_name'] = gpt_period_names[i]
 
-        # Process each chunk
-        period_analyses = []
-        for i, chunk in enumerate(chunks):
-            log.info(f"Processing chunk {i+1}/{len(chunks)}: {chunk['period_name']}")
-
-            # Call GPT for this period
-            period_result = await call_gpt_api_timeline_period(
-                chunk['messages'], person_name, chunk['period_name'], chunk['start_date'], chunk['end_date'], language
-            )
-
-            if 'error' in period_result:
-                log.info(f"Error processing period {chunk['period_name']}: {period_result['error']}")
-                return period_result
-
-            period_analyses.append(period_result)
+        # Process all chunks concurrently
+        progress.begin('analyzing_periods', 5, 80, sections=len(chunks))
+        period_analyses = await analyze_periods(chunks, person_name, language)
+        if isinstance(period_analyses, dict):
+            return period_analyses
 
-        # Create comprehensive timeline analysis
+        # Merge the period analyses until they fit one prompt, then create the comprehensive timeline analysis
+        summaries = await reduce_periods(period_analyses, person_name, budget, span=(80, 90))
+        if isinstance(summaries, dict):
+            return summaries
         log.info("Creating comprehensive timeline analysis")
-        timeline_result = await call_gpt_api_timeline_analysis(period_analyses, person_name)
+        progress.begin('summarizing', 80 if summaries is period_analyses else 90, 99)
+        timeline_result = await call_gpt_api_timeline_analysis(summaries, person_name)
 
         if 'error' in timeline_result:
             log.info(f"Error in timeline analysis: {timeline_result['error']}")
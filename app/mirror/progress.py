@@ -0,0 +1,216 @@
+import asyncio
+import contextvars
+import logging
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+from django.db.models import F
+from django.utils import timezone
+
+from app import constants
+from . import db
+
+log = logging.getLogger(__name__)
+
+
+class SectionCounter:
+    """Counts the top-level fields of a structured answer as their keys show up in the streamed JSON.
+
+    Strict structured outputs emit properties in schema order, so only the next expected key is
+    looked for. Only a short tail of the text is kept between deltas.
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self.patterns = [re.compile(r'"%s"\s*:' % re.escape(name)) for name in fields]
+        self.found = 0
+        self._tail = ''
+        self._keep = max((len(p.pattern) for p in self.patterns), default=0) + 16
+
+    def feed(self, text: str) -> int:
+        buffer = self._tail + text
+        pos = 0
+        while self.found < len(self.patterns):
+            match = self.patterns[self.found].search(buffer, pos)
+            if match is None:
+                break
+            self.found += 1
+            pos = match.end()
+        self._tail = buffer[max(pos, len(buffer) - self._keep) :]
+        return self.found
+
+
+class CallProgress:
+    """How far any attempt at one streamed LLM call got.
+
+    `per_field` calls are the only call of their stage and their fields are the stage's sections,
+    otherwise the call is one section of its stage and its fields only make it partially done.
+    """
+
+    def __init__(self, job: 'JobProgress', fields: List[str], per_field: bool):
+        self.job = job
+        self.fields = fields
+        self.per_field = per_field
+        self.found = 0
+
+    @property
+    def fraction(self) -> float:
+        return self.found / len(self.fields) if self.fields else 0.0
+
+    def stream(self) -> Callable[[str], None]:
+        """on_delta callback of one attempt, retries and hedges each get their own"""
+        counter = SectionCounter(self.fields)
+
+        def on_delta(text: str):
+            found = counter.feed(text)
+            if found > self.found:
+                self.found = found
+                self.job.changed()
+
+        return on_delta
+
+
+class JobProgress:
+    """Stage, percent complete and sections done of the running analysis, persisted on its MirrorAnalysis.
+
+    Lives on the job's event loop and is only touched from it. Updates are coalesced and written at
+    most every `interval` seconds, stage changes right away.
+    """
+
+    def __init__(self, analysis_id: str, interval: float | None = None):
+        self.analysis_id = analysis_id
+        self.interval = constants.MIRROR_PROGRESS_INTERVAL if interval is None else interval
+        self.stage = ''
+        self.sections_done = 0
+        self.sections_total = 0
+        self._span = (0.0, 100.0)
+        self._calls: List[CallProgress] = []
+        self._dirty = False
+        self._written_at = 0.0
+        self._timer: asyncio.TimerHandle | None = None
+        self._write: asyncio.Task | None = None
+        self._closed = False
+
+    def begin(self, stage: str, start: float, end: float, sections: int = 0):
+        """Enter `stage`, which takes the job from `start` to `end` percent over `sections` sections"""
+        self.stage = stage
+        self._span = (start, end)
+        self.sections_done = 0
+        self.sections_total = sections
+        self._calls = []
+        self.changed(force=True)
+
+    def track(self, fields: Iterable[str], per_field: bool = False) -> CallProgress:
+        call = CallProgress(self, list(fields), per_field)
+        if per_field:
+            self.sections_total = len(call.fields)
+        self._calls.append(call)
+        return call
+
+    def finish(self, call: CallProgress):
+        """The call answered, whether streamed or from the cache"""
+        if call in self._calls:
+            self._calls.remove(call)
+            self.sections_done += len(call.fields) if call.per_field else 1
+            self.changed()
+
+    def snapshot(self) -> Dict[str, Any]:
+        done = self.sections_done + sum(c.found for c in self._calls if c.per_field)
+        partial = done + sum(c.fraction for c in self._calls if not c.per_field)
+        fraction = min(1.0, partial / self.sections_total) if self.sections_total else 0.0
+        start, end = self._span
+        return {
+            'stage': self.stage,
+            'progress': int(start + (end - start) * fraction),
+            'sections_done': min(done, self.sections_total),
+            'sections_total': self.sections_total,
+        }
+
+    def changed(self, force: bool = False):
+        self._dirty = True
+        if self._closed:
+            return
+        if self._write is not None:
+            # Picked up when the running write finishes
+            return
+        if self._timer is not None:
+            if not force:
+                return
+            self._timer.cancel()
+            self._timer = None
+        wait = 0.0 if force else self._written_at + self.interval - time.monotonic()
+        if wait <= 0:
+            self._flush()
+        else:
+            self._timer = asyncio.get_running_loop().call_later(wait, self._flush)
+
+    def _flush(self):
+        self._timer = None
+        if not self._dirty or self._write is not None:
+            return
+        self._dirty = False
+        self._written_at = time.monotonic()
+        self._write = asyncio.get_running_loop().create_task(db.run(self._save, self.snapshot()))
+        self._write.add_done_callback(self._saved)
+
+    def _save(self, values: Dict[str, Any]):
+        from .models import MirrorAnalysis
+
+        # A job that already finished keeps its final state
+        updated = MirrorAnalysis.objects.filter(id=self.analysis_id, status='processing').update(
+            **values, version=F('version') + 1, updated_at=timezone.now()
+        )
+        if updated:
+            MirrorAnalysis(id=self.analysis_id, status='processing', **values).publish_state()
+
+    def _saved(self, task: asyncio.Task):
+        self._write = None
+        if not task.cancelled() and task.exception() is not None:
+            log.warning(f"Could not save progress of {self.analysis_id}: {task.exception()}")
+        if self._dirty:
+            self.changed()
+
+    async def close(self):
+        """Write what the throttle held back and stop"""
+        self._closed = True
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._write is not None:
+            await asyncio.wait([self._write])
+        if self._dirty:
+            self._dirty = False
+            try:
+                await db.run(self._save, self.snapshot())
+            except Exception as e:
+                log.warning(f"Could not save progress of {self.analysis_id}: {e}")
+
+
+current: contextvars.ContextVar[JobProgress | None] = contextvars.ContextVar('mirror_job_progress', default=None)
+
+
+async def reporting(analysis_id: str, coro):
+    """Run `coro` with progress reported on the analysis `analysis_id`"""
+    job = JobProgress(analysis_id)
+    token = current.set(job)
+    try:
+        return await coro
+    finally:
+        current.reset(token)
+        await job.close()
+
+
+def begin(stage: str, start: float, end: float, sections: int = 0):
+    job = current.get()
+    if job is not None:
+        job.begin(stage, start, end, sections)
+
+
+def track(fields: Iterable[str], per_field: bool = False) -> CallProgress | None:
+    job = current.get()
+    return job.track(fields, per_field) if job is not None else None
+
+
+def finish(call: CallProgress | None):
+    if call is not None:
+        call.job.finish(call)
@@ -0,0 +1,310 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict
+
+import openai
+
+from app import constants
+from .llm import _retry_after_seconds, chat_completion
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class StagePolicy:
+    # Whole budget of one logical call, retries and hedges included
+    deadline: float
+    # Budget of a single request to the API
+    attempt_timeout: float
+    max_attempts: int = 3
+    hedge: bool = True
+
+
+DEFAULT_POLICIES = {
+    'analysis': StagePolicy(deadline=600, attempt_timeout=300),
+    'period': StagePolicy(deadline=480, attempt_timeout=240),
+    'merge': StagePolicy(deadline=480, attempt_timeout=240),
+    'timeline': StagePolicy(deadline=480, attempt_timeout=240),
+    'period_names': StagePolicy(deadline=60, attempt_timeout=30, max_attempts=2),
+}
+FALLBACK_POLICY = StagePolicy(deadline=300, attempt_timeout=150)
+
+
+def load_policies() -> Dict[str, StagePolicy]:
+    """Defaults overridden by LLM_STAGE_POLICIES, e.g. '{"period": {"deadline": 900, "hedge": false}}'"""
+    policies = dict(DEFAULT_POLICIES)
+    overrides = json.loads(constants.LLM_STAGE_POLICIES)
+    for stage, values in overrides.items():
+        base = policies.get(stage, FALLBACK_POLICY)
+        policies[stage] = StagePolicy(**{**base.__dict__, **values})
+    return policies
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"LLM API is unavailable, retry after {math.ceil(retry_after)}s")
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive upstream failures and fails calls fast for `cooldown` seconds.
+
+    Afterwards it is half-open: a single probe call goes through and its outcome decides whether it closes
+    or opens for another cooldown, other calls wait for that. Rate limiting is the governor's business and
+    never trips it.
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+        self.opened_total = 0
+        self.rejected_total = 0
+        self._lock = threading.Lock()
+
+    def retry_after(self) -> float | None:
+        """Seconds until calls are let through again, None while they are"""
+        with self._lock:
+            if self.opened_at is None:
+                return None
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            return remaining if remaining > 0 else None
+
+    def admit(self) -> bool | None:
+        """Whether a call may go through: True for the half-open probe, False while closed, None while the
+        probe is in flight. Raises CircuitOpenError while open."""
+        retry_after = self.retry_after()
+        with self._lock:
+            if retry_after is not None:
+                self.rejected_total += 1
+                raise CircuitOpenError(retry_after)
+            if self.opened_at is None:
+                return False
+            if self.probing:
+                return None
+            self.probing = True
+            return True
+
+    def end_probe(self):
+        """The probe ended without telling whether the API is up, e.g. it was cancelled, let another one through"""
+        with self._lock:
+            self.probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                log.info("LLM circuit breaker closed")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            half_open = self.opened_at is not None
+            self.probing = False
+            if half_open or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                self.opened_total += 1
+                log.warning(f"LLM circuit breaker opened after {self.failures} failures for {self.cooldown:.0f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        retry_after = self.retry_after()
+        with self._lock:
+            state = 'closed' if self.opened_at is None else 'open' if retry_after else 'half-open'
+            return {
+                'state': state,
+                'probing': self.probing,
+                'consecutive_failures': self.failures,
+                'retry_after_seconds': round(retry_after, 1) if retry_after else None,
+                'opened_total': self.opened_total,
+                'rejected_total': self.rejected_total,
+            }
+
+
+class LatencyTracker:
+    """Recent successful call latencies of one stage, for its hedging delay"""
+
+    MIN_SAMPLES = 20
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self) -> float | None:
+        with self._lock:
+            if len(self._samples) < self.MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, TimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def is_upstream_failure(error: BaseException) -> bool:
+    """Errors that say the API is down rather than busy or unhappy with the request"""
+    return is_retryable(error) and not isinstance(error, openai.RateLimitError)
+
+
+class ResilientClient:
+    """chat_completion with per-stage deadlines, jittered retries, p95 hedging and a circuit breaker.
+
+    A call that hasn't answered by the stage's observed p95 latency gets a second, identical request
+    and whichever finishes first wins, the other is cancelled. Hedges are capped at `max_hedge_ratio`
+    of all calls so a slow upstream doesn't double the load on it.
+    """
+
+    BACKOFF_BASE = 1.0
+    BACKOFF_CAP = 30.0
+    # How often calls waiting on the breaker's half-open probe look again
+    PROBE_POLL = 0.5
+
+    def __init__(self, policies: Dict[str, StagePolicy] | None = None, max_hedge_ratio: float = 0.1):
+        self.policies = policies if policies is not None else load_policies()
+        self.breaker = CircuitBreaker(
+            threshold=constants.LLM_BREAKER_THRESHOLD, cooldown=constants.LLM_BREAKER_COOLDOWN
+        )
+        self.max_hedge_ratio = max_hedge_ratio
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'retries': 0, 'hedges': 0, 'hedge_wins': 0, 'deadline_exceeded': 0}
+
+    def _tracker(self, stage: str) -> LatencyTracker:
+        with self._lock:
+            tracker = self._latency.get(stage)
+            if tracker is None:
+                tracker = self._latency[stage] = LatencyTracker()
+            return tracker
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self._counters['hedges'] + 1 > self._counters['calls'] * self.max_hedge_ratio:
+                return False
+            self._counters['hedges'] += 1
+            return True
+
+    async def complete(self, stage: str, progress=None, **kwargs):
+        """`progress`, if given, streams the answer: each attempt gets on_delta from its stream()"""
+        policy = self.policies.get(stage, FALLBACK_POLICY)
+        self._count('calls')
+        try:
+            async with asyncio.timeout(policy.deadline) as deadline:
+                return await self._with_retries(stage, policy, kwargs, progress)
+        except TimeoutError:
+            if deadline.expired():
+                self._count('deadline_exceeded')
+                log.warning(f"LLM {stage} call exceeded its {policy.deadline:.0f}s deadline")
+            raise
+
+    async def _with_retries(self, stage: str, policy: StagePolicy, kwargs: Dict[str, Any], progress):
+        for attempt in range(1, policy.max_attempts + 1):
+            probe = await self._admit()
+            try:
+                response = await self._hedged(stage, policy, kwargs, progress)
+            except Exception as e:
+                if is_upstream_failure(e):
+                    self.breaker.record_failure()
+                elif probe:
+                    self.breaker.end_probe()
+                if not is_retryable(e) or attempt == policy.max_attempts:
+                    raise
+                delay = self._backoff(attempt, e)
+                log.warning(f"LLM {stage} attempt {attempt} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                self._count('retries')
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                if probe:
+                    self.breaker.end_probe()
+                raise
+            self.breaker.record_success()
+            return response
+
+    async def _admit(self) -> bool:
+        """Wait while the breaker's half-open probe is in flight, True if this call is the probe"""
+        while (probe := self.breaker.admit()) is None:
+            await asyncio.sleep(self.PROBE_POLL)
+        return probe
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter, so jobs that failed together don't retry together
+        delay = random.uniform(0, min(self.BACKOFF_CAP, self.BACKOFF_BASE * 2**attempt))
+        if isinstance(error, openai.RateLimitError):
+            retry_after = _retry_after_seconds(error)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        return delay
+
+    async def _attempt(self, stage: str, policy: StagePolicy, kwargs: Dict[str, Any], progress):
+        started_at = time.monotonic()
+        if progress is not None:
+            kwargs = {**kwargs, 'on_delta': progress.stream()}
+        async with asyncio.timeout(policy.attempt_timeout):
+            response = await chat_completion(**kwargs)
+        self._tracker(stage).observe(time.monotonic() - started_at)
+        return response
+
+    async def _hedged(self, stage: str, policy: StagePolicy, kwargs: Dict[str, Any], progress):
+        hedge_after = self._tracker(stage).p95() if policy.hedge else None
+        primary = asyncio.ensure_future(self._attempt(stage, policy, kwargs, progress))
+        if hedge_after is None:
+            return await primary
+
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if not done and self._take_hedge():
+                log.info(f"LLM {stage} call passed p95 of {hedge_after:.1f}s, sending a hedged request")
+                pending.add(asyncio.ensure_future(self._attempt(stage, policy, kwargs, progress)))
+
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count('hedge_wins')
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result = dict(self._counters)
+            trackers = dict(self._latency)
+        p95 = {stage: tracker.p95() for stage, tracker in trackers.items()}
+        result['p95_seconds'] = {stage: round(value, 2) for stage, value in p95.items() if value is not None}
+        result['breaker'] = self.breaker.stats()
+        return result
+
+
+resilient = ResilientClient()
+
+
+async def complete(stage: str, progress=None, **kwargs):
+    """chat_completion for one stage of the analysis pipeline, see ResilientClient"""
+    return await resilient.complete(stage, progress, **kwargs)
@@ -0,0 +1,146 @@
+import json
+import logging
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from django.conf import settings
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage, Storage, default_storage
+from django.db.models import BinaryField
+from django.db.models.functions import Substr
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect
+from django.utils.cache import patch_cache_control
+
+from app import constants
+from .encryption import encrypt_stream_for_user
+
+log = logging.getLogger(__name__)
+
+# A stored result never changes, clients fetch it once
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def result_storage() -> Storage:
+    """Storage of result files: private objects behind presigned URLs on S3, the default storage otherwise"""
+    if getattr(settings, 'DEFAULT_FILE_STORAGE', '').endswith('S3Boto3Storage'):
+        from storages.backends.s3boto3 import S3Boto3Storage
+
+        # Without a custom domain url() presigns instead of pointing at the public bucket domain
+        return S3Boto3Storage(
+            custom_domain=None,
+            querystring_auth=True,
+            querystring_expire=constants.MIRROR_RESULT_URL_TTL,
+            default_acl='private',
+            file_overwrite=False,
+            object_parameters={'CacheControl': f'private, max-age={IMMUTABLE_MAX_AGE}, immutable'},
+        )
+    return default_storage
+
+
+# Streamed results up to this size are staged in memory before the upload, larger ones on disk
+SPOOL_BYTES = 8 * 1024 * 1024
+
+
+def store_result(analysis, chunks: Iterable[bytes]) -> list[str]:
+    """Put the encrypted result, given as it is produced, on `analysis`, returns the fields to save"""
+    if constants.MIRROR_RESULT_STORAGE == 'storage':
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+            for chunk in chunks:
+                spool.write(chunk)
+            analysis.result_size = spool.tell()
+            spool.seek(0)
+            analysis.result_file.save(f'{analysis.id}.bin', File(spool), save=False)
+        return ['result_file', 'result_size']
+    analysis.result = b''.join(chunks)
+    analysis.result_size = len(analysis.result)
+    return ['result', 'result_size']
+
+
+# Parts of a result kept in the core section, the rest are loaded separately
+SPLIT_KEYS = ('timeline_periods', 'period_analyses')
+PERIOD_KEYS = ('period_name', 'start_date', 'end_date')
+
+
+def result_sections(result: Dict[str, Any]) -> List[Tuple[str, Any]]:
+    """`result` split into the parts the frontend loads separately, the manifest listing them first.
+
+    The manifest also names the periods, so their detail can be offered before it is loaded.
+    """
+    sections = [('core', {key: value for key, value in result.items() if key not in SPLIT_KEYS})]
+    if 'timeline_periods' in result:
+        sections.append(('timeline_periods', result['timeline_periods']))
+    periods = result.get('period_analyses') or []
+    sections += [(f'period_analyses/{i}', period) for i, period in enumerate(periods)]
+    manifest = {
+        'sections': [name for name, _ in sections],
+        'periods': [{key: period.get(key) for key in PERIOD_KEYS} for period in periods],
+    }
+    return [('manifest', manifest), *sections]
+
+
+def json_chunks(value, size: int = 64 * 1024) -> Iterator[bytes]:
+    """`value` as UTF-8 JSON in pieces of about `size` bytes, never as one string"""
+    pieces, length = [], 0
+    for piece in json.JSONEncoder().iterencode(value):
+        pieces.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(pieces).encode('utf-8')
+            pieces, length = [], 0
+    if pieces:
+        yield ''.join(pieces).encode('utf-8')
+
+
+def encrypt_sections(sections: List[Tuple[str, Any]], user_pk_b64: str, index: Dict[str, List[int]]) -> Iterator[bytes]:
+    """Each section as its own encrypted blob, one after the other. Records where each one lands in `index`."""
+    offset = 0
+    for name, value in sections:
+        start = offset
+        for chunk in encrypt_stream_for_user(json_chunks(value), user_pk_b64):
+            offset += len(chunk)
+            yield chunk
+        index[name] = [start, offset - start]
+
+
+def result_response(analysis) -> HttpResponse:
+    """The encrypted result as raw bytes, streamed from the row or the storage, or a redirect to S3.
+
+    The ver 3 frames of a file are sent as they are read, so the client starts decrypting before the end.
+    """
+    if analysis.result_file:
+        storage = analysis.result_file.storage
+        if not isinstance(storage, FileSystemStorage):
+            response = HttpResponseRedirect(analysis.result_file.url)
+            # The presigned URL expires, the redirect must not outlive it
+            patch_cache_control(response, private=True, max_age=constants.MIRROR_RESULT_URL_TTL // 2)
+            return response
+        response = FileResponse(analysis.result_file.open('rb'), content_type='application/octet-stream')
+    else:
+        from .models import MirrorAnalysis
+
+        blob = MirrorAnalysis.objects.filter(id=analysis.id).values_list('result', flat=True).get()
+        response = HttpResponse(bytes(blob), content_type='application/octet-stream')
+    patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
+
+
+def section_response(analysis, name: str) -> HttpResponse:
+    """One encrypted section of a sectioned result, read without loading the rest of the blob"""
+    offset, length = analysis.result_sections[name]
+    if analysis.result_file:
+        with analysis.result_file.storage.open(analysis.result_file.name, 'rb') as f:
+            s3_object = getattr(f, 'obj', None)
+            if s3_object is not None:
+                # A ranged GET, reading an S3File downloads the whole object first
+                data = s3_object.get(Range=f'bytes={offset}-{offset + length - 1}')['Body'].read()
+            else:
+                f.seek(offset)
+                data = f.read(length)
+    else:
+        from .models import MirrorAnalysis
+
+        section = Substr('result', offset + 1, length, output_field=BinaryField())
+        data = MirrorAnalysis.objects.filter(id=analysis.id).values_list(section, flat=True).get()
+    response = HttpResponse(bytes(data), content_type='application/octet-stream')
+    patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
@@ -0,0 +1,78 @@
+import logging
+import mmap
+import os
+import tempfile
+import weakref
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+log = logging.getLogger(__name__)
+
+BLOCK_SIZE = 16
+WRITE_SIZE = 1024 * 1024
+
+
+class EncryptedSpill:
+    """Read-only byte buffer kept in an encrypted, memory-mapped temporary file.
+
+    The file is unlinked as soon as it is created, so it has no name on disk and its blocks are
+    freed when it is closed or the process dies. Contents are encrypted with AES-CTR under a random
+    key that only ever lives in this object: counter mode lets any slice be decrypted on its own,
+    and once the key is gone whatever is left on disk is unreadable.
+    """
+
+    def __init__(self, data, directory: str | None = None):
+        self._key = os.urandom(32)
+        # Upper half of the initial counter block, the lower half counts blocks from the start of the file
+        self._nonce = os.urandom(8)
+        self._size = len(data)
+        self._file = tempfile.TemporaryFile(dir=directory)
+
+        view = memoryview(data)
+        encryptor = self._cipher(0).encryptor()
+        for pos in range(0, self._size, WRITE_SIZE):
+            self._file.write(encryptor.update(view[pos : pos + WRITE_SIZE]))
+        self._file.write(encryptor.finalize())
+        self._file.flush()
+
+        # mmap can't map an empty file
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size else None
+        self._finalizer = weakref.finalize(self, _close, self._map, self._file)
+
+    def _cipher(self, block: int) -> Cipher:
+        counter = self._nonce + block.to_bytes(8, 'big')
+        return Cipher(algorithms.AES(self._key), modes.CTR(counter))
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, key: slice) -> bytes:
+        if not isinstance(key, slice):
+            raise TypeError('EncryptedSpill only supports slicing')
+        start, stop, step = key.indices(self._size)
+        if step != 1:
+            raise ValueError('EncryptedSpill slices must be contiguous')
+        if stop <= start:
+            return b''
+        if self._map is None or not self._finalizer.alive:
+            raise ValueError('EncryptedSpill is closed')
+
+        # Decrypt from the start of the block holding `start`, then drop the bytes before it
+        block = start // BLOCK_SIZE
+        decryptor = self._cipher(block).decryptor()
+        plain = decryptor.update(self._map[block * BLOCK_SIZE : stop]) + decryptor.finalize()
+        return plain[start - block * BLOCK_SIZE :]
+
+    @property
+    def closed(self) -> bool:
+        return not self._finalizer.alive
+
+    def close(self):
+        self._finalizer()
+        self._key = None
+
+
+def _close(map_, file):
+    if map_ is not None:
+        map_.close()
+    file.close()
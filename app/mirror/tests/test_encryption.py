@@ -0,0 +1,117 @@
+import base64
+import json
+import os
+import struct
+import zlib
+
+from django.test import SimpleTestCase
+from nacl.bindings import (
+    crypto_aead_xchacha20poly1305_ietf_decrypt,
+    crypto_secretstream_xchacha20poly1305_ABYTES,
+    crypto_secretstream_xchacha20poly1305_TAG_FINAL,
+    crypto_secretstream_xchacha20poly1305_TAG_MESSAGE,
+    crypto_secretstream_xchacha20poly1305_init_pull,
+    crypto_secretstream_xchacha20poly1305_pull,
+    crypto_secretstream_xchacha20poly1305_state,
+)
+from nacl.exceptions import CryptoError
+from nacl.public import PrivateKey, SealedBox
+
+from app.mirror.encryption import BLOB_MAGIC, encrypt_blob_for_user, encrypt_stream_for_user
+
+FRAME = 64
+
+
+def split_blob(blob: bytes) -> tuple[dict, bytes]:
+    assert blob[:4] == BLOB_MAGIC
+    (length,) = struct.unpack('>I', blob[4:8])
+    return json.loads(blob[8 : 8 + length]), blob[8 + length :]
+
+
+def decompress(header: dict, data: bytes) -> bytes:
+    return zlib.decompress(data, 31) if header.get('codec') == 'gzip' else data
+
+
+class BlobTests(SimpleTestCase):
+    """Blobs opened the way frontend/src/utils/crypto.js decryptBlobFromServer does"""
+
+    def setUp(self):
+        self.sk = PrivateKey.generate()
+        self.pk = base64.b64encode(self.sk.public_key.encode()).decode()
+
+    def dek(self, header: dict) -> bytes:
+        return SealedBox(self.sk).decrypt(base64.b64decode(header['ek']))
+
+    def open_blob(self, blob: bytes) -> bytes:
+        header, body = split_blob(blob)
+        aad = base64.b64decode(header['aad']) if 'aad' in header else None
+        plain = crypto_aead_xchacha20poly1305_ietf_decrypt(
+            body, aad, base64.b64decode(header['nonce']), self.dek(header)
+        )
+        return decompress(header, plain)
+
+    def open_stream(self, blob: bytes) -> tuple[bytes, int]:
+        """Plaintext and the number of frames"""
+        header, body = split_blob(blob)
+        aad = base64.b64decode(header['aad']) if 'aad' in header else None
+        state = crypto_secretstream_xchacha20poly1305_state()
+        crypto_secretstream_xchacha20poly1305_init_pull(state, base64.b64decode(header['header']), self.dek(header))
+        frame = header['frame'] + crypto_secretstream_xchacha20poly1305_ABYTES
+        out = []
+        # Every full frame with more data after it is a message frame, what is left is the final one
+        while len(body) > frame:
+            message, tag = crypto_secretstream_xchacha20poly1305_pull(state, body[:frame], aad)
+            self.assertEqual(tag, crypto_secretstream_xchacha20poly1305_TAG_MESSAGE)
+            out.append(message)
+            body = body[frame:]
+        message, tag = crypto_secretstream_xchacha20poly1305_pull(state, body, aad)
+        self.assertEqual(tag, crypto_secretstream_xchacha20poly1305_TAG_FINAL)
+        out.append(message)
+        return decompress(header, b''.join(out)), len(out)
+
+    def test_blob_round_trip(self):
+        data = b'{"summary": "text"}' * 100
+        for codec, ver in (('none', '1'), ('gzip', '2')):
+            with self.subTest(codec=codec):
+                blob = encrypt_blob_for_user(data, self.pk, aad=b'analysis:1', codec=codec)
+                header, _ = split_blob(blob)
+                self.assertEqual(header['ver'], ver)
+                self.assertEqual(self.open_blob(blob), data)
+
+    def test_blob_checks_aad(self):
+        blob = encrypt_blob_for_user(b'data', self.pk, aad=b'analysis:1', codec='none')
+        header, body = split_blob(blob)
+        header['aad'] = base64.b64encode(b'analysis:2').decode()
+        head = json.dumps(header).encode()
+        with self.assertRaises(CryptoError):
+            self.open_blob(BLOB_MAGIC + struct.pack('>I', len(head)) + head + body)
+
+    def test_stream_round_trip_at_frame_boundaries(self):
+        for size, frames in ((0, 1), (FRAME - 1, 1), (FRAME, 1), (FRAME + 1, 2), (2 * FRAME, 2), (2 * FRAME + 1, 3)):
+            data = os.urandom(size)
+            # Chunks that don't line up with frames
+            chunks = [data[i : i + 7] for i in range(0, size, 7)]
+            with self.subTest(size=size):
+                blob = b''.join(encrypt_stream_for_user(chunks, self.pk, codec='none', frame_size=FRAME))
+                self.assertEqual(split_blob(blob)[0]['ver'], '3')
+                self.assertEqual(self.open_stream(blob), (data, frames))
+
+    def test_stream_round_trip_compressed(self):
+        for size in (0, FRAME - 1, FRAME, FRAME + 1, 2 * FRAME, 10 * FRAME):
+            # Incompressible, so the compressed stream also straddles frame boundaries
+            data = os.urandom(size)
+            with self.subTest(size=size):
+                blob = b''.join(
+                    encrypt_stream_for_user([data], self.pk, aad=b'analysis:1', codec='gzip', frame_size=FRAME)
+                )
+                self.assertEqual(split_blob(blob)[0]['codec'], 'gzip')
+                self.assertEqual(self.open_stream(blob)[0], data)
+
+    def test_truncated_stream_fails(self):
+        blob = b''.join(encrypt_stream_for_user([os.urandom(3 * FRAME)], self.pk, codec='none', frame_size=FRAME))
+        frame = FRAME + crypto_secretstream_xchacha20poly1305_ABYTES
+        # Cut after a whole frame: the message frame left over is not tagged final
+        with self.assertRaises(AssertionError):
+            self.open_stream(blob[: -2 * frame])
+        with self.assertRaises(CryptoError):
+            self.open_stream(blob[:-1])
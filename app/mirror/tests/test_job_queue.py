@@ -0,0 +1,127 @@
+import queue
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from app import constants
+from app.exceptions import QueueFullException
+from app.mirror import job_queue
+from app.mirror.jobs import AnalysisExecutor
+from app.mirror.messages import MessageStore
+from app.mirror.models import MirrorAnalysis, MirrorJob
+
+MESSAGES = [
+    {'sender': 'Anna', 'text': 'a very private message', 'date': '2020-03-05T10:00:00'},
+    {'sender': 'Bob', 'text': 'reply', 'date': '2020-03-05T10:01:00'},
+]
+
+
+def enqueue() -> MirrorJob:
+    analysis = MirrorAnalysis.objects.create(person_name='Anna', keypair={'pk': ''})
+    return job_queue.enqueue(analysis, MessageStore.from_dicts(MESSAGES))
+
+
+class PayloadTests(TestCase):
+    def test_payload_is_encrypted(self):
+        job = MirrorJob.objects.get(id=enqueue().id)
+        self.assertNotIn(b'private', bytes(job.payload))
+        self.assertEqual(list(job.load_payload()), MESSAGES)
+
+    def test_payload_is_bound_to_its_analysis(self):
+        job = enqueue()
+        other = enqueue()
+        job.payload = other.payload
+        with self.assertRaises(Exception):
+            job.load_payload()
+
+    def test_failed_job_drops_payload_and_fails_analysis(self):
+        job = enqueue()
+        job_queue.claim_next('w1')
+        keeper = job_queue.LeaseKeeper('w1')
+        with (
+            mock.patch.object(job_queue, 'run_async_processing', side_effect=RuntimeError('boom')),
+            self.assertLogs(job_queue.log, 'ERROR'),
+        ):
+            job_queue.run_claimed_job(job.id, 'w1', keeper)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.payload), ('failed', None))
+        self.assertEqual(MirrorAnalysis.objects.get(id=job.analysis_id).status, 'error')
+
+
+class ClaimTests(TestCase):
+    def test_claims_oldest_and_leases_it(self):
+        first, second = enqueue(), enqueue()
+        job = job_queue.claim_next('w1')
+        self.assertEqual((job.id, job.status, job.attempts, job.lease_owner), (first.id, 'running', 1, 'w1'))
+        self.assertEqual(job_queue.claim_next('w2').id, second.id)
+        self.assertIsNone(job_queue.claim_next('w3'))
+
+    def test_expired_lease_is_reclaimed(self):
+        job = enqueue()
+        job_queue.claim_next('w1')
+        MirrorJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        with self.assertLogs(job_queue.log, 'WARNING'):
+            reclaimed = job_queue.claim_next('w2')
+        self.assertEqual((reclaimed.id, reclaimed.attempts, reclaimed.lease_owner), (job.id, 2, 'w2'))
+        # The first worker lost the lease, its finish is ignored
+        with self.assertLogs(job_queue.log, 'WARNING'):
+            self.assertFalse(job_queue.finish(job.id, 'w1'))
+        self.assertTrue(job_queue.finish(job.id, 'w2'))
+
+    def test_gives_up_after_max_attempts(self):
+        job = enqueue()
+        MirrorJob.objects.filter(id=job.id).update(attempts=constants.MIRROR_JOB_MAX_ATTEMPTS)
+        with self.assertLogs(job_queue.log, 'ERROR'):
+            self.assertIsNone(job_queue.claim_next('w1'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.payload), ('failed', None))
+        self.assertEqual(MirrorAnalysis.objects.get(id=job.analysis_id).status, 'error')
+
+    def test_release_does_not_count_an_attempt(self):
+        job = enqueue()
+        job_queue.claim_next('w1')
+        self.assertEqual(job_queue.release([job.id], 'w1'), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.lease_owner), ('queued', 0, ''))
+        self.assertEqual(job_queue.claim_next('w2').attempts, 1)
+
+
+class ExecutorTests(SimpleTestCase):
+    def test_job_taken_off_the_queue_keeps_its_worker_busy(self):
+        taken = threading.Event()
+        resume = threading.Event()
+
+        class PausingQueue(queue.Queue):
+            # Stops a worker between taking a job and starting it
+            def get(self, *args, **kwargs):
+                item = super().get(*args, **kwargs)
+                taken.set()
+                resume.wait(5)
+                return item
+
+        pool = AnalysisExecutor(max_workers=1, max_pending=1, name='test-worker')
+        pool._queue = PausingQueue(maxsize=1)
+        done = threading.Event()
+        pool.submit(done.set)
+        self.assertTrue(taken.wait(5))
+        self.assertEqual(pool._queue.qsize(), 0)
+        self.assertEqual(pool.idle_workers(), 0)
+
+        resume.set()
+        self.assertTrue(done.wait(5))
+        deadline = time.monotonic() + 5
+        while pool.idle_workers() == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(pool.idle_workers(), 1)
+
+    def test_rejected_job_frees_its_slot(self):
+        pool = AnalysisExecutor(max_workers=1, max_pending=1, name='test-worker')
+        pool._queue.put_nowait(None)
+        with mock.patch.object(pool, '_ensure_started'), mock.patch('app.mirror.jobs.log'):
+            with self.assertRaises(QueueFullException):
+                pool.submit(print)
+        self.assertEqual(pool.idle_workers(), 1)
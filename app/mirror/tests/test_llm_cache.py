@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from cryptography.exceptions import InvalidTag
+from django.db import OperationalError, connection, connections
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from openai.types.chat import ChatCompletion
+
+from app.mirror import db, llm
+from app.mirror.llm_cache import DatabaseTier, EntryKeys, LLMCache, MemoryTier, canonical_request
+from app.mirror.models import LLMCacheEntry
+
+SECRET = b'secret'
+REQUEST = {'model': 'gpt-4.1', 'messages': [{'role': 'user', 'content': 'a private chat'}], 'temperature': 0.7}
+
+
+def completion(content: str = 'an insight') -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            'id': 'chatcmpl-1',
+            'object': 'chat.completion',
+            'created': 0,
+            'model': 'gpt-4.1',
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content}}],
+        }
+    )
+
+
+class EntryKeysTests(SimpleTestCase):
+    def test_seal_round_trip(self):
+        keys = EntryKeys(canonical_request(REQUEST), SECRET)
+        blob = keys.seal(completion())
+        self.assertNotIn(b'insight', blob)
+        self.assertEqual(keys.open(blob), completion())
+
+    def test_other_request_cannot_open(self):
+        keys = EntryKeys(canonical_request(REQUEST), SECRET)
+        other = EntryKeys(canonical_request({**REQUEST, 'temperature': 0.2}), SECRET)
+        self.assertNotEqual(keys.id, other.id)
+        with self.assertRaises(InvalidTag):
+            other.open(keys.seal(completion()))
+
+    def test_key_ignores_transport_fields(self):
+        self.assertEqual(canonical_request(REQUEST), canonical_request({**REQUEST, 'timeout': 30, 'seed': None}))
+
+    def test_secret_changes_id_and_key(self):
+        keys = EntryKeys(canonical_request(REQUEST), SECRET)
+        other = EntryKeys(canonical_request(REQUEST), b'other')
+        self.assertNotEqual((keys.id, keys.key), (other.id, other.key))
+
+
+class MemoryTierTests(SimpleTestCase):
+    def test_expired_entries_miss(self):
+        tier = MemoryTier(1024)
+        tier.put('a', b'blob', time.time() - 1)
+        self.assertIsNone(tier.get('a'))
+        self.assertEqual(tier.bytes, 0)
+
+    def test_evicts_least_recently_used(self):
+        tier = MemoryTier(10)
+        tier.put('a', b'aaaa', time.time() + 60)
+        tier.put('b', b'bbbb', time.time() + 60)
+        tier.get('a')
+        tier.put('c', b'cccc', time.time() + 60)
+        self.assertEqual((tier.get('a'), tier.get('b'), tier.get('c')), (b'aaaa', None, b'cccc'))
+        self.assertEqual(tier.evictions, 1)
+
+
+class LLMCacheTests(TestCase):
+    def cache(self, secret: bytes = SECRET) -> LLMCache:
+        return LLMCache(MemoryTier(1024 * 1024), DatabaseTier(1024 * 1024), ttl=60, secret=secret)
+
+    def test_database_hit_is_decoded_and_promoted(self):
+        writer = self.cache()
+        writer.put(writer.keys(REQUEST), 'gpt-4.1', completion())
+        entry = LLMCacheEntry.objects.get()
+        self.assertNotIn(b'private', bytes(entry.blob))
+
+        # Another process: empty memory, same table
+        reader = self.cache()
+        keys = reader.keys(REQUEST)
+        self.assertEqual(reader.get(keys), completion())
+        self.assertEqual(reader.get(keys), completion())
+        stats = reader.stats()
+        self.assertEqual((stats['db_hits'], stats['memory_hits'], stats['misses']), (1, 1, 0))
+
+    def test_miss(self):
+        cache = self.cache()
+        self.assertIsNone(cache.get(cache.keys(REQUEST)))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_entry_sealed_under_another_key_is_a_miss(self):
+        cache = self.cache()
+        keys = cache.keys(REQUEST)
+        other = EntryKeys(canonical_request({**REQUEST, 'temperature': 0.2}), SECRET)
+        # Same id, blob that doesn't open with this request's key
+        cache.database.put(keys.id, 'gpt-4.1', other.seal(completion()), 60)
+        self.assertIsNone(cache.get(keys))
+        self.assertEqual(cache.stats()['errors'], 0)
+
+
+class ChatCompletionCacheTests(TransactionTestCase):
+    """Lookups run on the shared ORM threads, whose connections outlive any one job"""
+
+    def setUp(self):
+        self.cache = LLMCache(MemoryTier(1024 * 1024), DatabaseTier(1024 * 1024), ttl=60, secret=SECRET)
+        self.cache.put(self.cache.keys(REQUEST), 'gpt-4.1', completion())
+        self.cache.memory.clear()
+
+    def test_lookup_runs_on_orm_threads(self):
+        threads = []
+        get = DatabaseTier.get
+
+        def recording_get(tier, entry_id):
+            threads.append(threading.current_thread().name)
+            return get(tier, entry_id)
+
+        with (
+            mock.patch.object(llm, 'get_cache', return_value=self.cache),
+            mock.patch.object(DatabaseTier, 'get', autospec=True, side_effect=recording_get),
+        ):
+            self.assertEqual(asyncio.run(llm.chat_completion(**REQUEST)), completion())
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('mirror-db'))
+
+    def test_broken_connection_is_closed_after_lookup(self):
+        keys = self.cache.keys(REQUEST)
+        closed_on = []
+
+        def fail(entry_id):
+            # What a query on a connection lost to a database restart leaves behind
+            connection.ensure_connection()
+            connection.errors_occurred = True
+            raise OperationalError('server closed the connection unexpectedly')
+
+        def close(wrapper):
+            closed_on.append(threading.current_thread().name)
+            wrapper.errors_occurred = False
+
+        wrapper = type(connections['default'])
+        with (
+            mock.patch.object(DatabaseTier, 'get', side_effect=fail),
+            mock.patch.object(wrapper, 'is_usable', return_value=False),
+            mock.patch.object(wrapper, 'close', autospec=True, side_effect=close),
+            self.assertLogs('app.mirror.llm_cache', 'WARNING'),
+        ):
+            self.assertIsNone(asyncio.run(db.run(self.cache.get, keys)))
+        self.assertEqual(self.cache.stats()['errors'], 1)
+        self.assertEqual(len(closed_on), 1)
+        self.assertTrue(closed_on[0].startswith('mirror-db'))
+
+        # The next lookup finds the entry
+        self.assertEqual(asyncio.run(db.run(self.cache.get, keys)), completion())
@@ -0,0 +1,76 @@
+from django.test import SimpleTestCase
+
+from app.mirror.messages import MessageStore
+from app.mirror.spill import BLOCK_SIZE, EncryptedSpill
+
+MESSAGES = [
+    {'sender': 'Anna', 'text': 'Привет! 👋', 'date': '2020-03-05T10:00:00'},
+    {'sender': 'Bob', 'text': '', 'date': ''},
+    {'sender': 'Anna', 'text': 'second line\nand more', 'date': '2020-03-06T11:30:00'},
+    {'sender': 'Carol', 'text': 'x' * 100, 'date': 'not a date'},
+]
+
+
+class MessageStoreTests(SimpleTestCase):
+    def test_round_trips_messages(self):
+        store = MessageStore.from_dicts(MESSAGES)
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store[0], MESSAGES[0])
+        self.assertEqual(store[-1]['date'], '')
+        self.assertEqual(store.senders, ['Anna', 'Bob', 'Carol'])
+
+    def test_to_bytes_round_trip(self):
+        store = MessageStore.from_dicts(MESSAGES)
+        restored = MessageStore.from_bytes(store.to_bytes())
+        self.assertEqual(list(restored), list(store))
+        self.assertEqual(list(restored.tokens), list(store.tokens))
+
+    def test_to_bytes_of_a_slice(self):
+        view = MessageStore.from_dicts(MESSAGES)[1:3]
+        restored = MessageStore.from_bytes(view.to_bytes())
+        self.assertEqual(list(restored), MESSAGES[1:3])
+        self.assertEqual(restored.offsets[0], 0)
+
+    def test_from_bytes_rejects_other_data(self):
+        with self.assertRaises(ValueError):
+            MessageStore.from_bytes(b'not a store')
+
+    def test_spilled_store_reads_the_same(self):
+        store = MessageStore.from_dicts(MESSAGES)
+        spilled = store.spill()
+        try:
+            self.assertTrue(spilled.spilled)
+            self.assertEqual(list(spilled), list(store))
+            self.assertEqual(list(spilled[2:]), list(store[2:]))
+            self.assertEqual(MessageStore.from_bytes(spilled.to_bytes())[0], MESSAGES[0])
+        finally:
+            spilled.close()
+
+
+class EncryptedSpillTests(SimpleTestCase):
+    def setUp(self):
+        self.data = bytes(range(256)) * 5
+        self.spill = EncryptedSpill(self.data)
+        self.addCleanup(self.spill.close)
+
+    def test_file_holds_no_plaintext(self):
+        self.spill._file.seek(0)
+        on_disk = self.spill._file.read()
+        self.assertEqual(len(on_disk), len(self.data))
+        self.assertNotIn(self.data[:64], on_disk)
+
+    def test_slices_across_block_boundaries(self):
+        for start, stop in [(0, 1), (1, BLOCK_SIZE + 1), (BLOCK_SIZE - 1, BLOCK_SIZE), (100, 900), (0, len(self.data))]:
+            self.assertEqual(self.spill[start:stop], self.data[start:stop])
+        self.assertEqual(self.spill[10:5], b'')
+
+    def test_closed_spill_refuses_reads(self):
+        self.spill.close()
+        self.assertTrue(self.spill.closed)
+        with self.assertRaises(ValueError):
+            self.spill[0:1]
+
+    def test_empty(self):
+        empty = EncryptedSpill(b'')
+        self.assertEqual((len(empty), empty[0:0]), (0, b''))
+        empty.close()
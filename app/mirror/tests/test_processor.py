@@ -0,0 +1,54 @@
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from app import constants
+from app.mirror import processor
+
+
+def period(i: int, size: int = 10):
+    return {
+        'period_name': f'p{i}',
+        'start_date': f'2020-01-{i + 1:02d}T00:00:00',
+        'end_date': f'2020-01-{i + 1:02d}T23:59:59',
+        'personality_during_period': 'word ' * size,
+        'key_events': [],
+        'emotional_state': '',
+        'communication_patterns': [],
+        'growth_or_regression': '',
+    }
+
+
+async def fake_merge(periods, person_name):
+    merged = period(0, size=1)
+    return {**merged, 'period_name': '+'.join(p['period_name'] for p in periods)}
+
+
+class ReducePeriodsTests(SimpleTestCase):
+    def reduce(self, periods, budget, fan_in=2):
+        with mock.patch.object(processor, 'call_gpt_api_merge_periods', side_effect=fake_merge) as merge:
+            level = asyncio.run(processor.reduce_periods(periods, 'Anna', budget, span=(80, 90), fan_in=fan_in))
+        return level, merge
+
+    def test_fitting_analyses_are_not_merged(self):
+        periods = [period(i) for i in range(2)]
+        level, merge = self.reduce(periods, budget=10_000)
+        self.assertIs(level, periods)
+        merge.assert_not_called()
+
+    def test_merges_level_by_level(self):
+        level, merge = self.reduce([period(i) for i in range(5)], budget=10_000)
+        self.assertEqual([p['period_name'] for p in level], ['p0+p1+p2+p3', 'p4'])
+        self.assertTrue(all(len(call.args[0]) > 1 for call in merge.call_args_list))
+
+    def test_single_analysis_over_budget_stops(self):
+        level, merge = self.reduce([period(0, size=1000)], budget=10)
+        self.assertEqual(len(level), 1)
+        merge.assert_not_called()
+
+    def test_depth_is_capped(self):
+        with mock.patch.object(constants, 'TIMELINE_MAX_MERGE_DEPTH', 2), self.assertLogs(processor.log, 'WARNING'):
+            level, merge = self.reduce([period(i, size=1000) for i in range(16)], budget=10)
+        self.assertEqual(len(level), 4)
+        self.assertEqual(merge.call_count, 8 + 4)
@@ -0,0 +1,117 @@
+import asyncio
+from unittest import mock
+
+import httpx
+import openai
+from django.test import SimpleTestCase
+
+from app.mirror import resilience
+from app.mirror.resilience import CircuitBreaker, CircuitOpenError, ResilientClient, StagePolicy
+
+
+def server_error() -> openai.APIStatusError:
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    return openai.InternalServerError('down', response=httpx.Response(500, request=request), body=None)
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.threshold):
+        breaker.record_failure()
+
+
+def end_cooldown(breaker: CircuitBreaker):
+    breaker.opened_at -= breaker.cooldown
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(threshold=2, cooldown=30)
+        patcher = mock.patch.object(resilience, 'log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_opens_after_threshold(self):
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.admit())
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError) as e:
+            self.breaker.admit()
+        self.assertGreater(e.exception.retry_after, 29)
+        self.assertEqual(self.breaker.stats()['state'], 'open')
+        self.assertEqual(self.breaker.stats()['rejected_total'], 1)
+
+    def test_success_resets_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertFalse(self.breaker.admit())
+
+    def test_half_open_admits_one_probe(self):
+        open_breaker(self.breaker)
+        end_cooldown(self.breaker)
+        self.assertIs(self.breaker.admit(), True)
+        self.assertIsNone(self.breaker.admit())
+        self.assertEqual(self.breaker.stats()['state'], 'half-open')
+
+        self.breaker.record_success()
+        self.assertIs(self.breaker.admit(), False)
+        self.assertEqual(self.breaker.stats()['state'], 'closed')
+
+    def test_failed_probe_reopens(self):
+        open_breaker(self.breaker)
+        end_cooldown(self.breaker)
+        self.assertTrue(self.breaker.admit())
+        self.breaker.record_failure()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.admit()
+        self.assertEqual(self.breaker.opened_total, 2)
+
+    def test_ended_probe_lets_another_through(self):
+        open_breaker(self.breaker)
+        end_cooldown(self.breaker)
+        self.assertTrue(self.breaker.admit())
+        self.breaker.end_probe()
+        self.assertTrue(self.breaker.admit())
+
+
+class ResilientClientBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.client = ResilientClient({'test': StagePolicy(deadline=5, attempt_timeout=5, max_attempts=1, hedge=False)})
+        self.client.PROBE_POLL = 0.01
+        patcher = mock.patch.object(resilience, 'log')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        open_breaker(self.client.breaker)
+        end_cooldown(self.client.breaker)
+
+    def run_calls(self, upstream, n: int):
+        async def calls():
+            return await asyncio.gather(
+                *(self.client.complete('test', model='m', messages=[]) for _ in range(n)), return_exceptions=True
+            )
+
+        with mock.patch.object(resilience, 'chat_completion', side_effect=upstream) as chat_completion:
+            return asyncio.run(calls()), chat_completion
+
+    def test_calls_wait_for_the_probe(self):
+        half_open_calls = 0
+
+        async def upstream(**kwargs):
+            nonlocal half_open_calls
+            half_open_calls += self.client.breaker.opened_at is not None
+            await asyncio.sleep(0.05)
+            return 'ok'
+
+        results, chat_completion = self.run_calls(upstream, 3)
+        self.assertEqual(results, ['ok'] * 3)
+        self.assertEqual((half_open_calls, chat_completion.call_count), (1, 3))
+
+    def test_failed_probe_fails_the_waiting_calls_fast(self):
+        async def upstream(**kwargs):
+            await asyncio.sleep(0.05)
+            raise server_error()
+
+        results, chat_completion = self.run_calls(upstream, 3)
+        self.assertEqual(chat_completion.call_count, 1)
+        self.assertIsInstance(results[0], openai.InternalServerError)
+        self.assertTrue(all(isinstance(r, CircuitOpenError) for r in results[1:]))
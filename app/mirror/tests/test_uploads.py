@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import io
+import zipfile
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from app import constants
+from app.exceptions import UploadError
+from app.mirror import uploads
+from app.mirror.models import UploadPart, UploadSession
+
+CHAT = ''.join(f'[{day:02d}/03/2020, 10:00:00] Anna: message {day}\n' for day in range(1, 29)).encode()
+
+
+def send(session, data: bytes, part_size: int):
+    for offset in range(0, len(data), part_size):
+        part = data[offset : offset + part_size]
+        uploads.append_part(session.id, offset, io.BytesIO(part), len(part), hashlib.sha256(part).hexdigest())
+
+
+class UploadTests(TestCase):
+    def test_parts_decode_as_one_stream(self):
+        data = gzip.compress(CHAT)
+        session = uploads.create_session('gzip', len(data), 'export')
+        send(session, data, 100)
+        self.assertEqual(UploadPart.objects.filter(session=session).count(), -(-len(data) // 100))
+        summary = uploads.export_summary(session.id)
+        self.assertEqual(summary['messages'], 28)
+
+    def test_zip_export_seeks_across_parts(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w') as z:
+            z.writestr('chat.txt', CHAT)
+        data = archive.getvalue()
+        session = uploads.create_session('identity', len(data), 'export')
+        send(session, data, 64)
+        self.assertEqual(uploads.export_summary(session.id)['senders'], [{'name': 'Anna', 'count': 28}])
+
+    def test_part_at_wrong_offset_is_rejected(self):
+        session = uploads.create_session('identity', None)
+        send(session, b'abc', 3)
+        with self.assertRaises(UploadError) as e:
+            uploads.append_part(session.id, 0, io.BytesIO(b'abc'), 3, hashlib.sha256(b'abc').hexdigest())
+        self.assertEqual(e.exception.status, 409)
+
+    def test_checksum_mismatch_keeps_offset(self):
+        session = uploads.create_session('identity', None)
+        with self.assertRaises(UploadError):
+            uploads.append_part(session.id, 0, io.BytesIO(b'abc'), 3, '0' * 64)
+        session.refresh_from_db()
+        self.assertEqual((session.offset, session.upload_parts.count()), (0, 0))
+
+    def test_lost_parts_restart_the_session(self):
+        session = uploads.create_session('identity', None)
+        send(session, b'abcdef', 3)
+        session.upload_parts.all().delete()
+        with self.assertRaises(UploadError) as e, self.assertLogs(uploads.log, 'WARNING'):
+            uploads.append_part(session.id, 6, io.BytesIO(b'ghi'), 3, hashlib.sha256(b'ghi').hexdigest())
+        self.assertEqual(e.exception.status, 409)
+        session.refresh_from_db()
+        self.assertEqual((session.offset, session.parts), (0, 0))
+        send(session, b'abc', 3)
+
+    def test_complete_drops_parts(self):
+        session = uploads.create_session('identity', None)
+        send(session, b'abc', 3)
+        uploads.complete(session, None)
+        self.assertFalse(UploadPart.objects.exists())
+
+    def test_finalizing_session_is_claimed_once(self):
+        session = uploads.create_session('identity', 3)
+        send(session, b'abc', 3)
+        uploads.claim_for_finalize(session.id)
+        with self.assertRaises(UploadError) as e:
+            uploads.claim_for_finalize(session.id)
+        self.assertEqual(e.exception.status, 409)
+
+    def test_stuck_finalization_is_taken_over(self):
+        session = uploads.create_session('identity', 3)
+        send(session, b'abc', 3)
+        uploads.claim_for_finalize(session.id)
+        # The finalizing request died with its process
+        started = timezone.now() - timedelta(seconds=constants.MIRROR_UPLOAD_FINALIZE_TIMEOUT + 1)
+        UploadSession.objects.filter(id=session.id).update(finalizing_since=started)
+        with self.assertLogs(uploads.log, 'WARNING'):
+            claimed = uploads.claim_for_finalize(session.id)
+        self.assertEqual(claimed.status, 'finalizing')
+        self.assertGreater(claimed.finalizing_since, started)
@@ -0,0 +1,72 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from app import constants
+
+from app.mirror import views
+from app.mirror.models import MirrorAnalysis
+
+
+class EventStreamLimitTests(TestCase):
+    def setUp(self):
+        self.analysis = MirrorAnalysis.objects.create(person_name='Anna')
+        self.url = f'/mirror/api/insights/{self.analysis.id}/events/'
+        patcher = mock.patch.object(views, 'event_streams', views.StreamSlots(1))
+        self.slots = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_streams_past_the_limit_get_503(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first['Content-Type'], 'text/event-stream')
+
+        with self.assertLogs('django.request', 'ERROR'):
+            second = self.client.get(self.url)
+        self.assertEqual(second.status_code, 503)
+        self.assertIn('Retry-After', second)
+
+        # Closing a stream, even one never read, frees its slot
+        first.close()
+        self.assertEqual(self.slots.open, 0)
+        third = self.client.get(self.url)
+        self.assertEqual(third.status_code, 200)
+        third.close()
+        self.assertEqual(self.slots.stats(), {'open': 0, 'limit': 1, 'rejected': 1})
+
+    def test_unknown_analysis_frees_its_slot(self):
+        with self.assertLogs('django.request', 'WARNING'):
+            response = self.client.get('/mirror/api/insights/00000000-0000-0000-0000-000000000000/events/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.slots.open, 0)
+
+
+class StatsViewTests(TestCase):
+    url = '/mirror/api/stats/'
+
+    def get(self, **headers):
+        with self.assertLogs('django.request', 'WARNING'):
+            return self.client.get(self.url, headers=headers)
+
+    def test_anonymous_is_forbidden(self):
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_non_staff_is_forbidden(self):
+        self.client.force_login(User.objects.create_user('user'))
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_staff_sees_stats(self):
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('event_streams', response.json())
+
+    def test_token(self):
+        with mock.patch.object(constants, 'MIRROR_STATS_TOKEN', 'secret'):
+            self.assertEqual(self.get(Authorization='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get(self.url, headers={'Authorization': 'Bearer secret'}).status_code, 200)
+
+    def test_no_token_configured(self):
+        with mock.patch.object(constants, 'MIRROR_STATS_TOKEN', None):
+            self.assertEqual(self.get(Authorization='Bearer ').status_code, 403)
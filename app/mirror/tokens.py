@@ -0,0 +1,74 @@
+import threading
+from typing import Any, Iterable
+
+# Rough averages for the GPT-4 family tokenizers: Latin text packs ~4 characters into a token,
+# Cyrillic and other multi-byte scripts closer to 2.5
+LATIN_CHARS_PER_TOKEN = 4.0
+WIDE_CHARS_PER_TOKEN = 2.5
+
+# Role markers and separators the API adds around every chat message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-4.1': 1_047_576,
+    'gpt-4.1-mini': 1_047_576,
+    'gpt-4o-mini': 128_000,
+}
+DEFAULT_CONTEXT_WINDOW = 128_000
+
+
+class TokenCalibration:
+    """Running ratio between the prompt tokens the API reports and our estimate of them.
+
+    The character heuristics are off by a roughly constant factor for a given language mix,
+    so scaling by the observed ratio brings estimates close to the real tokenizer.
+    """
+
+    MIN_FACTOR = 0.5
+    MAX_FACTOR = 2.0
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.factor = 1.0
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def observe(self, estimated: int, actual: int | None):
+        if not estimated or not actual:
+            return
+        ratio = min(self.MAX_FACTOR, max(self.MIN_FACTOR, actual / estimated))
+        with self._lock:
+            self.factor = ratio if self.samples == 0 else self.factor + self.alpha * (ratio - self.factor)
+            self.samples += 1
+
+    def apply(self, estimated: int) -> int:
+        return int(estimated * self.factor)
+
+
+calibration = TokenCalibration()
+
+
+def estimate_text_tokens(text: str) -> int:
+    """Estimate the token count of `text` without a tokenizer"""
+    if not text:
+        return 0
+    return estimate_tokens_from_sizes(len(text), len(text.encode('utf-8')))
+
+
+def estimate_tokens_from_sizes(chars: int, utf8_bytes: int) -> int:
+    """estimate_text_tokens for a text of which the length and UTF-8 size are already known"""
+    if not chars:
+        return 0
+    # Every non-ASCII character adds at least one extra UTF-8 byte, which counts them in C instead of Python
+    wide = min(utf8_bytes - chars, chars)
+    return int((chars - wide) / LATIN_CHARS_PER_TOKEN + wide / WIDE_CHARS_PER_TOKEN) + 1
+
+
+def estimate_messages_tokens(messages: Iterable[Any]) -> int:
+    """Estimate the prompt tokens of a chat completions `messages` list"""
+    total = 0
+    for message in messages:
+        content = message.get('content') if isinstance(message, dict) else getattr(message, 'content', '')
+        total += estimate_text_tokens(content if isinstance(content, str) else str(content or ''))
+        total += MESSAGE_OVERHEAD_TOKENS
+    return total
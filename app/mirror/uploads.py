@@ -0,0 +1,276 @@
+import bisect
+import gzip
+import hashlib
+import logging
+import zlib
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from app import constants
+from app.exceptions import UploadError
+from app.exports import parse_export
+from .models import UploadPart, UploadSession
+
+try:
+    import zstandard
+except ImportError:  # optional, gzip is always available
+    zstandard = None
+
+log = logging.getLogger(__name__)
+
+COPY_SIZE = 256 * 1024
+
+LOST_MESSAGE = 'Upload parts were lost, please upload again from offset 0'
+
+
+def supported_encodings():
+    return [e for e in UploadSession.ENCODINGS if e != 'zstd' or zstandard is not None]
+
+
+def create_session(encoding: str, total_bytes: int | None, content: str = 'request') -> UploadSession:
+    if encoding not in supported_encodings():
+        raise UploadError(f"encoding must be one of {', '.join(supported_encodings())}")
+    if content not in dict(UploadSession.CONTENT_CHOICES):
+        raise UploadError(f"content must be one of {', '.join(dict(UploadSession.CONTENT_CHOICES))}")
+    if total_bytes is not None:
+        if not isinstance(total_bytes, int) or total_bytes < 0:
+            raise UploadError('size must be a non-negative integer')
+        if total_bytes > constants.MIRROR_MAX_UPLOAD_BYTES:
+            raise UploadError('Upload is too large', status=413)
+
+    purge_expired()
+    return UploadSession.objects.create(
+        encoding=encoding,
+        content=content,
+        total_bytes=total_bytes,
+        expires_at=timezone.now() + timedelta(seconds=constants.MIRROR_UPLOAD_SESSION_TTL),
+    )
+
+
+def get_open_session(session_id, for_update: bool = False) -> UploadSession:
+    sessions = UploadSession.objects.select_for_update() if for_update else UploadSession.objects
+    session = sessions.filter(id=session_id).first()
+    if session is None or session.expires_at <= timezone.now():
+        raise UploadError('Upload session not found or expired', status=404)
+    if session.status != 'open':
+        raise UploadError(f'Upload session is {session.status}', status=409)
+    return session
+
+
+def append_part(session_id, offset: int, stream, length: int, checksum: str) -> UploadSession:
+    """Write one part at `offset` of the encoded stream and acknowledge it once its SHA-256 matches.
+
+    Parts must arrive in order: a part that doesn't start at the acknowledged offset is rejected
+    with 409, and the client resumes from the offset it reads back from the session.
+    """
+    if length <= 0:
+        raise UploadError('Part is empty')
+    if length > constants.MIRROR_UPLOAD_PART_BYTES:
+        raise UploadError('Part is too large', status=413)
+
+    with transaction.atomic():
+        # Row lock serializes parts of the same session across web processes
+        session = get_open_session(session_id, for_update=True)
+        lost = restart_if_lost(session)
+        if not lost:
+            write_part(session, offset, stream, length, checksum)
+    if lost:
+        raise UploadError(LOST_MESSAGE, status=409)
+    return session
+
+
+def write_part(session: UploadSession, offset: int, stream, length: int, checksum: str):
+    if offset != session.offset:
+        raise UploadError(f'Expected a part at offset {session.offset}', status=409)
+    limit = session.total_bytes if session.total_bytes is not None else constants.MIRROR_MAX_UPLOAD_BYTES
+    if offset + length > limit:
+        raise UploadError(
+            'Upload is larger than declared' if session.total_bytes else 'Upload is too large', status=413
+        )
+
+    digest = hashlib.sha256()
+    pieces = []
+    received = 0
+    while received < length:
+        chunk = stream.read(min(COPY_SIZE, length - received))
+        if not chunk:
+            break
+        digest.update(chunk)
+        pieces.append(chunk)
+        received += len(chunk)
+    if received != length or digest.hexdigest() != checksum.lower():
+        raise UploadError('Part is incomplete' if received != length else 'Part checksum mismatch')
+
+    UploadPart.objects.create(session=session, offset=offset, size=length, data=b''.join(pieces))
+    session.offset += length
+    session.parts += 1
+    session.save(update_fields=['offset', 'parts', 'updated_at'])
+
+
+def restart_if_lost(session: UploadSession) -> bool:
+    """Start the session over if parts it acknowledged are missing, e.g. ones spooled to a dyno's disk before
+    parts were kept in the database. The client reads offset 0 back and uploads everything again."""
+    stored = session.upload_parts.aggregate(total=Sum('size'))['total'] or 0
+    if stored == session.offset:
+        return False
+    log.warning(f"Upload session {session.id} acknowledged {session.offset} bytes but has {stored}, restarting it")
+    session.upload_parts.all().delete()
+    session.offset = session.parts = 0
+    session.summary = None
+    session.save(update_fields=['offset', 'parts', 'summary', 'updated_at'])
+    return True
+
+
+def check_complete(session: UploadSession):
+    if restart_if_lost(session):
+        raise UploadError(LOST_MESSAGE, status=409)
+    if session.total_bytes is not None and session.offset != session.total_bytes:
+        raise UploadError(f'Upload is incomplete, {session.offset} of {session.total_bytes} bytes received', status=409)
+
+
+def export_summary(session_id) -> dict:
+    """Senders and message counts of a raw export, parsed once and kept on the session"""
+    session = get_open_session(session_id)
+    if session.content != 'export':
+        raise UploadError('Upload session does not hold a chat export')
+    check_complete(session)
+    if session.summary is None:
+        with DecodedStream(session) as stream:
+            session.summary = parse_export(stream, constants.MIRROR_MAX_UPLOAD_BYTES).summary()
+        UploadSession.objects.filter(id=session.id).update(summary=session.summary)
+    return session.summary
+
+
+def claim_for_finalize(session_id) -> UploadSession:
+    """Move an open session to 'finalizing' so only one request parses it.
+
+    A session left finalizing for longer than MIRROR_UPLOAD_FINALIZE_TIMEOUT is reopened first, its request
+    died before it could complete, reopen or discard it.
+    """
+    cutoff = timezone.now() - timedelta(seconds=constants.MIRROR_UPLOAD_FINALIZE_TIMEOUT)
+    # Sessions claimed before finalizing_since existed have none
+    stale = Q(finalizing_since__lt=cutoff) | Q(finalizing_since__isnull=True)
+    if UploadSession.objects.filter(stale, id=session_id, status='finalizing').update(
+        status='open', finalizing_since=None
+    ):
+        log.warning(f"Taking over upload session {session_id}, stuck finalizing since before {cutoff}")
+    session = get_open_session(session_id)
+    check_complete(session)
+    now = timezone.now()
+    if not UploadSession.objects.filter(id=session.id, status='open').update(status='finalizing', finalizing_since=now):
+        raise UploadError('Upload session is already being finalized', status=409)
+    session.status = 'finalizing'
+    session.finalizing_since = now
+    return session
+
+
+def reopen(session: UploadSession):
+    """Give the session back to the client, e.g. when the job queue was full"""
+    UploadSession.objects.filter(id=session.id).update(status='open', finalizing_since=None)
+
+
+def complete(session: UploadSession, analysis):
+    UploadSession.objects.filter(id=session.id).update(status='finalized', analysis=analysis)
+    UploadPart.objects.filter(session_id=session.id).delete()
+
+
+def discard(session: UploadSession):
+    UploadSession.objects.filter(id=session.id).delete()
+
+
+class PartsReader:
+    """Seekable binary reader over the parts of a session as one stream, holding one part in memory at a time"""
+
+    def __init__(self, session: UploadSession):
+        self.session_id = session.id
+        parts = list(UploadPart.objects.filter(session_id=session.id).order_by('offset').values_list('offset', 'size'))
+        self.offsets = [offset for offset, _ in parts]
+        self.size = sum(size for _, size in parts)
+        self.pos = 0
+        self._start, self._data = 0, b''
+
+    def _load(self):
+        self._start = self.offsets[bisect.bisect_right(self.offsets, self.pos) - 1]
+        data = UploadPart.objects.values_list('data', flat=True).get(session_id=self.session_id, offset=self._start)
+        self._data = bytes(data)
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            size = self.size - self.pos
+        pieces = []
+        while size > 0 and self.pos < self.size:
+            if not self._start <= self.pos < self._start + len(self._data):
+                self._load()
+            piece = self._data[self.pos - self._start : self.pos - self._start + size]
+            pieces.append(piece)
+            self.pos += len(piece)
+            size -= len(piece)
+        return b''.join(pieces)
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        self.pos = max(0, offset + (0, self.pos, self.size)[whence])
+        return self.pos
+
+    def tell(self) -> int:
+        return self.pos
+
+    def close(self):
+        self._data = b''
+
+
+class DecodedStream:
+    """Binary reader over the decompressed upload parts, mapping codec errors to UploadError"""
+
+    def __init__(self, session: UploadSession):
+        self.encoding = session.encoding
+        self._file = PartsReader(session)
+        if session.encoding == 'gzip':
+            self._reader = gzip.GzipFile(fileobj=self._file, mode='rb')
+        elif session.encoding == 'zstd':
+            self._reader = zstandard.ZstdDecompressor().stream_reader(self._file)
+        else:
+            self._reader = self._file
+
+    def seekable(self) -> bool:
+        # Only the raw parts seek cheaply, which zip exports need
+        return self._reader is self._file
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._reader.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        try:
+            return self._reader.read(size)
+        except (OSError, EOFError, zlib.error) as e:
+            raise UploadError(f'Upload is not valid {self.encoding}: {e}')
+        except Exception as e:
+            if zstandard is not None and isinstance(e, zstandard.ZstdError):
+                raise UploadError(f'Upload is not valid zstd: {e}')
+            raise
+
+    def close(self):
+        if self._reader is not self._file:
+            self._reader.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def purge_expired():
+    """Drop expired sessions, their parts go with them"""
+    purged, _ = UploadSession.objects.filter(expires_at__lte=timezone.now()).delete()
+    if purged:
+        log.info(f"Purged {purged} expired upload sessions and parts")
@@ -6,6 +6,14 @@ app_name = 'mirror'
 urlpatterns = [
     path('api/export-guide/', views.export_guide, name='export_guide'),
     path('api/process/', views.process_data, name='process_data'),
+    path('api/uploads/', views.create_upload, name='create_upload'),
+    path('api/uploads/<uuid:uuid>/', views.upload_part, name='upload_part'),
+    path('api/uploads/<uuid:uuid>/senders/', views.export_summary, name='export_summary'),
+    path('api/uploads/<uuid:uuid>/finalize/', views.finalize_upload, name='finalize_upload'),
     path('api/insights/<uuid:uuid>/', views.insights_view, name='insights_api'),
+    path('api/insights/<uuid:uuid>/events/', views.insights_events_view, name='insights_events'),
+    path('api/insights/<uuid:uuid>/result/', views.insights_result_view, name='insights_result'),
+    path('api/insights/<uuid:uuid>/result/<path:section>/', views.insights_section_view, name='insights_section'),
     path('api/save/', views.save_insights, name='save_insights'),
+    path('api/stats/', views.stats_view, name='stats'),
 ]
@@ -1,19 +1,30 @@
-import asyncio
+import hmac
 import json
 import logging
+import math
 import os
 import threading
+import time
 
-from django.http import JsonResponse, Http404, HttpResponse
+from django.db import connection
+from django.http import JsonResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.conf import settings
 
 from app import constants
-from .encryption import encrypt_for_user
-from .models import MirrorAnalysis
-from .processor import process_patient_data
+from app.exceptions import QueueFullException, UploadError
+from . import job_queue, uploads
+from .ingest import read_export, read_upload, validate_export_request
+from .jobs import DEFAULT_JOB_SECONDS, executor, prepare_messages, run_async_processing
+from .llm import get_cache, governor
+from .models import MirrorAnalysis, UploadSession
+from .notify import notifier
+from .resilience import resilient
+from .results import IMMUTABLE_MAX_AGE, result_response, section_response
 
 log = logging.getLogger(__name__)
 
@@ -87,41 +98,288 @@ def process_data(request):
         return JsonResponse({'status': 'error', 'message': 'Mirror endpoint is disabled'}, status=404)
 
     try:
-        data = json.loads(request.body)
-        person_name = data.get('person_name', 'Anonymous')
-        chat_data = data.get('chat', [])
-        keypair = data.get('keypair')
-        language = data.get('language', 'ru')  # Default to Russian
+        # Reject before reading the upload or touching the DB when there is no room for another job
+        retry_after = resilient.breaker.retry_after()
+        if retry_after:
+            return unavailable_response(retry_after)
+        retry_after = admission_retry_after()
+        if retry_after:
+            return busy_response(retry_after)
 
-        if not keypair:
-            log.error(f'no keypair provided, {keypair}')
-            return JsonResponse({'status': 'error', 'message': 'Keypair is required'}, status=400)
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if content_length > constants.MIRROR_MAX_UPLOAD_BYTES:
+            return JsonResponse({'status': 'error', 'message': 'Upload is too large'}, status=413)
 
-        # Create analysis record
-        analysis = MirrorAnalysis.objects.create(person_name=person_name, keypair=keypair, language=language)
+        # Stream the body instead of request.body, metadata is validated before the chat is decoded
+        upload = read_upload(request, constants.MIRROR_MAX_UPLOAD_BYTES)
 
-        # Start processing thread with chat data, keypair, and language
-        thread = threading.Thread(target=run_async_processing, args=(str(analysis.id), chat_data, language))
-        thread.daemon = True
-        thread.start()
+        try:
+            analysis = accept_upload(upload)
+        except QueueFullException as e:
+            return busy_response(e.retry_after)
 
         # Return success with UUID immediately
-        return JsonResponse(
-            {
-                'status': 'success',
-                'message': 'File accepted and processing started',
-                'uuid': str(analysis.id),
-                'url': f'/mirror/insights/{analysis.id}/',
-            }
-        )
+        return accepted_response(analysis)
+
+    except UploadError as e:
+        return JsonResponse({'status': 'error', 'message': e.msg}, status=e.status)
+    except Exception as e:
+        log.error(f"Error accepting data: {e}")
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+def accept_upload(upload):
+    """Create the analysis for a parsed upload and queue it. Raises QueueFullException if the queue filled up."""
+    analysis = MirrorAnalysis.objects.create(
+        person_name=upload.person_name, keypair=upload.keypair, language=upload.language
+    )
+
+    # Queue processing with chat data and language
+    try:
+        start_analysis(analysis, upload.messages)
+    except QueueFullException:
+        analysis.delete()
+        raise
+    return analysis
+
+
+def accepted_response(analysis):
+    return JsonResponse(
+        {
+            'status': 'success',
+            'message': 'File accepted and processing started',
+            'uuid': str(analysis.id),
+            'url': f'/mirror/insights/{analysis.id}/',
+        }
+    )
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def create_upload(request):
+    """Open a resumable upload session for a compressed process request body"""
+    if not constants.MIRROR_ENABLED:
+        return JsonResponse({'status': 'error', 'message': 'Mirror endpoint is disabled'}, status=404)
 
+    try:
+        data = json.loads(request.body or b'{}')
+        session = uploads.create_session(data.get('encoding', 'gzip'), data.get('size'), data.get('content', 'request'))
+        return upload_session_response(session, status=201)
+    except UploadError as e:
+        return JsonResponse({'status': 'error', 'message': e.msg}, status=e.status)
     except json.JSONDecodeError:
         return JsonResponse({'status': 'error', 'message': 'Invalid JSON data'}, status=400)
     except Exception as e:
-        log.error(f"Error accepting data: {e}")
+        log.error(f"Error creating upload session: {e}")
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "HEAD", "PUT"])
+def upload_part(request, uuid):
+    """GET/HEAD report the acknowledged offset to resume from, PUT appends the part starting at Upload-Offset.
+
+    A part carries its SHA-256 in the X-Checksum-SHA256 header as hex.
+    """
+    try:
+        if request.method == 'PUT':
+            offset = request.headers.get('Upload-Offset')
+            checksum = request.headers.get('X-Checksum-SHA256')
+            if offset is None or not offset.isdigit() or not checksum:
+                raise UploadError('Upload-Offset and X-Checksum-SHA256 headers are required')
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+            session = uploads.append_part(uuid, int(offset), request, length, checksum)
+        else:
+            session = get_object_or_404(UploadSession, id=uuid)
+        return upload_session_response(session)
+    except UploadError as e:
+        response = JsonResponse({'status': 'error', 'message': e.msg}, status=e.status)
+        if e.status == 409:
+            # Tell the client where to resume without another round trip
+            session = UploadSession.objects.filter(id=uuid).first()
+            if session is not None:
+                response['Upload-Offset'] = str(session.offset)
+        return response
+    except Http404:
+        raise
+    except Exception as e:
+        log.error(f"Error receiving upload part: {e}")
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+def export_summary(request, uuid):
+    """Senders of an uploaded raw export with their message counts, for picking whose messages to analyze"""
+    try:
+        return JsonResponse({'status': 'success', **uploads.export_summary(uuid)})
+    except UploadError as e:
+        return JsonResponse({'status': 'error', 'message': e.msg}, status=e.status)
+    except Exception as e:
+        log.error(f"Error summarizing export {uuid}: {e}")
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def finalize_upload(request, uuid):
+    """Decode the uploaded parts and start its analysis, same response as process_data.
+
+    A raw export is finalized with a JSON body holding the keypair, language and the senders to analyze.
+    """
+    session = UploadSession.objects.filter(id=uuid).select_related('analysis').first()
+    if session is not None and session.status == 'finalized' and session.analysis is not None:
+        # A retried finalize whose response got lost
+        return accepted_response(session.analysis)
+
+    try:
+        retry_after = resilient.breaker.retry_after()
+        if retry_after:
+            return unavailable_response(retry_after)
+        retry_after = admission_retry_after()
+        if retry_after:
+            return busy_response(retry_after)
+
+        metadata = None
+        if session is not None and session.content == 'export':
+            try:
+                metadata = json.loads(request.body)
+            except json.JSONDecodeError:
+                raise UploadError('Invalid JSON data')
+            # Reject a bad request before claiming, the uploaded bytes stay usable
+            validate_export_request(metadata)
+
+        session = uploads.claim_for_finalize(uuid)
+    except UploadError as e:
+        return JsonResponse({'status': 'error', 'message': e.msg}, status=e.status)
+
+    try:
+        with uploads.DecodedStream(session) as stream:
+            if metadata is not None:
+                upload = read_export(stream, constants.MIRROR_MAX_UPLOAD_BYTES, metadata)
+            else:
+                upload = read_upload(stream, constants.MIRROR_MAX_UPLOAD_BYTES)
+        analysis = accept_upload(upload)
+    except QueueFullException as e:
+        uploads.reopen(session)
+        return busy_response(e.retry_after)
+    except UploadError as e:
+        # The bytes are all there, so a body that doesn't parse will never parse
+        uploads.discard(session)
+        return JsonResponse({'status': 'error', 'message': e.msg}, status=e.status)
+    except Exception as e:
+        uploads.reopen(session)
+        log.error(f"Error finalizing upload {uuid}: {e}")
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
+
+    uploads.complete(session, analysis)
+    return accepted_response(analysis)
+
+
+def upload_session_response(session, status=200):
+    response = JsonResponse(
+        {
+            'status': 'success',
+            'id': str(session.id),
+            'upload_status': session.status,
+            'encoding': session.encoding,
+            'offset': session.offset,
+            'parts': session.parts,
+            'size': session.total_bytes,
+            'part_size': constants.MIRROR_UPLOAD_PART_BYTES,
+            'expires_at': session.expires_at.isoformat(),
+            'uuid': str(session.analysis_id) if session.analysis_id else None,
+        },
+        status=status,
+    )
+    response['Upload-Offset'] = str(session.offset)
+    return response
+
+
+def admission_retry_after():
+    """Seconds the client should wait before retrying, or None if a new job can be accepted"""
+    if constants.MIRROR_JOB_BACKEND == 'db':
+        if job_queue.queued_count() >= constants.MIRROR_MAX_QUEUED_JOBS:
+            return DEFAULT_JOB_SECONDS
+        return None
+    return executor.retry_after() if executor.is_saturated() else None
+
+
+def start_analysis(analysis, chat_data):
+    """Hand the chat over to whichever job backend is configured"""
+    if constants.MIRROR_JOB_BACKEND == 'db':
+        job_queue.enqueue(analysis, chat_data)
+        return
+
+    chat_data = prepare_messages(chat_data)
+    try:
+        executor.submit(run_async_processing, str(analysis.id), chat_data, analysis.language)
+    except QueueFullException:
+        chat_data.close()
+        raise
+
+
+def busy_response(retry_after):
+    """429 with a Retry-After hint for when the analysis queue is full"""
+    response = JsonResponse(
+        {
+            'status': 'error',
+            'message': 'Server is busy, please retry later',
+            'retry_after': retry_after,
+        },
+        status=429,
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def unavailable_response(retry_after, message='Analysis is temporarily unavailable, please retry later'):
+    """503 with a Retry-After hint, e.g. while the LLM circuit breaker is open and new jobs would only fail"""
+    retry_after = math.ceil(retry_after)
+    response = JsonResponse(
+        {
+            'status': 'error',
+            'message': message,
+            'retry_after': retry_after,
+        },
+        status=503,
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def stats_allowed(request) -> bool:
+    """Staff sessions, or monitoring presenting MIRROR_STATS_TOKEN as a bearer token"""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return bool(
+        constants.MIRROR_STATS_TOKEN
+        and scheme.lower() == 'bearer'
+        and hmac.compare_digest(token.encode(), constants.MIRROR_STATS_TOKEN.encode())
+    )
+
+
+@require_http_methods(["GET"])
+def stats_view(request):
+    """Analysis queue depth, worker slots, LLM rate governor, resilience and response cache state of this process"""
+    if not stats_allowed(request):
+        return JsonResponse({'status': 'error', 'message': 'Forbidden'}, status=403)
+    stats = {
+        'backend': constants.MIRROR_JOB_BACKEND,
+        'executor': executor.stats(),
+        'llm': governor.stats(),
+        'resilience': resilient.stats(),
+        'notify': notifier.stats(),
+        'event_streams': event_streams.stats(),
+    }
+    llm_cache = get_cache()
+    if llm_cache is not None:
+        stats['llm_cache'] = llm_cache.stats()
+    if constants.MIRROR_JOB_BACKEND == 'db':
+        stats['db_queue'] = job_queue.queue_stats()
+    return JsonResponse(stats)
+
+
 def export_guide(request):
     """Display Telegram export guide page"""
     if not constants.MIRROR_ENABLED:
@@ -149,58 +407,188 @@ def save_insights(request):
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
 
+# Columns of the status projection, the result and keypair are only loaded once the analysis is complete
+STATE_FIELDS = [
+    'id',
+    'status',
+    'stage',
+    'progress',
+    'sections_done',
+    'sections_total',
+    'error_message',
+    'version',
+    'result_size',
+    'result_sections',
+]
+
+
 def insights_view(request, uuid):
     try:
         log.info(f"req insights for {uuid}")
-        analysis = get_object_or_404(MirrorAnalysis, id=uuid)
-
-        context = {
-            'uuid': str(uuid),
-            'status': analysis.status,
-            'insights': analysis.insights if analysis.status == 'completed' else None,
-            'keypair': analysis.keypair,
-            'error_message': analysis.error_message if analysis.status == 'error' else None,
-        }
-
-        return JsonResponse(context)
+        analysis = MirrorAnalysis.objects.only(*STATE_FIELDS).filter(id=uuid).first()
+        if analysis is None:
+            return JsonResponse({'status': 'error', 'message': 'Analysis not found'}, status=404)
+
+        # The version changes with every status and progress update, unchanged polls get a 304
+        etag = f'"{analysis.id}-{analysis.version}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            context = analysis.state()
+            if analysis.status == 'completed' and analysis.result_size is not None:
+                # The encrypted bytes are downloaded separately, they never go through the JSON encoder
+                analysis.refresh_from_db(fields=['keypair'])
+                result_url = reverse('mirror:insights_result', kwargs={'uuid': analysis.id})
+                context.update(
+                    insights=None, result_url=result_url, result_size=analysis.result_size, keypair=analysis.keypair
+                )
+                if analysis.result_sections:
+                    # Each section is fetched from result_url + name + '/'
+                    context['result_sections'] = list(analysis.result_sections)
+            elif analysis.status == 'completed':
+                analysis.refresh_from_db(fields=['insights', 'keypair'])
+                context.update(insights=analysis.insights, keypair=analysis.keypair)
+            response = JsonResponse(context)
+
+        response['ETag'] = etag
+        if analysis.status == 'completed':
+            patch_cache_control(response, private=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+        else:
+            patch_cache_control(response, no_cache=True)
+        return response
 
     except Exception as e:
         log.exception('error')
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
 
-def run_async_processing(analysis_id, chat_data, language='ru'):
-    """Run async processing in background thread"""
-    try:
-        log.info(f"Starting async processing for {analysis_id} in language {language}")
-        # Create new event loop for this thread
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
+@require_http_methods(["GET"])
+def insights_result_view(request, uuid):
+    """Encrypted result of a completed analysis as raw bytes, see encrypt_stream_for_user"""
+    analysis = MirrorAnalysis.objects.only('id', 'status', 'result_file', 'result_size').filter(id=uuid).first()
+    if analysis is None or analysis.status != 'completed' or analysis.result_size is None:
+        raise Http404("Result not found")
+    return result_response(analysis)
 
-        try:
-            # Get analysis from database
-            analysis = MirrorAnalysis.objects.get(id=analysis_id)
 
-            # Process the chat data
-            if constants.DEV_DEBUG and False:
-                result = {'result': 'ok', 'text': 'smth'}
-            else:
-                result = loop.run_until_complete(process_patient_data(chat_data, analysis.person_name, language))
+@require_http_methods(["GET"])
+def insights_section_view(request, uuid, section):
+    """One encrypted section of a completed, sectioned result, see results.result_sections"""
+    analysis = MirrorAnalysis.objects.only('id', 'status', 'result_file', 'result_sections').filter(id=uuid).first()
+    if analysis is None or analysis.status != 'completed' or section not in (analysis.result_sections or {}):
+        raise Http404("Section not found")
+    return section_response(analysis, section)
 
-            log.info(f"Got response from openai for {analysis_id}")
 
-            if 'error' in result:
-                analysis.mark_error(result['error'])
-            else:
-                encrypted_insights = encrypt_for_user(json.dumps(result).encode('utf-8'), analysis.keypair['pk'])
-                analysis.mark_completed(encrypted_insights)
-        finally:
-            loop.close()
+def server_event(state) -> str:
+    return f"data: {json.dumps(state, ensure_ascii=False)}\n\n"
 
-    except Exception as e:
-        log.error(f"Error in async processing for {analysis_id}: {e}")
-        try:
-            analysis = MirrorAnalysis.objects.get(id=analysis_id)
-            analysis.mark_error(str(e))
-        except:
-            pass  # Analysis might not exist anymore
+
+def read_state(uuid) -> dict | None:
+    try:
+        return MirrorAnalysis.objects.get(id=uuid).state()
+    except MirrorAnalysis.DoesNotExist:
+        return None
+    finally:
+        # A stream can stay open for minutes, it shouldn't hold a database connection meanwhile
+        connection.close()
+
+
+def insights_events(uuid, subscription, state):
+    """Event stream of one analysis: its state now, then every change until it finishes.
+
+    Ends after MIRROR_EVENTS_MAX_SECONDS, EventSource reconnects by itself.
+    """
+    try:
+        # Milliseconds EventSource waits before reconnecting
+        yield "retry: 3000\n\n"
+        yield server_event(state)
+        # Without LISTEN/NOTIFY only jobs of this process publish here, others are seen by rereading
+        cross_process = notifier.cross_process
+        wait = constants.MIRROR_EVENTS_HEARTBEAT_SECONDS if cross_process else constants.MIRROR_EVENTS_POLL_SECONDS
+        deadline = time.monotonic() + constants.MIRROR_EVENTS_MAX_SECONDS
+        while state['status'] == 'processing' and time.monotonic() < deadline:
+            update = subscription.wait(min(wait, max(0.0, deadline - time.monotonic())))
+            if update is None and not cross_process:
+                update = read_state(uuid)
+            if update is None or update == state:
+                # Keeps proxies from timing out an idle connection
+                yield ": ping\n\n"
+                continue
+            state = update
+            yield server_event(state)
+    finally:
+        subscription.close()
+
+
+class StreamSlots:
+    """Counts the event streams open in this process, each one holds a request thread until it ends"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.open = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.open >= self.limit:
+                self.rejected += 1
+                return False
+            self.open += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.open -= 1
+
+    def stats(self) -> dict:
+        return {'open': self.open, 'limit': self.limit, 'rejected': self.rejected}
+
+
+event_streams = StreamSlots(constants.MIRROR_EVENTS_MAX_STREAMS)
+
+
+class EventStream:
+    """The events of a response, giving its subscription and slot back once the server closes the response.
+
+    Unlike the generator's own finally, close() also runs for a stream the client dropped before it started.
+    """
+
+    def __init__(self, events, subscription):
+        self.events = events
+        self.subscription = subscription
+        self.closed = False
+
+    def __iter__(self):
+        return self.events
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.events.close()
+            self.subscription.close()
+            event_streams.release()
+
+
+@require_http_methods(["GET"])
+def insights_events_view(request, uuid):
+    """Server-sent events with the status and progress of an analysis, instead of polling insights_view.
+
+    Answers 503 when this process already serves MIRROR_EVENTS_MAX_STREAMS streams, the client polls instead.
+    """
+    if not event_streams.acquire():
+        return unavailable_response(constants.MIRROR_EVENTS_POLL_SECONDS, 'Too many event streams, poll instead')
+    # Subscribe before reading so that a change in between isn't missed
+    subscription = notifier.subscribe(str(uuid))
+    state = read_state(uuid)
+    if state is None:
+        subscription.close()
+        event_streams.release()
+        raise Http404("Analysis not found")
+
+    events = EventStream(insights_events(uuid, subscription, state), subscription)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tells nginx-style proxies not to buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
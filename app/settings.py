@@ -1,6 +1,7 @@
 import os
 
 import dj_database_url
+from corsheaders.defaults import default_headers
 from dotenv import load_dotenv
 
 from app import constants
@@ -179,6 +180,8 @@ CORS_ALLOW_CREDENTIALS = True
 
 # Allow all headers and methods for development
 CORS_ALLOW_ALL_HEADERS = True
+# Resumable upload parts carry their offset and checksum in headers
+CORS_ALLOW_HEADERS = (*default_headers, 'upload-offset', 'x-checksum-sha256')
 CORS_ALLOW_METHODS = [
     "DELETE",
     "GET",
@@ -199,6 +202,8 @@ CORS_EXPOSE_HEADERS = [
     'Content-Type',
     'X-CSRFToken',
     'Authorization',
+    'Upload-Offset',
+    'Retry-After',
 ]
 
 # In development, allow all origins for easier debugging
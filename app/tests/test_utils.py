@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.test import SimpleTestCase
+
+from app.utils import cached
+
+
+class CachedTests(SimpleTestCase):
+    def test_memoizes_by_arguments(self):
+        calls = []
+
+        @cached
+        def square(x, *, offset=0):
+            calls.append(x)
+            return x * x + offset
+
+        self.assertEqual([square(2), square(2), square(3), square(2, offset=1)], [4, 4, 9, 5])
+        self.assertEqual(calls, [2, 3, 2])
+        info = square.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 3, 3))
+
+        square.cache_clear()
+        square(2)
+        self.assertEqual(calls, [2, 3, 2, 2])
+
+    def test_memoizes_coroutines(self):
+        calls = []
+
+        @cached
+        async def square(x):
+            calls.append(x)
+            return x * x
+
+        async def run():
+            return [await square(2), await square(2)]
+
+        self.assertEqual(asyncio.run(run()), [4, 4])
+        self.assertEqual(calls, [2])
+
+    def test_threads_share_one_call(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        @cached
+        def slow(x):
+            calls.append(x)
+            started.set()
+            release.wait(5)
+            return x
+
+        with ThreadPoolExecutor(4) as pool:
+            leader = pool.submit(slow, 1)
+            started.wait(5)
+            waiters = [pool.submit(slow, 1) for _ in range(3)]
+            # Let the waiters reach the in-flight call before it finishes
+            while slow.cache_info().coalesced < 3:
+                time.sleep(0.01)
+            release.set()
+            self.assertEqual([leader.result(), *(f.result() for f in waiters)], [1, 1, 1, 1])
+        self.assertEqual(calls, [1])
+        self.assertEqual(slow.cache_info().misses, 1)
+
+    def test_coroutines_share_one_call(self):
+        calls = []
+
+        @cached
+        async def slow(x):
+            calls.append(x)
+            await asyncio.sleep(0.01)
+            return x
+
+        async def run():
+            return await asyncio.gather(*(slow(1) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), [1] * 5)
+        self.assertEqual(calls, [1])
+        self.assertEqual(slow.cache_info().coalesced, 4)
+
+    def test_cancelled_call_is_not_cached(self):
+        calls = []
+
+        @cached
+        async def slow(x):
+            calls.append(x)
+            await asyncio.sleep(0.05)
+            return x
+
+        async def run():
+            leader = asyncio.ensure_future(slow(1))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(slow(1))
+            await asyncio.sleep(0)
+            leader.cancel()
+            # The waiter runs the call itself instead of inheriting the cancellation
+            return await waiter
+
+        self.assertEqual(asyncio.run(run()), 1)
+        self.assertEqual(calls, [1, 1])
+
+    def test_entries_expire_after_ttl(self):
+        calls = []
+
+        @cached(ttl=0.05)
+        def value(x):
+            calls.append(x)
+            return x
+
+        value(1)
+        value(1)
+        time.sleep(0.06)
+        value(1)
+        self.assertEqual(calls, [1, 1])
+
+    def test_failures_are_not_cached_by_default(self):
+        calls = []
+
+        @cached
+        def fail(x):
+            calls.append(x)
+            if x:
+                raise ValueError(x)
+
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                fail(1)
+            self.assertIsNone(fail(0))
+        self.assertEqual(calls, [1, 0, 1, 0])
+        self.assertEqual(fail.cache_info().currsize, 0)
+
+    def test_negative_ttl_caches_failures(self):
+        calls = []
+
+        @cached(ttl=60, negative_ttl=0.05)
+        def fail(x):
+            calls.append(x)
+            if x:
+                raise ValueError(x)
+
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                fail(1)
+            self.assertIsNone(fail(0))
+        self.assertEqual(calls, [1, 0])
+
+        time.sleep(0.06)
+        self.assertIsNone(fail(0))
+        self.assertEqual(calls, [1, 0, 0])
+
+    def test_evicts_least_recently_used(self):
+        calls = []
+
+        @cached(maxsize=2)
+        def value(x):
+            calls.append(x)
+            return x
+
+        value(1)
+        value(2)
+        value(1)
+        value(3)
+        value(1)
+        value(2)
+        self.assertEqual(calls, [1, 2, 3, 2])
+        self.assertEqual(value.cache_info().evictions, 2)
@@ -1,9 +1,13 @@
+import asyncio
+import concurrent.futures
 import functools
 import inspect
 import logging
+import threading
 import traceback
 import typing
 import time
+from collections import OrderedDict
 
 
 T = typing.TypeVar("T")
@@ -65,37 +69,165 @@ def catch(
         return decorator(_func)  # type: ignore
 
 
+class CacheInfo(typing.NamedTuple):
+    hits: int
+    misses: int
+    coalesced: int
+    evictions: int
+    maxsize: int | None
+    currsize: int
+
+
+# Handed to callers that coalesced onto a call that was cancelled, they start their own
+_RETRY = object()
+
+
+class _Cache:
+    """Entries and in-flight calls of one @cached function, shared by every thread and event loop.
+
+    Misses on the same key are coalesced: the first caller runs the function, the others wait on a
+    concurrent.futures.Future, which unlike an asyncio future can be awaited from any loop.
+    """
+
+    def __init__(self, maxsize: int | None, ttl: float | None, negative_ttl: float | None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # key -> (expires_at or None, raised, value)
+        self.entries: OrderedDict[tuple, tuple[float | None, bool, typing.Any]] = OrderedDict()
+        self.inflight: dict[tuple, concurrent.futures.Future] = {}
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.coalesced = self.evictions = 0
+
+    def claim(self, key: tuple) -> tuple[str, typing.Any]:
+        """('hit', entry), ('wait', future) of the call already running, or ('lead', future) to run it"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] is None or entry[0] > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return 'hit', entry
+                del self.entries[key]
+            future = self.inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return 'wait', future
+            self.misses += 1
+            future = self.inflight[key] = concurrent.futures.Future()
+            return 'lead', future
+
+    def finish(self, key: tuple, future: concurrent.futures.Future, raised: bool, value: typing.Any):
+        # None results and exceptions are failures, kept only for negative_ttl
+        failed = raised or value is None
+        ttl = self.negative_ttl if failed else self.ttl
+        with self.lock:
+            del self.inflight[key]
+            if not failed or self.negative_ttl is not None:
+                self.entries[key] = (None if ttl is None else time.monotonic() + ttl, raised, value)
+                self.entries.move_to_end(key)
+                if self.maxsize is not None:
+                    while len(self.entries) > self.maxsize:
+                        self.entries.popitem(last=False)
+                        self.evictions += 1
+        if raised:
+            future.set_exception(value)
+        else:
+            future.set_result(value)
+
+    def abandon(self, key: tuple, future: concurrent.futures.Future):
+        """The leading call was cancelled, release its waiters without caching anything"""
+        with self.lock:
+            del self.inflight[key]
+        future.set_result(_RETRY)
+
+    def info(self) -> CacheInfo:
+        with self.lock:
+            return CacheInfo(self.hits, self.misses, self.coalesced, self.evictions, self.maxsize, len(self.entries))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+def _entry_value(entry: tuple[float | None, bool, typing.Any]):
+    _, raised, value = entry
+    if raised:
+        raise value
+    return value
+
+
 def cached(
-    func: typing.Callable[P, typing.Awaitable[T]] | None = None,
+    func: typing.Callable[P, T] | None = None,
     *,
-    ttl: int | None = None,
-) -> (
-    typing.Callable[P, typing.Awaitable[T]]
-    | typing.Callable[
-        [typing.Callable[P, typing.Awaitable[T]]],
-        typing.Callable[P, typing.Awaitable[T]],
-    ]
-):
-    cache: dict[tuple, tuple[float, T]] = {}
-
-    def decorator(
-        fn: typing.Callable[P, typing.Awaitable[T]],
-    ) -> typing.Callable[P, typing.Awaitable[T]]:
+    ttl: float | None = None,
+    maxsize: int | None = 128,
+    negative_ttl: float | None = None,
+) -> typing.Callable[P, T] | typing.Callable[[typing.Callable[P, T]], typing.Callable[P, T]]:
+    """Memoize a coroutine function or a plain function by its arguments.
+
+    Keeps up to `maxsize` results (None for no limit), least recently used first out, each for `ttl`
+    seconds (None for ever). Concurrent calls with the same arguments, from any thread or event loop,
+    share one underlying call. Exceptions and None results are only cached when `negative_ttl` is set,
+    and then for that long. The wrapper has cache_info() and cache_clear() like functools.lru_cache.
+    """
+
+    def decorator(fn: typing.Callable[P, T]) -> typing.Callable[P, T]:
+        cache = _Cache(maxsize, ttl, negative_ttl)
+
         @functools.wraps(fn)
-        async def wrapper(*args, **kwargs):
+        async def awrapper(*args, **kwargs):
             key = (*args, *sorted(kwargs.items()))
-            now = time.time()
+            while True:
+                state, value = cache.claim(key)
+                if state == 'hit':
+                    return _entry_value(value)
+                if state == 'wait':
+                    # Shielded, a waiter giving up must not cancel the call the others wait for
+                    result = await asyncio.shield(asyncio.wrap_future(value))
+                    if result is _RETRY:
+                        continue
+                    return result
 
-            if key in cache:
-                timestamp, result = cache[key]
-                if ttl is None or now - timestamp < ttl:
+                try:
+                    result = await fn(*args, **kwargs)
+                except Exception as e:
+                    cache.finish(key, value, True, e)
+                    raise
+                except BaseException:
+                    cache.abandon(key, value)
+                    raise
+                cache.finish(key, value, False, result)
+                return result
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (*args, *sorted(kwargs.items()))
+            while True:
+                state, value = cache.claim(key)
+                if state == 'hit':
+                    return _entry_value(value)
+                if state == 'wait':
+                    result = value.result()
+                    if result is _RETRY:
+                        continue
                     return result
 
-            result = await fn(*args, **kwargs)
-            cache[key] = (now, result)
-            return result
+                try:
+                    result = fn(*args, **kwargs)
+                except Exception as e:
+                    cache.finish(key, value, True, e)
+                    raise
+                except BaseException:
+                    cache.abandon(key, value)
+                    raise
+                cache.finish(key, value, False, result)
+                return result
 
-        return wrapper
+        result = awrapper if inspect.iscoroutinefunction(fn) else wrapper
+        result.cache_info = cache.info  # type: ignore
+        result.cache_clear = cache.clear  # type: ignore
+        return result  # type: ignore
 
     if func is None:
         return decorator
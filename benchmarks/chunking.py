@@ -0,0 +1,83 @@
+"""Time create_time_chunks against the previous implementation.
+
+python -m benchmarks.chunking --sizes 100000,1000000,5000000
+"""
+
+import argparse
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from app.mirror.messages import MessageStore
+from app.mirror.processor import create_time_chunks, format_date_russian
+
+from .synthetic import make_chat
+
+
+def parse_date(date_str: str) -> datetime:
+    """parse_date as it was before the dates module: up to four strptime attempts per call"""
+    for fmt in ['%Y-%m-%d', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M:%SZ']:
+        try:
+            return datetime.strptime(date_str, fmt)
+        except ValueError:
+            continue
+    return datetime.now()
+
+
+def legacy_create_time_chunks(chat_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """create_time_chunks as it was before the single-pass rewrite: one full scan and re-parse per chunk"""
+    sorted_messages = sorted(chat_data, key=lambda x: parse_date(x.get('date', '')))
+    dates = [parse_date(msg.get('date', '')) for msg in sorted_messages if msg.get('date')]
+    min_date = min(dates)
+    max_date = max(dates)
+    total_days = (max_date - min_date).days
+    num_chunks = 4 if total_days > 365 else 3
+    chunk_days = total_days // num_chunks
+
+    chunks = []
+    for i in range(num_chunks):
+        chunk_start = min_date + timedelta(days=i * chunk_days)
+        if i == num_chunks - 1:
+            chunk_end = max_date
+        else:
+            chunk_end = min_date + timedelta(days=(i + 1) * chunk_days) - timedelta(days=1)
+        chunk_messages = [
+            msg
+            for msg in sorted_messages
+            if msg.get('date') and chunk_start <= parse_date(msg.get('date', '')) <= chunk_end
+        ]
+        chunks.append(
+            {
+                'messages': chunk_messages,
+                'start_date': format_date_russian(chunk_start.strftime('%Y-%m-%d')),
+                'end_date': format_date_russian(chunk_end.strftime('%Y-%m-%d')),
+            }
+        )
+    return chunks
+
+
+def timed(fn, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100000,1000000,5000000')
+    parser.add_argument('--legacy-max', type=int, default=1_000_000, help='Skip the old implementation above this')
+    args = parser.parse_args()
+
+    print(f"{'messages':>10} {'current, s':>12} {'legacy, s':>12} {'speedup':>8}")
+    for n in map(int, args.sizes.split(',')):
+        chat = make_chat(n)
+        # Dates are parsed while the store is built, so that is part of the current cost
+        current = timed(lambda: create_time_chunks(MessageStore.from_dicts(chat)))
+        legacy = timed(legacy_create_time_chunks, chat) if n <= args.legacy_max else None
+        legacy_s = f'{legacy:.2f}' if legacy else '-'
+        speedup = f'{legacy / current:.1f}x' if legacy else '-'
+        print(f"{n:>10} {current:>12.2f} {legacy_s:>12} {speedup:>8}")
+
+
+if __name__ == '__main__':
+    main()
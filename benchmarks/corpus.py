@@ -0,0 +1,174 @@
+"""Seeded synthetic chat corpus: realistic Telegram and WhatsApp exports from thousands to millions of messages.
+
+Unlike synthetic.make_chat, messages come in date order with the uneven density of a real chat (quiet
+months, bursts, evenings busier than nights), senders follow a Zipf distribution, texts are mostly
+Cyrillic with emoji, links and multi-line messages, and exports carry service and media entries.
+
+python -m benchmarks.corpus --format telegram --messages 1000000 --out /tmp/result.json
+python -m benchmarks.corpus --format whatsapp --messages 100000 --out /tmp/chat.txt
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import random
+import zlib
+from datetime import datetime, timedelta
+from typing import IO, Iterator, List, NamedTuple
+
+SENDERS = ['Анна', 'Сергей', 'Мама', 'Alex', 'Дима', 'Катя Смирнова', 'Олег', 'Lena K.', 'Папа', 'Ира']
+
+WORDS = (
+    'привет как дела сегодня завтра вчера работа дома устал устала ладно хорошо почему потому что '
+    'не знаю думаю кажется может быть давай встретимся вечером позвони мне напиши когда сможешь '
+    'люблю скучаю извини прости спасибо конечно нет да ок ага слушай смотри кстати вообще короче '
+    'опять снова всегда никогда очень сильно немного тревожно спокойно страшно весело грустно '
+    'врач встреча отпуск деньги квартира кот собака погода дождь снег метро такси кофе ужин'
+).split()
+EMOJI = ['😂', '❤️', '🙏', '😭', '👍', '🔥', '😅', '🤔', '😘', '🙈']
+
+
+class Message(NamedTuple):
+    sender: str
+    text: str
+    date: datetime
+
+
+def day_weights(rng: random.Random, days: int) -> List[float]:
+    """Activity per day: a lognormal base, with a few multi-week bursts and quiet stretches"""
+    weights = [rng.lognormvariate(0, 0.8) for _ in range(days)]
+    for _ in range(max(1, days // 120)):
+        start, length = rng.randrange(days), rng.randint(7, 45)
+        factor = rng.choice([0.05, 0.2, 4.0, 8.0])
+        for day in range(start, min(days, start + length)):
+            weights[day] *= factor
+    # Weekends are busier
+    return [w * (1.4 if day % 7 in (5, 6) else 1.0) for day, w in enumerate(weights)]
+
+
+# Share of messages per hour of the day, little at night, peaking in the evening
+HOUR_WEIGHTS = [1, 0.5, 0.3, 0.2, 0.2, 0.3, 1, 2, 3, 4, 4, 4, 5, 5, 4, 4, 5, 6, 7, 8, 8, 7, 5, 3]
+
+
+def make_text(rng: random.Random) -> str:
+    words = max(1, int(rng.lognormvariate(1.6, 0.8)))
+    text = ' '.join(rng.choices(WORDS, k=min(words, 120))).capitalize()
+    roll = rng.random()
+    if roll < 0.15:
+        text += ' ' + rng.choice(EMOJI) * rng.randint(1, 3)
+    elif roll < 0.18:
+        text += f' https://example.com/{rng.randrange(10**6)}'
+    elif roll < 0.22:
+        text += '\n' + ' '.join(rng.choices(WORDS, k=rng.randint(2, 15)))
+    if rng.random() < 0.3:
+        text += rng.choice(['?', '!', '...', ')', '))'])
+    return text
+
+
+def generate(n: int, seed: int = 0, senders: int = 4, days: int = 900, start: datetime = datetime(2021, 3, 1)):
+    """`n` messages in date order. Only one sender list and the day counts are held in memory."""
+    rng = random.Random(seed)
+    names = SENDERS[: max(2, min(senders, len(SENDERS)))]
+    sender_weights = list(itertools.accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(names))))
+    cum_days = list(itertools.accumulate(day_weights(rng, days)))
+    cum_hours = list(itertools.accumulate(HOUR_WEIGHTS))
+
+    # Messages per day, then their times within the day in order
+    counts = [0] * days
+    total = cum_days[-1]
+    for _ in range(n):
+        counts[bisect.bisect_left(cum_days, rng.random() * total)] += 1
+
+    for day, count in enumerate(counts):
+        if not count:
+            continue
+        base = start + timedelta(days=day)
+        seconds = sorted(
+            bisect.bisect_left(cum_hours, rng.random() * cum_hours[-1]) * 3600 + rng.randrange(3600)
+            for _ in range(count)
+        )
+        for second in seconds:
+            sender = names[bisect.bisect_left(sender_weights, rng.random() * sender_weights[-1])]
+            yield Message(sender, make_text(rng), base + timedelta(seconds=second))
+
+
+def as_dicts(messages) -> Iterator[dict]:
+    """Messages as the frontend sends them in a process request"""
+    for m in messages:
+        yield {'sender': m.sender, 'text': m.text, 'date': m.date.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def write_telegram(out: IO[str], messages, seed: int = 0, chat_name: str = 'Анна'):
+    """Telegram Desktop result.json, written as a stream. Includes service entries, media and rich text."""
+    rng = random.Random(seed + 1)
+    out.write(json.dumps({'name': chat_name, 'type': 'personal_chat', 'id': 4242}, ensure_ascii=False)[:-1])
+    out.write(', "messages": [\n')
+    first = True
+    for i, m in enumerate(messages):
+        entry = {
+            'id': i + 1,
+            'type': 'message',
+            'date': m.date.strftime('%Y-%m-%dT%H:%M:%S'),
+            'date_unixtime': str(int(m.date.timestamp())),
+            'from': m.sender,
+            'from_id': f'user{zlib.crc32(m.sender.encode())}',
+            'text': m.text,
+        }
+        roll = rng.random()
+        if roll < 0.01:
+            entry = {'id': i + 1, 'type': 'service', 'date': entry['date'], 'actor': m.sender, 'action': 'phone_call'}
+        elif roll < 0.04:
+            entry.update(photo='photos/photo.jpg', width=1280, height=960, text='')
+        elif roll < 0.07:
+            words = m.text.split(' ', 1)
+            entry['text'] = [{'type': 'bold', 'text': words[0]}, ' ' + words[1] if len(words) > 1 else '']
+        out.write(('' if first else ',\n') + json.dumps(entry, ensure_ascii=False))
+        first = False
+    out.write('\n]}\n')
+
+
+def write_whatsapp(out: IO[str], messages, seed: int = 0, style: str = 'android'):
+    """WhatsApp .txt export in the Android ("31.12.21, 23:59 - Name: text") or iOS bracketed style"""
+    rng = random.Random(seed + 2)
+    if style == 'android':
+        out.write('01.03.21, 00:00 - Сообщения и звонки защищены сквозным шифрованием.\n')
+    for m in messages:
+        stamp = m.date.strftime('%d.%m.%y, %H:%M')
+        text = '<Без медиафайлов>' if rng.random() < 0.03 else m.text
+        if style == 'android':
+            out.write(f'{stamp} - {m.sender}: {text}\n')
+        else:
+            out.write(f'[{m.date.strftime("%d.%m.%y, %H:%M:%S")}] {m.sender}: {text}\n')
+
+
+def process_request(messages, person_name: str = 'Анна', pk: str = 'A' * 43 + '=') -> bytes:
+    """Body of a /mirror/api/process/ request, metadata first and `chat` last like the frontend sends it"""
+    body = {'person_name': person_name, 'language': 'ru', 'keypair': {'pk': pk}, 'chat': list(as_dicts(messages))}
+    return json.dumps(body, ensure_ascii=False).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--format', choices=['telegram', 'whatsapp', 'whatsapp-ios', 'request'], default='telegram')
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--senders', type=int, default=4)
+    parser.add_argument('--days', type=int, default=900)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    messages = generate(args.messages, args.seed, args.senders, args.days)
+    if args.format == 'request':
+        with open(args.out, 'wb') as f:
+            f.write(process_request(messages))
+        return
+    with open(args.out, 'w', encoding='utf-8') as f:
+        if args.format == 'telegram':
+            write_telegram(f, messages, args.seed)
+        else:
+            write_whatsapp(f, messages, args.seed, 'ios' if args.format == 'whatsapp-ios' else 'android')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,316 @@
+"""End-to-end load test: submit chats to /mirror/api/process/ and poll /mirror/api/insights/<uuid>/ until done.
+
+For every gunicorn configuration given, starts the mock OpenAI server and gunicorn against it, runs the
+load and reports p50/p95/p99 job latency, throughput and the peak memory of gunicorn's processes.
+With --url the load goes to an already running server instead (point its OPENAI_BASE_URL at
+benchmarks.mock_openai), --pid then names the process whose tree is measured.
+
+python -m benchmarks.loadtest --gunicorn "-w 2 --threads 4" --gunicorn "-w 4 -k gthread --threads 8" --jobs 40
+python -m benchmarks.loadtest --url http://127.0.0.1:8000 --pid 1234 --jobs 20
+
+Memory is read from /proc, so it is only reported on Linux.
+"""
+
+import argparse
+import base64
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List
+
+import requests
+from nacl.public import PrivateKey
+
+from . import mock_openai
+from .synthetic import make_chat
+
+ROOT = Path(__file__).resolve().parent.parent
+MB = 1024 * 1024
+
+
+@dataclass
+class JobResult:
+    ok: bool
+    seconds: float
+    rejected: int = 0
+    error: str = ''
+
+
+@dataclass
+class Report:
+    config: str
+    jobs: int
+    completed: int
+    failed: int
+    rejected: int
+    wall_seconds: float
+    jobs_per_minute: float
+    p50: float | None
+    p95: float | None
+    p99: float | None
+    peak_rss_mb: float | None
+    peak_worker_rss_mb: float | None
+    errors: List[str] = field(default_factory=list)
+
+
+def percentile(values: List[float], q: float) -> float | None:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_tree(pid: int) -> List[int]:
+    """`pid` and all its descendants"""
+    children: Dict[int, List[int]] = {}
+    for entry in Path('/proc').iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            # The command may contain spaces and parentheses, fields after the last ')' are fixed
+            ppid = int((entry / 'stat').read_text().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry.name))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def rss_bytes(pid: int) -> int:
+    try:
+        for line in Path(f'/proc/{pid}/status').read_text().splitlines():
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class MemorySampler:
+    """Peak resident memory of a process tree, summed and of its largest single process"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.peak_total = 0
+        self.peak_single = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        if Path('/proc').is_dir():
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            sizes = [rss_bytes(pid) for pid in process_tree(self.pid)]
+            self.peak_total = max(self.peak_total, sum(sizes))
+            self.peak_single = max([self.peak_single, *sizes])
+            self._stop.wait(self.interval)
+
+
+def make_payload(messages: int, seed: int) -> bytes:
+    public_key = PrivateKey.generate().public_key.encode()
+    body = {
+        'person_name': 'Анна',
+        'language': 'ru',
+        'keypair': {'pk': base64.b64encode(public_key).decode()},
+        'chat': make_chat(messages, seed=seed),
+    }
+    return json.dumps(body, ensure_ascii=False).encode()
+
+
+def run_job(base_url: str, payload: bytes, poll_interval: float, timeout: float) -> JobResult:
+    started = time.monotonic()
+    session = requests.Session()
+    rejected = 0
+    while True:
+        response = session.post(
+            f'{base_url}/mirror/api/process/', data=payload, headers={'Content-Type': 'application/json'}
+        )
+        if response.status_code in (429, 503) and time.monotonic() - started < timeout:
+            # Admission control said come back later, which counts against the job's latency
+            rejected += 1
+            time.sleep(float(response.headers.get('Retry-After') or 5))
+            continue
+        break
+    try:
+        body = response.json()
+    except ValueError:
+        body = {}
+    if response.status_code != 200 or body.get('status') != 'success':
+        return JobResult(False, time.monotonic() - started, rejected, body.get('message') or str(response.status_code))
+
+    url = f"{base_url}/mirror/api/insights/{body['uuid']}/"
+    while time.monotonic() - started < timeout:
+        time.sleep(poll_interval)
+        state = session.get(url).json()
+        if state.get('status') == 'completed':
+            return JobResult(True, time.monotonic() - started, rejected)
+        if state.get('status') == 'error':
+            return JobResult(False, time.monotonic() - started, rejected, state.get('error_message') or 'error')
+    return JobResult(False, time.monotonic() - started, rejected, 'timed out')
+
+
+def run_load(base_url: str, args, config: str, pid: int | None) -> Report:
+    payloads = [make_payload(args.messages, seed) for seed in range(args.jobs)]
+    sampler = MemorySampler(pid).start() if pid else None
+    started = time.monotonic()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        results = list(pool.map(lambda p: run_job(base_url, p, args.poll_interval, args.timeout), payloads))
+    wall = time.monotonic() - started
+    if sampler:
+        sampler.stop()
+
+    latencies = [r.seconds for r in results if r.ok]
+    errors = sorted({r.error for r in results if not r.ok})
+    return Report(
+        config=config,
+        jobs=len(results),
+        completed=len(latencies),
+        failed=len(results) - len(latencies),
+        rejected=sum(r.rejected for r in results),
+        wall_seconds=round(wall, 1),
+        jobs_per_minute=round(len(latencies) / wall * 60, 1),
+        p50=percentile(latencies, 50),
+        p95=percentile(latencies, 95),
+        p99=percentile(latencies, 99),
+        peak_rss_mb=round(sampler.peak_total / MB, 1) if sampler else None,
+        peak_worker_rss_mb=round(sampler.peak_single / MB, 1) if sampler else None,
+        errors=errors[:5],
+    )
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with {process.returncode}')
+        try:
+            requests.get(f'{url}/mirror/api/stats/', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.5)
+    raise RuntimeError(f'Server at {url} did not come up in {timeout:.0f}s')
+
+
+def run_gunicorn_config(config: str, mock_url: str, args) -> Report:
+    port = free_port()
+    env = {
+        **os.environ,
+        'OPENAI_BASE_URL': mock_url,
+        'OPENAI_API_KEY': 'mock',
+        # Every chat is different anyway, but a warm cache would make reruns meaningless
+        'MIRROR_LLM_CACHE_ENABLED': '0',
+    }
+    command = [
+        sys.executable,
+        '-m',
+        'gunicorn',
+        'app.wsgi:application',
+        '-b',
+        f'127.0.0.1:{port}',
+        *shlex.split(config),
+    ]
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    worker = None
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_until_up(base_url, process)
+        if env.get('MIRROR_JOB_BACKEND') == 'db':
+            worker = subprocess.Popen(
+                [sys.executable, 'manage.py', 'run_mirror_worker', '--concurrency', str(args.db_workers)],
+                cwd=ROOT,
+                env=env,
+            )
+        return run_load(base_url, args, config, process.pid)
+    finally:
+        for proc in (worker, process):
+            if proc is not None:
+                proc.terminate()
+                try:
+                    proc.wait(30)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+
+def print_reports(reports: List[Report]):
+    def fmt(value):
+        return '-' if value is None else f'{value:.1f}'
+
+    print(
+        f"\n{'config':<40} {'ok':>4} {'fail':>4} {'429/503':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+        f"{'jobs/min':>8} {'peak MB':>8} {'worker MB':>9}"
+    )
+    for r in reports:
+        print(
+            f"{r.config[:40]:<40} {r.completed:>4} {r.failed:>4} {r.rejected:>7} {fmt(r.p50):>7} {fmt(r.p95):>7} "
+            f"{fmt(r.p99):>7} {r.jobs_per_minute:>8.1f} {fmt(r.peak_rss_mb):>8} {fmt(r.peak_worker_rss_mb):>9}"
+        )
+        for error in r.errors:
+            print(f"    error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--gunicorn', action='append', help='gunicorn arguments of one configuration, repeatable')
+    parser.add_argument('--url', help='load an already running server instead of starting gunicorn')
+    parser.add_argument('--pid', type=int, help='with --url, process whose tree memory is sampled')
+    parser.add_argument('--jobs', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4, help='clients submitting at once')
+    parser.add_argument('--messages', type=int, default=2000, help='messages per chat')
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    parser.add_argument('--timeout', type=float, default=900, help='seconds before a job counts as failed')
+    parser.add_argument('--db-workers', type=int, default=2, help='run_mirror_worker concurrency with the db backend')
+    parser.add_argument('--latency', default='lognormal:2,0.5', help='mock latency, see benchmarks.mock_openai')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='share of mock requests answered with 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of mock requests answered with 500')
+    parser.add_argument('--json', help='also write the reports to this file')
+    args = parser.parse_args()
+
+    if args.url:
+        reports = [run_load(args.url.rstrip('/'), args, args.url, args.pid)]
+    else:
+        subprocess.run([sys.executable, 'manage.py', 'migrate', '--noinput', '-v0'], cwd=ROOT, check=True)
+        mock_port = free_port()
+        mock = mock_openai.serve(
+            port=mock_port, latency=args.latency, rate_limit=args.rate_limit, error_rate=args.error_rate
+        )
+        try:
+            configs = args.gunicorn or ['-w 2 --threads 4']
+            reports = [run_gunicorn_config(config, f'http://127.0.0.1:{mock_port}/v1', args) for config in configs]
+        finally:
+            mock.shutdown()
+
+    print_reports(reports)
+    if args.json:
+        Path(args.json).write_text(json.dumps([asdict(r) for r in reports], indent=2))
+
+
+if __name__ == '__main__':
+    main()
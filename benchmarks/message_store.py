@@ -0,0 +1,53 @@
+"""Memory held by a chat as parsed JSON dicts against the same chat in a MessageStore.
+
+python -m benchmarks.message_store --sizes 100000,1000000
+"""
+
+import argparse
+import gc
+import io
+import json
+import time
+import tracemalloc
+
+from app.mirror.ingest import read_upload
+
+from .synthetic import make_chat
+
+
+def measure(fn):
+    """Result of `fn`, the memory it still holds afterwards, and the seconds it took"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, held, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100000,1000000')
+    args = parser.parse_args()
+
+    print(f"{'messages':>10} {'dicts, MB':>10} {'store, MB':>10} {'ratio':>6} {'store build, s':>15}")
+    for n in map(int, args.sizes.split(',')):
+        body = json.dumps({'keypair': {'pk': 'A' * 43 + '='}, 'language': 'en', 'chat': make_chat(n)}).encode()
+
+        # What the processor used to get: one dict with three fresh strings per message
+        dicts, dicts_held, _ = measure(lambda: json.loads(body)['chat'])
+        del dicts
+        upload, store_held, store_s = measure(lambda: read_upload(io.BytesIO(body), len(body)))
+        del upload
+
+        mb = 1024 * 1024
+        print(
+            f"{n:>10} {dicts_held / mb:>10.1f} {store_held / mb:>10.1f} "
+            f"{dicts_held / store_held:>5.1f}x {store_s:>15.2f}"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""Local stand-in for the OpenAI chat completions endpoint, for load tests that shouldn't cost anything.
+
+Answers structured-output calls with a document generated from the request's JSON schema, so
+MirrorAnalysisSchema, TimelinePeriodSchema and TimelineAnalysisSchema responses validate, and the
+period naming prompt with one name per period. Latency is drawn from a configurable distribution and
+a share of requests can be answered with 429 or 500. Requests with stream=true get the answer as
+server-sent chunks spread over most of their latency.
+
+python -m benchmarks.mock_openai --port 8765 --latency lognormal:2,0.5 --rate-limit 0.05
+OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python manage.py runserver
+"""
+
+import argparse
+import json
+import logging
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict
+
+log = logging.getLogger(__name__)
+
+WORDS = ['тревога', 'контроль', 'близость', 'юмор', 'избегание', 'забота', 'границы', 'усталость', 'надежда', 'стыд']
+
+
+def latency_sampler(spec: str, seed: int | None = None) -> Callable[[], float]:
+    """Seconds per request from 'fixed:S', 'uniform:LO,HI', 'lognormal:MEDIAN,SIGMA' or 'exponential:MEAN'"""
+    rng = random.Random(seed)
+    kind, _, params = spec.partition(':')
+    values = [float(v) for v in params.split(',') if v]
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda: median * rng.lognormvariate(0, sigma)
+    if kind == 'exponential':
+        return lambda: rng.expovariate(1 / values[0])
+    raise ValueError(f'Unknown latency distribution {spec!r}')
+
+
+def fake_text(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def fake_instance(schema: Dict[str, Any], rng: random.Random, defs: Dict[str, Any] | None = None) -> Any:
+    """A document matching `schema`, following $ref into $defs and taking the first branch of anyOf"""
+    defs = schema.get('$defs', defs or {})
+    if '$ref' in schema:
+        return fake_instance(defs[schema['$ref'].rsplit('/', 1)[-1]], rng, defs)
+    if 'anyOf' in schema:
+        return fake_instance(schema['anyOf'][0], rng, defs)
+    if 'enum' in schema:
+        return rng.choice(schema['enum'])
+
+    kind = schema.get('type')
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != 'null'), 'null')
+    if kind == 'object':
+        return {name: fake_instance(prop, rng, defs) for name, prop in schema.get('properties', {}).items()}
+    if kind == 'array':
+        count = max(schema.get('minItems', 3), min(schema.get('maxItems', 4), 4))
+        return [fake_instance(schema.get('items', {'type': 'string'}), rng, defs) for _ in range(count)]
+    if kind == 'integer':
+        return rng.randint(1, 10)
+    if kind == 'number':
+        return round(rng.uniform(0, 1), 3)
+    if kind == 'boolean':
+        return rng.random() < 0.5
+    if kind == 'null':
+        return None
+    if 'YYYY-MM-DD' in (schema.get('description') or ''):
+        return f'2023-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}'
+    return fake_text(rng, rng.randint(8, 40))
+
+
+def fake_content(request: Dict[str, Any], rng: random.Random) -> str:
+    response_format = request.get('response_format') or {}
+    if response_format.get('type') == 'json_schema':
+        return json.dumps(fake_instance(response_format['json_schema']['schema'], rng), ensure_ascii=False)
+    if response_format.get('type') == 'json_object':
+        return json.dumps({'result': fake_text(rng, 10)}, ensure_ascii=False)
+
+    # The period naming prompt lists "Период N: ..." and wants one name per line
+    prompt = request['messages'][-1].get('content') or ''
+    periods = len(re.findall(r'Период \d+:', prompt))
+    if periods:
+        return '\n'.join(fake_text(rng, 3).rstrip('.') for _ in range(periods))
+    return fake_text(rng, 30)
+
+
+def completion(request: Dict[str, Any], content: str) -> Dict[str, Any]:
+    prompt_chars = sum(len(str(m.get('content') or '')) for m in request.get('messages', []))
+    prompt_tokens, completion_tokens = prompt_chars // 4 + 1, len(content) // 4 + 1
+    return {
+        'id': f'chatcmpl-mock-{uuid.uuid4().hex[:12]}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': request.get('model', 'mock'),
+        'choices': [
+            {'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': content, 'refusal': None}}
+        ],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def completion_chunks(request: Dict[str, Any], content: str, pieces: int) -> list[Dict[str, Any]]:
+    """The streamed form of completion(): a role chunk, `pieces` content chunks, the finish and the usage"""
+    full = completion(request, content)
+    head = {k: full[k] for k in ('id', 'created', 'model')}
+    head['object'] = 'chat.completion.chunk'
+    size = max(1, -(-len(content) // pieces))
+    deltas = [{'role': 'assistant', 'content': ''}] + [
+        {'content': content[i : i + size]} for i in range(0, len(content), size)
+    ]
+    chunks = [{**head, 'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]} for delta in deltas]
+    chunks.append({**head, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]})
+    if (request.get('stream_options') or {}).get('include_usage'):
+        chunks.append({**head, 'choices': [], 'usage': full['usage']})
+    return chunks
+
+
+class MockState:
+    def __init__(self, latency: Callable[[], float], rate_limit: float, error_rate: float, seed: int | None):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {'requests': 0, 'rate_limited': 0, 'errors': 0, 'inflight': 0, 'max_inflight': 0}
+
+    def draw(self) -> tuple[float, float]:
+        with self.lock:
+            return self.rng.random(), self.latency()
+
+    def count(self, counter: str, delta: int = 1):
+        with self.lock:
+            self.counters[counter] += delta
+            self.counters['max_inflight'] = max(self.counters['max_inflight'], self.counters['inflight'])
+
+
+def make_handler(state: MockState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            log.debug(format % args)
+
+        def send_json(self, status: int, body: Dict[str, Any], headers: Dict[str, str] | None = None):
+            data = json.dumps(body, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_stream(self, chunks: list[Dict[str, Any]], duration: float):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            events = [f"data: {json.dumps(c, ensure_ascii=False)}\n\n" for c in chunks] + ['data: [DONE]\n\n']
+            for event in events:
+                time.sleep(duration / len(events))
+                data = event.encode()
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/stats':
+                with state.lock:
+                    counters = dict(state.counters)
+                return self.send_json(200, counters)
+            self.send_json(404, {'error': {'message': 'Not found'}})
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                return self.send_json(404, {'error': {'message': f'No mock for {self.path}'}})
+
+            request = json.loads(body)
+            roll, delay = state.draw()
+            state.count('requests')
+            if roll < state.rate_limit:
+                state.count('rate_limited')
+                return self.send_json(
+                    429,
+                    {
+                        'error': {
+                            'message': 'Rate limit reached (mock)',
+                            'type': 'requests',
+                            'code': 'rate_limit_exceeded',
+                        }
+                    },
+                    {'Retry-After': '1'},
+                )
+            if roll < state.rate_limit + state.error_rate:
+                state.count('errors')
+                return self.send_json(500, {'error': {'message': 'Internal error (mock)', 'type': 'server_error'}})
+
+            stream = bool(request.get('stream'))
+            state.count('inflight')
+            try:
+                # A stream's first token comes after a fifth of the latency, the rest trickles in
+                time.sleep(delay * 0.2 if stream else delay)
+                with state.lock:
+                    content = fake_content(request, state.rng)
+                if stream:
+                    self.send_stream(completion_chunks(request, content, pieces=50), delay * 0.8)
+            finally:
+                state.count('inflight', -1)
+            if not stream:
+                self.send_json(200, completion(request, content))
+
+    return Handler
+
+
+def serve(
+    host: str = '127.0.0.1',
+    port: int = 8765,
+    latency: str = 'lognormal:2,0.5',
+    rate_limit: float = 0.0,
+    error_rate: float = 0.0,
+    seed: int | None = None,
+) -> ThreadingHTTPServer:
+    """Start the mock in a background thread, call shutdown() on the result to stop it"""
+    state = MockState(latency_sampler(latency, seed), rate_limit, error_rate, seed)
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='mock-openai', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='lognormal:2,0.5', help='fixed:S, uniform:LO,HI, lognormal:MEDIAN,SIGMA')
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='share of requests answered with 429')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 500')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = serve(args.host, args.port, args.latency, args.rate_limit, args.error_rate, args.seed)
+    print(f"Mock OpenAI on http://{args.host}:{args.port}/v1, stats at /stats")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
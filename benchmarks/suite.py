@@ -0,0 +1,313 @@
+"""Microbenchmarks of the processor's hot paths on the synthetic corpus, with results written as JSON.
+
+Each case is timed `--repeat` times per corpus size and the median is kept. Comparing two result files
+shows which cases got slower between commits:
+
+python -m benchmarks.suite --sizes 10000,100000,1000000 --out bench-new.json
+python -m benchmarks.suite --compare bench-old.json bench-new.json
+"""
+
+import argparse
+import base64
+import gc
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from nacl.public import PrivateKey
+
+from app.exports import parse_export
+from app.mirror.encryption import encrypt_blob_for_user, encrypt_for_user, encrypt_stream_for_user
+from app.mirror.ingest import read_upload
+from app.mirror.messages import MessageStore
+from app.mirror.processor import analysis_prompts, create_time_chunks, parse_date
+from app.mirror.schemas import MirrorAnalysisSchema, TimelineAnalysisSchema, TimelinePeriodSchema
+
+from . import corpus
+from .mock_openai import fake_instance
+
+ROOT = Path(__file__).resolve().parent.parent
+DATE_FORMATS = ['%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%Y-%m-%dT%H:%M:%SZ']
+# Periods of the stored timeline result, about what a few years of chat produce
+RESULT_PERIODS = 24
+
+
+class Corpus:
+    """Inputs of one size, built once and shared by every case"""
+
+    def __init__(self, size: int, seed: int):
+        messages = list(corpus.generate(size, seed))
+        self.size = size
+        self.request = corpus.process_request(messages)
+        self.dicts = list(corpus.as_dicts(messages))
+        self.store = MessageStore.from_dicts(self.dicts)
+
+        telegram = io.StringIO()
+        corpus.write_telegram(telegram, messages, seed)
+        self.telegram = telegram.getvalue().encode()
+        whatsapp = io.StringIO()
+        corpus.write_whatsapp(whatsapp, messages, seed)
+        self.whatsapp = whatsapp.getvalue().encode()
+
+        # parse_date sees whatever the clients send, so mix the formats it accepts
+        rng = random.Random(seed)
+        sample = messages[: min(size, 100_000)]
+        self.date_strings = [m.date.strftime(rng.choice(DATE_FORMATS)) for m in sample]
+
+
+def results_for(seed: int) -> Dict[str, Any]:
+    """A single-call and a timeline analysis shaped like the model's answers, and the stored result of a timeline
+    job: the timeline with its metadata and period analyses, serialized the way jobs.py encrypts it"""
+    rng = random.Random(seed)
+    analysis = fake_instance(MirrorAnalysisSchema.json_schema()['schema'], rng)
+    timeline = fake_instance(TimelineAnalysisSchema.json_schema()['schema'], rng)
+    period_schema = TimelinePeriodSchema.json_schema()['schema']
+    stored = {
+        **timeline,
+        'processing_type': 'timeline',
+        'total_messages': 250_000,
+        'number_of_periods': RESULT_PERIODS,
+        'period_analyses': [fake_instance(period_schema, rng) for _ in range(RESULT_PERIODS)],
+    }
+    return {'analysis': analysis, 'timeline': timeline, 'stored': json.dumps(stored).encode('utf-8')}
+
+
+def bundle_sizes(results: Dict[str, Any]) -> Dict[str, int]:
+    """Bytes of the stored result before encryption and as a blob of each version"""
+    pk = base64.b64encode(PrivateKey.generate().public_key.encode()).decode()
+    return {
+        'plaintext': len(results['stored']),
+        'ver1': len(encrypt_blob_for_user(results['stored'], pk, codec='none')),
+        'ver2_gzip': len(encrypt_blob_for_user(results['stored'], pk, codec='gzip')),
+        'ver3_gzip': len(b''.join(encrypt_stream_for_user([results['stored']], pk, codec='gzip'))),
+    }
+
+
+# name -> (setup returning the function to time and how many items one call processes)
+Case = Callable[[Corpus, Dict[str, Any]], tuple[Callable[[], Any], int]]
+
+
+def case_process_request_decode(c: Corpus, results):
+    # What process_data does with the request body
+    return lambda: read_upload(io.BytesIO(c.request), len(c.request)), c.size
+
+
+def case_parse_telegram_export(c: Corpus, results):
+    return lambda: parse_export(io.BytesIO(c.telegram), len(c.telegram)), c.size
+
+
+def case_parse_whatsapp_export(c: Corpus, results):
+    return lambda: parse_export(io.BytesIO(c.whatsapp), len(c.whatsapp)), c.size
+
+
+def case_parse_date(c: Corpus, results):
+    return lambda: [parse_date(s) for s in c.date_strings], len(c.date_strings)
+
+
+def case_message_store_build(c: Corpus, results):
+    return lambda: MessageStore.from_dicts(c.dicts), c.size
+
+
+def case_create_time_chunks(c: Corpus, results):
+    return lambda: create_time_chunks(c.store), c.size
+
+
+def case_prompt_assembly(c: Corpus, results):
+    # call_gpt_api's work before the request goes out
+    return lambda: analysis_prompts(c.store.transcript(), 'Анна', 'ru'), c.size
+
+
+def case_encrypt_for_user(c: Corpus, results):
+    pk = base64.b64encode(PrivateKey.generate().public_key.encode()).decode()
+    data = json.dumps(results['timeline'], ensure_ascii=False).encode()
+    return lambda: encrypt_for_user(data, pk, codec='none'), 1
+
+
+def case_encrypt_result_ver1(c: Corpus, results):
+    pk = base64.b64encode(PrivateKey.generate().public_key.encode()).decode()
+    return lambda: encrypt_blob_for_user(results['stored'], pk, codec='none'), 1
+
+
+def case_encrypt_result_gzip(c: Corpus, results):
+    # Compression is the bulk of it, its cost against the bytes it saves in storage and transfer
+    pk = base64.b64encode(PrivateKey.generate().public_key.encode()).decode()
+    return lambda: encrypt_blob_for_user(results['stored'], pk, codec='gzip'), 1
+
+
+def case_encrypt_result_stream(c: Corpus, results):
+    # The ver 3 frames, fed in the pieces jobs.py serializes the result in
+    pk = base64.b64encode(PrivateKey.generate().public_key.encode()).decode()
+    stored = results['stored']
+    pieces = [stored[i : i + 64 * 1024] for i in range(0, len(stored), 64 * 1024)]
+    return lambda: b''.join(encrypt_stream_for_user(pieces, pk, codec='gzip')), 1
+
+
+def case_validate_analysis(c: Corpus, results):
+    content = json.dumps(results['analysis'], ensure_ascii=False)
+    return lambda: MirrorAnalysisSchema.model_validate(json.loads(content)), 1
+
+
+def case_validate_timeline(c: Corpus, results):
+    content = json.dumps(results['timeline'], ensure_ascii=False)
+    return lambda: TimelineAnalysisSchema.model_validate(json.loads(content)), 1
+
+
+CASES: Dict[str, Case] = {
+    'process_request_decode': case_process_request_decode,
+    'parse_telegram_export': case_parse_telegram_export,
+    'parse_whatsapp_export': case_parse_whatsapp_export,
+    'parse_date': case_parse_date,
+    'message_store_build': case_message_store_build,
+    'create_time_chunks': case_create_time_chunks,
+    'prompt_assembly': case_prompt_assembly,
+    'encrypt_for_user': case_encrypt_for_user,
+    'encrypt_result_ver1': case_encrypt_result_ver1,
+    'encrypt_result_gzip': case_encrypt_result_gzip,
+    'encrypt_result_stream': case_encrypt_result_stream,
+    'validate_analysis': case_validate_analysis,
+    'validate_timeline': case_validate_timeline,
+}
+# Cases whose input doesn't depend on the corpus are only run at the first size
+SIZE_INDEPENDENT = {
+    'encrypt_for_user',
+    'encrypt_result_ver1',
+    'encrypt_result_gzip',
+    'encrypt_result_stream',
+    'validate_analysis',
+    'validate_timeline',
+}
+
+
+def time_case(fn: Callable[[], Any], repeat: int) -> List[float]:
+    # Small inputs are run in a loop until one timing takes at least 50ms
+    loops = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= 0.05 or loops >= 1_000_000:
+            break
+        loops *= 10
+
+    timings = [elapsed / loops]
+    for _ in range(repeat - 1):
+        gc.collect()
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        timings.append((time.perf_counter() - started) / loops)
+    return timings
+
+
+def git_revision() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain'], cwd=ROOT, capture_output=True, text=True).stdout)
+    except OSError:
+        return {'commit': None, 'dirty': None}
+    return {'commit': commit or None, 'dirty': dirty}
+
+
+def run(sizes: List[int], repeat: int, seed: int, only: List[str] | None) -> Dict[str, Any]:
+    results = results_for(seed)
+    bundles = bundle_sizes(results)
+    print(
+        "stored result " + ", ".join(f"{name} {size} bytes" for name, size in bundles.items()),
+        file=sys.stderr,
+    )
+    names = [name for name in CASES if not only or name in only]
+    rows = []
+    for index, size in enumerate(sizes):
+        started = time.perf_counter()
+        data = Corpus(size, seed)
+        print(f"corpus of {size} messages built in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        for name in names:
+            if name in SIZE_INDEPENDENT and index:
+                continue
+            fn, items = CASES[name](data, results)
+            timings = time_case(fn, repeat)
+            median = statistics.median(timings)
+            row = {
+                'name': name,
+                'size': None if name in SIZE_INDEPENDENT else size,
+                'items': items,
+                'median_s': median,
+                'min_s': min(timings),
+                'ns_per_item': median / items * 1e9,
+            }
+            rows.append(row)
+            print(f"{name:<26} {str(row['size'] or '-'):>9} {median * 1000:>12.3f} ms", file=sys.stderr)
+        del data
+        gc.collect()
+
+    return {
+        'meta': {
+            **git_revision(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'sizes': sizes,
+            'repeat': repeat,
+            'seed': seed,
+            'bundle_bytes': bundles,
+        },
+        'results': rows,
+    }
+
+
+def compare(old_path: str, new_path: str, threshold: float) -> int:
+    """Print new/old median ratios, returns how many cases got slower than `threshold`"""
+    old, new = (json.loads(Path(p).read_text()) for p in (old_path, new_path))
+    baseline = {(r['name'], r['size']): r for r in old['results']}
+    print(f"{old['meta'].get('commit') or old_path} -> {new['meta'].get('commit') or new_path}")
+    print(f"{'case':<26} {'size':>9} {'old ms':>12} {'new ms':>12} {'ratio':>7}")
+    regressions = 0
+    for row in new['results']:
+        before = baseline.get((row['name'], row['size']))
+        if before is None:
+            continue
+        ratio = row['median_s'] / before['median_s']
+        flag = ''
+        if ratio > threshold:
+            regressions += 1
+            flag = '  slower'
+        elif ratio < 1 / threshold:
+            flag = '  faster'
+        print(
+            f"{row['name']:<26} {str(row['size'] or '-'):>9} {before['median_s'] * 1000:>12.3f} "
+            f"{row['median_s'] * 1000:>12.3f} {ratio:>6.2f}x{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='corpus sizes, up to 5000000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--only', help='comma separated case names, of ' + ', '.join(CASES))
+    parser.add_argument('--out', default='benchmark-results.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    parser.add_argument('--threshold', type=float, default=1.15, help='ratio above which --compare flags a case')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    only = args.only.split(',') if args.only else None
+    report = run([int(s) for s in args.sizes.split(',')], args.repeat, args.seed, only)
+    Path(args.out).write_text(json.dumps(report, indent=2))
+    print(f"wrote {len(report['results'])} results to {args.out}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
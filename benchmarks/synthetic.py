@@ -0,0 +1,21 @@
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+SENDERS = ['Анна', 'Сергей', 'Alex', 'Мама']
+WORDS = ['привет', 'как', 'дела', 'сегодня', 'работа', 'ok', 'ладно', 'завтра', 'see', 'you', 'хорошо', 'почему']
+
+
+def make_chat(n: int, days: int = 900, seed: int = 0) -> List[Dict[str, Any]]:
+    """`n` messages spread over `days` days, in shuffled order like a merged export"""
+    rng = random.Random(seed)
+    start = datetime(2022, 1, 1)
+    span = days * 86400
+    return [
+        {
+            'sender': rng.choice(SENDERS),
+            'text': ' '.join(rng.choices(WORDS, k=rng.randint(1, 12))),
+            'date': (start + timedelta(seconds=rng.randrange(span))).strftime('%Y-%m-%dT%H:%M:%S'),
+        }
+        for _ in range(n)
+    ]
@@ -1,12 +1,14 @@
 import React, { Component } from 'react'
 import WikiAnalysis from './components/WikiAnalysis.jsx'
 import { getApiUrl } from './config.js'
-import { unwrapPrivateKey, decryptDataFromServer } from './utils/crypto.js'
+import { unwrapPrivateKey, decryptDataFromServer, decryptBlobFromServer } from './utils/crypto.js'
 import { loadKeypairFromStorage, hasKeypairInStorage, saveKeypairToStorage } from './utils/storage.js'
 import { createI18n } from './i18n.js'
 import './styles/wiki.css'
 import './styles/insight.css'
 
+const parseJson = (bytes) => JSON.parse(new TextDecoder().decode(bytes))
+
 class Insight extends Component {
   constructor(props) {
     super(props)
@@ -19,6 +21,7 @@ class Insight extends Component {
       password: '',
       passwordError: '',
       decryptedInsights: null,
+      resultManifest: null,
       decrypting: false,
       hasStoredKeypair: false,
       retryCount: 0,
@@ -26,6 +29,8 @@ class Insight extends Component {
     }
     this.passwordRef = React.createRef()
     this.retryInterval = null
+    this.eventSource = null
+    this.resultSource = null
   }
 
   componentDidMount() {
@@ -34,6 +39,55 @@ class Insight extends Component {
 
   componentWillUnmount() {
     this.clearRetryInterval()
+    this.closeEvents()
+  }
+
+  closeEvents = () => {
+    if (this.eventSource) {
+      this.eventSource.close()
+      this.eventSource = null
+    }
+  }
+
+  // Status and progress are pushed by the server while the analysis runs, polling is the fallback
+  subscribeToEvents = (uuid) => {
+    if (this.eventSource) {
+      return
+    }
+    if (typeof window.EventSource === 'undefined') {
+      if (!this.state.isAutoRetrying) {
+        this.startAutoRetry()
+      }
+      return
+    }
+
+    this.eventSource = new EventSource(getApiUrl(`/mirror/api/insights/${uuid}/events/`))
+    this.eventSource.onopen = () => {
+      // A poll got a stream again, the stream takes over
+      if (this.state.isAutoRetrying) {
+        this.stopAutoRetry()
+      }
+    }
+    this.eventSource.onmessage = (event) => {
+      const update = JSON.parse(event.data)
+      if (update.status === 'processing') {
+        this.setState(prevState => ({ data: { ...prevState.data, ...update } }))
+        return
+      }
+      // Finished: fetch once more for the insights themselves
+      this.closeEvents()
+      this.fetchInsights()
+    }
+    // EventSource reconnects by itself after errors and when the server ends a stream,
+    // but gives up on an error response, e.g. 503 when the server has too many streams open
+    this.eventSource.onerror = () => {
+      if (this.eventSource && this.eventSource.readyState === EventSource.CLOSED) {
+        this.closeEvents()
+        if (!this.state.isAutoRetrying) {
+          this.startAutoRetry()
+        }
+      }
+    }
   }
 
   clearRetryInterval = () => {
@@ -89,18 +143,15 @@ class Insight extends Component {
       console.log('Fetched data:', result)
       console.log('Status:', result.status)
       
-      // Handle auto-retry based on status
+      // Handle live updates based on status
       if (result.status === 'processing') {
-        // Start auto-retry if not already running
-        if (!this.state.isAutoRetrying) {
-          this.startAutoRetry()
-        }
+        this.subscribeToEvents(uuid)
       } else {
         // Stop auto-retry for completed or error status
         this.stopAutoRetry()
         
         // If analysis is completed and we have stored keypair, auto-decrypt
-        if (hasStoredKeypair && result && result.status === 'completed' && result.insights) {
+        if (hasStoredKeypair && result && result.status === 'completed' && (result.insights || result.result_url)) {
           await this.autoDecryptWithStoredKeypair(uuid, result)
         }
       }
@@ -117,6 +168,64 @@ class Insight extends Component {
     }
   }
 
+  renderProgress = (progress) => {
+    const percent = Math.max(0, Math.min(100, progress.percent || 0))
+    return (
+      <div className="insight-progress">
+        <div className="insight-progress-stage">
+          <span>{this.i18n.t(`processing.stage.${progress.stage || 'queued'}`)}</span>
+          <span>{percent}%</span>
+        </div>
+        <div className="insight-progress-track">
+          <div className="insight-progress-bar" style={{ width: `${percent}%` }}></div>
+        </div>
+        {progress.sections_total > 0 && (
+          <div className="insight-progress-sections">
+            {this.i18n.t('processing.sections')
+              .replace('{done}', progress.sections_done)
+              .replace('{total}', progress.sections_total)}
+          </div>
+        )}
+      </div>
+    )
+  }
+
+  // Results are downloaded as raw encrypted bytes, older ones still come inline as a base64 bundle.
+  // Sectioned results start with the summary, the rest is fetched as it is needed.
+  decryptResult = async (data, sk) => {
+    if (data.insights) {
+      return parseJson(await decryptDataFromServer(data.insights, sk))
+    }
+    if (data.result_sections) {
+      this.resultSource = { url: data.result_url, sk }
+      const [manifest, core] = await Promise.all([this.fetchSection('manifest'), this.fetchSection('core')])
+      this.setState({ resultManifest: manifest })
+      if (manifest.sections.includes('timeline_periods')) {
+        this.fetchSection('timeline_periods')
+          .then(timeline_periods => this.setState(state => ({
+            decryptedInsights: { ...state.decryptedInsights, timeline_periods }
+          })))
+          .catch(err => console.error('Timeline periods load error:', err))
+      }
+      return core
+    }
+    const response = await fetch(getApiUrl(data.result_url))
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+    // Frames are decrypted while the rest is still downloading
+    return parseJson(await decryptBlobFromServer(response.body, sk))
+  }
+
+  fetchSection = async (name) => {
+    const { url, sk } = this.resultSource
+    const response = await fetch(getApiUrl(`${url}${name}/`))
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`)
+    }
+    return parseJson(await decryptBlobFromServer(response.body, sk))
+  }
+
   autoDecryptWithStoredKeypair = async (uuid, data) => {
     try {
       console.log('Attempting to auto-decrypt with stored keypair')
@@ -147,7 +256,7 @@ class Insight extends Component {
       }
       
       // Используем переданные данные для расшифровки
-      if (!data || !data.insights) {
+      if (!data || !(data.insights || data.result_url)) {
         console.error('No insights data to decrypt')
         this.setState({ 
           passwordPrompt: true,
@@ -158,11 +267,7 @@ class Insight extends Component {
       
       // Расшифровываем данные с помощью сохраненного keypair
       console.log('Attempting to decrypt with stored keypair')
-      const decryptedData = await decryptDataFromServer(data.insights, storedKeypair.sk)
-      
-      // Парсим расшифрованные JSON данные
-      const insightsText = new TextDecoder().decode(decryptedData)
-      const parsedInsights = JSON.parse(insightsText)
+      const parsedInsights = await this.decryptResult(data, storedKeypair.sk)
       
       this.setState({ 
         decryptedInsights: parsedInsights,
@@ -208,11 +313,7 @@ class Insight extends Component {
       const keypair = await unwrapPrivateKey(data.keypair, password)
       
       // Decrypt the insights data
-      const decryptedData = await decryptDataFromServer(data.insights, keypair.sk)
-      
-      // Parse the decrypted JSON data
-      const insightsText = new TextDecoder().decode(decryptedData)
-      const parsedInsights = JSON.parse(insightsText)
+      const parsedInsights = await this.decryptResult(data, keypair.sk)
       
       // Сохраняем keypair в localStorage для будущего использования
       const pathParts = window.location.pathname.split('/').filter(part => part.length > 0)
@@ -258,6 +359,7 @@ class Insight extends Component {
       password, 
       passwordError, 
       decryptedInsights, 
+      resultManifest,
       decrypting,
       hasStoredKeypair,
       retryCount,
@@ -383,6 +485,7 @@ class Insight extends Component {
             <div className="insight-processing-spinner"></div>
             <h2>{this.i18n.t('processing.title')}</h2>
             <p>{this.i18n.t('processing.subtitle')}</p>
+            {data.progress && this.renderProgress(data.progress)}
             {isAutoRetrying && (
               <div style={{ 
                 marginTop: '20px', 
@@ -476,6 +579,8 @@ class Insight extends Component {
           created_at: data.created_at 
         }}
         insights={decryptedInsights}
+        periodDetails={resultManifest?.periods}
+        loadPeriod={resultManifest ? (index) => this.fetchSection(`period_analyses/${index}`) : null}
         uuid={uuid}
         errorMessage={data.error_message || ''}
         decryptAnalysis={async (decryptPassword) => {
@@ -1,16 +1,16 @@
 import React, { useEffect, useRef, useState } from "react";
 import JSZip from "jszip";
 import { WhatsAppParser } from "../utils/WhatsAppParser.js";
-import { getApiUrl } from "../config.js";
 import {createAndWrapKeypair} from "../utils/crypto.js";
 import { saveKeypairToStorage } from "../utils/storage.js";
+import { finalizeExport, supportsResumableUpload, uploadAnalysis, uploadExport } from "../utils/upload.js";
 
 export default function UploadModal({ t, open, onClose, i18n }) {
   const fileRef = useRef(null);
   const [authors, setAuthors] = useState([]);           // [{ name, count }]
   const [stats, setStats] = useState({});               // name -> {count}
   const [selected, setSelected] = useState(new Set());
-  const [data, setData] = useState(null);               // { messages: [...] }
+  const [data, setData] = useState(null);               // { messages: [...] }, or { uploadUrl } when the server parsed the export
   const [progress, setProgress] = useState({show:false,pct:0,msg:""});
   const [ok, setOk] = useState("");
   const [err, setErr] = useState("");
@@ -39,6 +39,7 @@ export default function UploadModal({ t, open, onClose, i18n }) {
 
   async function ingestFile(file){
     setErr(""); setOk("");
+    if(supportsResumableUpload()) return ingestOnServer(file);
     setProgress({show:true,pct:6,msg:t('progress.reading')});
     let txt;
     try{
@@ -87,6 +88,28 @@ export default function UploadModal({ t, open, onClose, i18n }) {
     setProgress({show:false});
   }
 
+  // Send the raw export and let the server parse it, so big exports never have to fit in the phone's memory
+  async function ingestOnServer(file){
+    setProgress({show:true,pct:6,msg:t('progress.uploading')});
+    let upload;
+    try{
+      upload = await uploadExport(file, (sent, total) => {
+        setProgress({show:true,pct:6 + Math.round(34 * sent / total),msg:t('progress.uploading')});
+      });
+    }catch(e){
+      setErr(t('error.readFile', e.message)); setProgress({show:false}); return;
+    }
+
+    setProgress({show:true,pct:40,msg:t('progress.analyzing')});
+    const s = {};
+    for(const {name, count} of upload.summary.senders) s[name] = { count };
+    const list = upload.summary.senders;
+    setStats(s); setAuthors(list);
+    setSelected(new Set(list.map(x=>x.name)));
+    setData({ uploadUrl: upload.url });
+    setProgress({show:false});
+  }
+
   function toggle(name){
     const next = new Set(selected);
     if(next.has(name)) next.delete(name); else next.add(name);
@@ -119,9 +142,6 @@ export default function UploadModal({ t, open, onClose, i18n }) {
     }
 
     const picked = Array.from(selected);
-    const filtered = (data.messages||[])
-      .filter(m => picked.includes(m.from))
-      .map(m => ({ sender:m.from, text:m.text, date:m.date }));
 
     setProgress({show:true,pct:10,msg:t('progress.preparing')});
     setErr(""); setOk("");
@@ -131,18 +151,32 @@ export default function UploadModal({ t, open, onClose, i18n }) {
       const [keypair, sk] = await createAndWrapKeypair(password);
       console.log('Keypair generated:', keypair);
 
-      const res = await fetch(getApiUrl('process'), {
-        method:"POST",
-        headers:{ "Content-Type":"application/json" },
-        body: JSON.stringify({ 
+      let json;
+      if(data.uploadUrl){
+        // The export is on the server already, it only needs to know whose messages to analyze
+        json = await finalizeExport(data.uploadUrl, {
+          person_name: picked.join(', '),
+          keypair: keypair,
+          language: i18n.lang,
+          senders: picked
+        });
+      } else {
+        const filtered = (data.messages||[])
+          .filter(m => picked.includes(m.from))
+          .map(m => ({ sender:m.from, text:m.text, date:m.date }));
+        // chat goes last: the server streams the body and validates the other fields before reading messages
+        const payload = {
           person_name: picked.join(', '), 
           interview:'', 
-          chat: filtered, 
           keypair: keypair, // Send the generated keypair instead of password
-          language: i18n.lang // Add language parameter
-        })
-      });
-      const json = await res.json();
+          language: i18n.lang, // Add language parameter
+          chat: filtered
+        };
+        setProgress({show:true,pct:20,msg:t('progress.uploading')});
+        json = await uploadAnalysis(payload, (sent, total) => {
+          setProgress({show:true,pct:20 + Math.round(70 * sent / total),msg:t('progress.uploading')});
+        });
+      }
         if(json.status === "success"){
             const upd_keypair = {...keypair};
         upd_keypair.sk = sk;
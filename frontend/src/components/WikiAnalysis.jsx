@@ -12,6 +12,8 @@ import { createI18n } from '../i18n.js'
  *  - uuid: string
  *  - insights?: object (see code for fields)
  *  - decryptAnalysis?: (password: string) => Promise<any>
+ *  - periodDetails?: [{ period_name, start_date, end_date }] periods whose full analysis loads on demand
+ *  - loadPeriod?: (index: number) => Promise<object> full analysis of one of periodDetails
  */
 export default function WikiAnalysis({
   status='completed',
@@ -19,13 +21,18 @@ export default function WikiAnalysis({
   analysis={},
   uuid='',
   insights=null,
-  decryptAnalysis
+  decryptAnalysis,
+  periodDetails=null,
+  loadPeriod=null
 }){
   const i18n = createI18n()
   const [decryptOpen, setDecryptOpen] = useState(false)
   const decryptRef = useRef(null)
 
   const personName = analysis?.person_name || i18n.t('wiki.subject.default')
+  // Older results carry every period analysis inline, sectioned ones are fetched when a period is opened
+  const detailPeriods = periodDetails || insights?.period_analyses || []
+  const loadDetail = loadPeriod || (async (index)=>insights.period_analyses[index])
   const createdAt = useMemo(()=>{
     const d = analysis?.created_at ? new Date(analysis.created_at) : null
     return d && !isNaN(d) ? d : null
@@ -256,6 +263,9 @@ export default function WikiAnalysis({
                         <li key={i}><a href={`#period-${i+1}`}>{p.period_name}</a></li>
                       ))}
                     </ul>
+                    {detailPeriods.length > 0 && (
+                      <li><a href="#period-details">Подробно о каждом периоде</a></li>
+                    )}
                     <li><a href="#future-predictions">Что ждет в будущем</a></li>
                   </ul>
                   <li><a href="#practical-implications">{i18n.t('wiki.toc.practical')}</a></li>
@@ -502,6 +512,22 @@ export default function WikiAnalysis({
                       ))}
                     </div>
 
+                    {insights.timeline_periods === undefined && (
+                      <p className="no-data">Загрузка периодов…</p>
+                    )}
+
+                    {detailPeriods.length > 0 && (
+                      <>
+                        <hr className="subsection-divider" />
+
+                        <h2 id="period-details">Подробный анализ каждого периода</h2>
+                        <p>Полный разбор отдельных периодов переписки, открывается по щелчку:</p>
+                        {detailPeriods.map((period, idx)=>(
+                          <PeriodDetail key={idx} period={period} load={()=>loadDetail(idx)} />
+                        ))}
+                      </>
+                    )}
+
                     <hr className="subsection-divider" />
 
                     <h2 id="future-predictions">Прогностические выводы</h2>
@@ -642,3 +668,73 @@ export default function WikiAnalysis({
   )
 }
 
+const PERIOD_DETAIL_TEXTS = [
+  ['Личностные характеристики периода', 'personality_during_period'],
+  ['Эмоциональное состояние', 'emotional_state'],
+  ['Динамика развития', 'growth_or_regression'],
+]
+const PERIOD_DETAIL_LISTS = [
+  ['Ключевые события', 'key_events'],
+  ['Коммуникативные паттерны', 'communication_patterns'],
+  ['Эмоциональные триггеры', 'emotional_triggers'],
+  ['Способы совладания', 'coping_mechanisms'],
+  ['Терапевтические цели', 'therapy_goals'],
+  ['Зоны роста', 'growth_areas'],
+]
+
+/**
+ * A period whose full analysis is only loaded, and decrypted, the first time it is opened.
+ */
+function PeriodDetail({ period, load }){
+  const [detail, setDetail] = useState(null)
+  const [failed, setFailed] = useState(false)
+  const requested = useRef(false)
+
+  function onToggle(e){
+    if (!e.currentTarget.open || requested.current) return
+    requested.current = true
+    setFailed(false)
+    load()
+      .then(setDetail)
+      .catch(err=>{
+        console.error('Period load error:', err)
+        requested.current = false
+        setFailed(true)
+      })
+  }
+
+  return (
+    <details className="timeline-period period-detail" onToggle={onToggle}>
+      <summary className="period-title">
+        <h3>{period.period_name}</h3>
+        <div className="period-dates">{period.start_date} — {period.end_date}</div>
+      </summary>
+      {failed ? (
+        <p className="no-data">Не удалось загрузить период, попробуйте открыть его ещё раз</p>
+      ) : !detail ? (
+        <p className="no-data">Загрузка…</p>
+      ) : (
+        <div className="period-content">
+          {PERIOD_DETAIL_TEXTS.map(([title, key])=>(
+            <div key={key} className="period-section">
+              <h4>{title}</h4>
+              <p>{detail[key]}</p>
+            </div>
+          ))}
+          {PERIOD_DETAIL_LISTS.map(([title, key])=>(
+            <div key={key} className="period-section">
+              <h4>{title}</h4>
+              {(detail[key] && detail[key].length > 0) ? (
+                <ul className="pattern-list">
+                  {detail[key].map((item, i)=>(<li key={i}>{item}</li>))}
+                </ul>
+              ) : (
+                <p className="no-data">Нет данных</p>
+              )}
+            </div>
+          ))}
+        </div>
+      )}
+    </details>
+  )
+}
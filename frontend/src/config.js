@@ -15,6 +15,7 @@ export const config = {
   // API endpoints
   apiEndpoints: {
     process: '/mirror/api/process/',
+    uploads: '/mirror/api/uploads/',
     insights: '/mirror/api/insights/',
     static: '/static',
     media: '/media'
@@ -71,6 +71,7 @@ export const DICT = {
       'progress.reading':'Чтение файла…',
       'progress.analyzing':'Анализ авторов…',
       'progress.preparing':'Подготовка…',
+      'progress.uploading':'Загрузка…',
       'progress.ready':'Готово! Переходим…',
       'error.selectOne':'Выберите хотя бы одного автора.',
       'error.readFile':(e)=>`Не удалось прочитать файл: ${e}`,
@@ -82,6 +83,14 @@ export const DICT = {
       'processing.retryInfo':'Попыток обновления: {count} | Следующее обновление через 10 секунд',
       'processing.refresh':'Обновить страницу',
       'processing.waiting':'Ожидание завершения анализа...',
+      'processing.stage.queued':'В очереди на анализ',
+      'processing.stage.preparing':'Подготовка переписки',
+      'processing.stage.analyzing':'Пишем разделы анализа',
+      'processing.stage.naming_periods':'Делим переписку на периоды',
+      'processing.stage.analyzing_periods':'Анализируем периоды',
+      'processing.stage.merging':'Сводим периоды вместе',
+      'processing.stage.summarizing':'Собираем общую картину',
+      'processing.sections':'Готово {done} из {total}',
       'processing.status':'Статус: {status}',
       'processing.retry':'Попробовать снова',
       'processing.error.title':'Ошибка анализа',
@@ -295,6 +304,7 @@ export const DICT = {
       'progress.reading':'Reading file…',
       'progress.analyzing':'Analyzing authors…',
       'progress.preparing':'Preparing…',
+      'progress.uploading':'Uploading…',
       'progress.ready':'Ready! Redirecting…',
       'error.selectOne':'Select at least one author.',
       'error.readFile':(e)=>`Failed to read file: ${e}`,
@@ -306,6 +316,14 @@ export const DICT = {
       'processing.retryInfo':'Refresh attempts: {count} | Next refresh in 10 seconds',
       'processing.refresh':'Refresh page',
       'processing.waiting':'Waiting for analysis to complete...',
+      'processing.stage.queued':'Waiting in the queue',
+      'processing.stage.preparing':'Preparing the chat',
+      'processing.stage.analyzing':'Writing the analysis sections',
+      'processing.stage.naming_periods':'Splitting the chat into periods',
+      'processing.stage.analyzing_periods':'Analyzing periods',
+      'processing.stage.merging':'Combining the periods',
+      'processing.stage.summarizing':'Putting the whole picture together',
+      'processing.sections':'{done} of {total} done',
       'processing.status':'Status: {status}',
       'processing.retry':'Try again',
       'processing.error.title':'Analysis Error',
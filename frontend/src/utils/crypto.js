@@ -73,12 +73,18 @@ export async function unwrapPrivateKey(wrapped, password) {
  *  - ct  (XChaCha20-Poly1305)
  *  - nonce
  *  - optional aad
- * На вход: {ek, ct, nonce, [aad]} и наш приватный ключ sk (Uint8Array).
+ *  - ver "2": codec, которым plaintext сжат перед шифрованием (ver "1" — без сжатия)
+ * На вход: {ek, ct, nonce, [aad], [codec]} и наш приватный ключ sk (Uint8Array).
  * Возвращает Uint8Array plaintext.
  */
 export async function decryptDataFromServer(bundle, sk) {
     await sodium.ready;
     const fromB64 = (s) => sodium.from_base64(s, sodium.base64_variants.ORIGINAL);
+    return openBundle(bundle, fromB64(bundle.ct), sk);
+}
+
+async function openBundle(bundle, ct, sk) {
+    const fromB64 = (s) => sodium.from_base64(s, sodium.base64_variants.ORIGINAL);
 
     // 1) Получаем свой публичный (из приватного), он нужен для seal_open
     const pk = sodium.crypto_scalarmult_base(sk);
@@ -89,12 +95,148 @@ export async function decryptDataFromServer(bundle, sk) {
 
     // 3) AEAD-расшифровка полезной нагрузки
     const nonce = fromB64(bundle.nonce);
-    const ct = fromB64(bundle.ct);
     const aad = bundle.aad ? fromB64(bundle.aad) : null;
 
     const plaintext = sodium.crypto_aead_xchacha20poly1305_ietf_decrypt(
         /*nsec=*/null, ct, aad, nonce, dek
     );
+    // 4) ver "2": распаковываем тем же кодеком, которым бэк сжал данные до шифрования
+    if (bundle.ver === '2') {
+        return decompress(plaintext, bundle.codec);
+    }
     return plaintext; // Uint8Array; при необходимости преобразуйте в строку
     // return new TextDecoder().decode(plaintext);
-}
\ No newline at end of file
+}
+
+function decompressor(codec) {
+    if (codec !== 'gzip') {
+        throw new Error(`Unsupported codec: ${codec}`);
+    }
+    return new DecompressionStream('gzip');
+}
+
+async function decompress(data, codec) {
+    const stream = new Blob([data]).stream().pipeThrough(decompressor(codec));
+    return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+const BLOB_MAGIC = 'MRB1';
+
+/**
+ * Читает поток байтов кусками, держа в buffered только ещё не разобранное.
+ */
+class ByteReader {
+    constructor(stream, onProgress) {
+        this.reader = stream.getReader();
+        this.onProgress = onProgress;
+        this.buffered = new Uint8Array(0);
+        this.received = 0;
+    }
+
+    // Следующий кусок потока, null в конце
+    async next() {
+        const {done, value} = await this.reader.read();
+        if (done) {
+            return null;
+        }
+        this.received += value.length;
+        this.onProgress?.(this.received);
+        return value;
+    }
+
+    // Дописывает следующий кусок в buffered, false в конце потока
+    async read() {
+        const value = await this.next();
+        if (!value) {
+            return false;
+        }
+        const joined = new Uint8Array(this.buffered.length + value.length);
+        joined.set(this.buffered);
+        joined.set(value, this.buffered.length);
+        this.buffered = joined;
+        return true;
+    }
+
+    async need(n) {
+        while (this.buffered.length < n) {
+            if (!await this.read()) {
+                throw new Error('Truncated result blob');
+            }
+        }
+    }
+
+    take(n) {
+        const head = this.buffered.subarray(0, n);
+        this.buffered = this.buffered.slice(n);
+        return head;
+    }
+}
+
+/**
+ * Расшифровывает бинарный блоб результата (encrypt_blob_for_user / encrypt_stream_for_user на бэке):
+ *  "MRB1" | длина заголовка (4 байта, big-endian) | JSON-заголовок {ek, ver, [codec], [aad], ...} | тело.
+ * ver "1"/"2": тело — один ct, заголовок несёт nonce.
+ * ver "3": тело — кадры secretstream по frame байт plaintext (+ABYTES), последний с TAG_FINAL,
+ *          заголовок несёт header потока; кадры расшифровываются по мере загрузки.
+ * На вход: ArrayBuffer или ReadableStream (например response.body) и приватный ключ sk.
+ * onProgress(bytes) вызывается на каждый полученный кусок. Возвращает Uint8Array plaintext.
+ */
+export async function decryptBlobFromServer(source, sk, onProgress) {
+    await sodium.ready;
+    const input = new ByteReader(source instanceof ReadableStream ? source : new Blob([source]).stream(), onProgress);
+
+    await input.need(8);
+    const prefix = input.take(8);
+    if (new TextDecoder().decode(prefix.subarray(0, 4)) !== BLOB_MAGIC) {
+        throw new Error('Not an encrypted result blob');
+    }
+    const length = new DataView(prefix.buffer, prefix.byteOffset).getUint32(4);
+    await input.need(length);
+    const header = JSON.parse(new TextDecoder().decode(input.take(length)));
+
+    if (header.ver !== '3') {
+        // Один AEAD на весь ct: дочитываем всё и склеиваем один раз
+        const parts = [input.buffered];
+        for (let value = await input.next(); value; value = await input.next()) {
+            parts.push(value);
+        }
+        return openBundle(header, new Uint8Array(await new Blob(parts).arrayBuffer()), sk);
+    }
+
+    const plain = openStream(header, input, sk);
+    const output = header.codec ? plain.pipeThrough(decompressor(header.codec)) : plain;
+    return new Uint8Array(await new Response(output).arrayBuffer());
+}
+
+/**
+ * Кадры ver "3" как ReadableStream plaintext: в памяти только недочитанный кадр ciphertext.
+ * Полный кадр расшифровывается, когда за ним уже есть данные, остаток в конце — финальный кадр.
+ */
+function openStream(header, input, sk) {
+    const fromB64 = (s) => sodium.from_base64(s, sodium.base64_variants.ORIGINAL);
+    const pk = sodium.crypto_scalarmult_base(sk);
+    const dek = sodium.crypto_box_seal_open(fromB64(header.ek), pk, sk);
+    const state = sodium.crypto_secretstream_xchacha20poly1305_init_pull(fromB64(header.header), dek);
+    const aad = header.aad ? fromB64(header.aad) : null;
+    const frame = header.frame + sodium.crypto_secretstream_xchacha20poly1305_ABYTES;
+    const pull = (ct, tag) => {
+        const r = sodium.crypto_secretstream_xchacha20poly1305_pull(state, ct, aad);
+        if (!r || r.tag !== tag) {
+            throw new Error('Corrupted or truncated result blob');
+        }
+        return r.message;
+    };
+
+    return new ReadableStream({
+        async pull(controller) {
+            while (input.buffered.length <= frame) {
+                if (!await input.read()) {
+                    controller.enqueue(pull(input.buffered, sodium.crypto_secretstream_xchacha20poly1305_TAG_FINAL));
+                    controller.close();
+                    return;
+                }
+            }
+            controller.enqueue(pull(input.take(frame), sodium.crypto_secretstream_xchacha20poly1305_TAG_MESSAGE));
+        },
+    });
+}
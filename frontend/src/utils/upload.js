@@ -0,0 +1,137 @@
+/**
+ * Resumable uploads: a body is sent in checksummed parts and finalized into an analysis.
+ * A dropped connection resumes from the last part the server acknowledged instead of
+ * re-sending everything.
+ */
+import { getApiUrl } from "../config.js";
+
+const MAX_ATTEMPTS = 5;
+const MAX_PART_SIZE = 4 * 1024 * 1024;
+
+const sleep = ms => new Promise(resolve => setTimeout(resolve, ms));
+
+export function supportsResumableUpload() {
+  return typeof CompressionStream !== 'undefined' && !!globalThis.crypto?.subtle;
+}
+
+async function sha256Hex(bytes) {
+  const digest = await crypto.subtle.digest('SHA-256', bytes);
+  return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+}
+
+function gzipBlob(blob) {
+  // Large blobs may be backed by disk, so this never needs the whole export in memory at once
+  return new Response(blob.stream().pipeThrough(new CompressionStream('gzip'))).blob();
+}
+
+async function postJson(url, body) {
+  const res = await fetch(url, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(body)
+  });
+  return [res, await res.json()];
+}
+
+/**
+ * Send `blob` through an upload session. Resolves to the session URL.
+ * @param {Blob} blob
+ * @param {{encoding:string, content:string}} options
+ * @param {(sent:number, total:number) => void} onProgress
+ */
+async function uploadBlob(blob, { encoding, content }, onProgress) {
+  const base = getApiUrl('uploads');
+  const [, created] = await postJson(base, { encoding, content, size: blob.size });
+  if (created.status !== 'success') throw new Error(created.message || 'Upload failed');
+
+  const url = `${base}${created.id}/`;
+  const partSize = Math.min(created.part_size, MAX_PART_SIZE);
+  let offset = 0;
+  let failures = 0;
+
+  while (offset < blob.size) {
+    try {
+      const part = new Uint8Array(await blob.slice(offset, offset + partSize).arrayBuffer());
+      const res = await fetch(url, {
+        method: "PUT",
+        headers: {
+          "Content-Type": "application/octet-stream",
+          "Upload-Offset": String(offset),
+          "X-Checksum-SHA256": await sha256Hex(part)
+        },
+        body: part
+      });
+      if (res.status === 409 && res.headers.get('Upload-Offset') !== null) {
+        // The server has a different view of what arrived, continue from there
+        offset = Number(res.headers.get('Upload-Offset'));
+        continue;
+      }
+      const json = await res.json();
+      if (!res.ok) throw new Error(json.message || `Upload failed (${res.status})`);
+      offset = json.offset;
+      failures = 0;
+      onProgress(offset, blob.size);
+    } catch (e) {
+      if (++failures >= MAX_ATTEMPTS) throw e;
+      await sleep(1000 * 2 ** failures);
+      // The part may have landed before the connection dropped
+      const head = await fetch(url, { method: "HEAD" }).catch(() => null);
+      if (head?.ok) offset = Number(head.headers.get('Upload-Offset'));
+    }
+  }
+  return url;
+}
+
+async function finalize(url, body) {
+  for (let attempt = 1; ; attempt++) {
+    const res = await fetch(`${url}finalize/`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify(body || {})
+    });
+    if (res.status === 429 && attempt < MAX_ATTEMPTS) {
+      await sleep(1000 * Number(res.headers.get('Retry-After') || 5));
+      continue;
+    }
+    return res.json();
+  }
+}
+
+/**
+ * Upload a process request body and start its analysis. Resolves to the same JSON as /api/process/.
+ * @param {Object} payload - process request body, `chat` last
+ * @param {(sent:number, total:number) => void} onProgress
+ */
+export async function uploadAnalysis(payload, onProgress = () => {}) {
+  if (!supportsResumableUpload()) {
+    const [, json] = await postJson(getApiUrl('process'), payload);
+    return json;
+  }
+  const body = await gzipBlob(new Blob([JSON.stringify(payload)]));
+  const url = await uploadBlob(body, { encoding: 'gzip', content: 'request' }, onProgress);
+  return finalize(url);
+}
+
+/**
+ * Upload a raw Telegram/WhatsApp export for the server to parse.
+ * Resolves to {url, summary} where summary lists the senders with their message counts.
+ * @param {File} file - result.json, WhatsApp .txt or a .zip of either
+ */
+export async function uploadExport(file, onProgress = () => {}) {
+  // A zip is compressed already, and the server needs it as-is to read its directory
+  const isZip = file.name.toLowerCase().endsWith('.zip');
+  const body = isZip ? file : await gzipBlob(file);
+  const url = await uploadBlob(body, { encoding: isZip ? 'identity' : 'gzip', content: 'export' }, onProgress);
+  const summary = await fetch(`${url}senders/`).then(r => r.json());
+  if (summary.status !== 'success') throw new Error(summary.message || 'Could not read the export');
+  return { url, summary };
+}
+
+/**
+ * Start the analysis of an uploaded export for the chosen senders.
+ * @param {string} url - session URL returned by uploadExport
+ * @param {{person_name:string, keypair:Object, language:string, senders:string[]}} request
+ */
+export function finalizeExport(url, request) {
+  return finalize(url, request);
+}